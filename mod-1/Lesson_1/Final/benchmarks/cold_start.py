@@ -0,0 +1,103 @@
+#! /usr/bin/env python3
+"""
+Benchmark for how long the phonebook takes to start from a fresh process.
+
+Measures the time from starting `main.py` until the interactive menu asks
+for input (with the booting animations turned off), and the time a single
+headless lookup takes from start to exit. Each is run `--runs` times in a
+new interpreter, and the median is compared with `--target`.
+
+Usage: `python benchmarks/cold_start.py --runs 20 --target 100`
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# run from anywhere, the phonebook package lives next to this folder
+ROOT:str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from phonebook.phonebook import PhoneBook
+
+
+MAIN:str = os.path.join(ROOT, "main.py")
+
+# printed by the boot menu right before it waits for input
+PROMPT:bytes = b"Please Select An Interface"
+
+
+def time_to_prompt(directory:str) -> float:
+    """
+    Starts the interactive menu and returns the seconds until it asks for input.
+    """
+    env = dict(os.environ, PHONEBOOK_ANIMATIONS="0", TERM=os.environ.get("TERM", "dumb"))
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, MAIN], cwd=directory, env=env,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    output = b""
+    try:
+        while PROMPT not in output:
+            chunk = os.read(process.stdout.fileno(), 4096)
+            if not chunk:
+                raise RuntimeError(f"main.py exited before asking for input: {output!r}")
+            output += chunk
+        return time.perf_counter() - started
+    finally:
+        process.kill()
+        process.wait()
+        process.stdin.close()
+        process.stdout.close()
+
+
+def time_headless(directory:str) -> float:
+    """
+    Runs a single headless lookup and returns the seconds until it exits.
+    """
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, MAIN, "--data-file", ".contacts.json", "search", "John Smith"],
+        cwd=directory, check=True, stdout=subprocess.DEVNULL
+    )
+    return time.perf_counter() - started
+
+
+def main(argv:list[str]|None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--contacts", type=int, default=1000, help="contacts in the phonebook being opened")
+    parser.add_argument("--target", type=float, default=100.0, help="milliseconds the median should stay under")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        book = PhoneBook("on_exit")
+        book.set_data_file(os.path.join(directory, ".contacts.json"))
+        book.bulk_add(
+            {"name": f"John Smith{number}", "phone": str(5550000000 + number), "email": None}
+            for number in range(args.contacts)
+        )
+        book.close()
+
+        # one untimed run of each, so the bytecode cache is written
+        time_to_prompt(directory)
+        time_headless(directory)
+
+        failed:bool = False
+        for name, measure in (("first prompt", time_to_prompt), ("headless lookup", time_headless)):
+            timings = sorted(measure(directory) * 1000 for _ in range(args.runs))
+            median = statistics.median(timings)
+            slowest = timings[-1]
+            verdict = "ok" if median < args.target else "OVER TARGET"
+            failed = failed or median >= args.target
+            print(f"{name}: median {median:.1f}ms, fastest {timings[0]:.1f}ms, slowest {slowest:.1f}ms ({verdict})")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
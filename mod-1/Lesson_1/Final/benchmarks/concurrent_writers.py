@@ -0,0 +1,92 @@
+#! /usr/bin/env python3
+"""
+Stress test for several processes writing to one phonebook at once.
+
+Every writer adds its own contacts to a shared data file. Afterwards the
+book is checked for lost or duplicated contacts and the throughput is
+printed.
+
+Usage: `python benchmarks/concurrent_writers.py --writers 16 --contacts 250 --engine .journal`
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+# run from anywhere, the phonebook package lives next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phonebook.phonebook import PhoneBook, IDsChangedError
+
+
+def writer(location:str, writer_number:int, contacts:int, write_policy:str, start) -> float:
+    """
+    Adds `contacts` contacts to the phonebook and returns the seconds taken.
+    """
+    book = PhoneBook(write_policy)
+    book.set_data_file(location)
+    # start together so the writers actually contend
+    start.wait()
+
+    started = time.perf_counter()
+    for number in range(contacts):
+        while True:
+            try:
+                book.add_contact(f"Writer{writer_number} Contact{number}", None, f"w{writer_number}.c{number}@example.com", None, None)
+                break
+            # held back contacts got new ids before this one was added, so add it again
+            except IDsChangedError:
+                pass
+    try:
+        book.close()
+    # written all the same, and the ids aren't kept
+    except IDsChangedError:
+        pass
+    return time.perf_counter() - started
+
+
+def main(argv:list[str]|None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--contacts", type=int, default=250, help="contacts added by each writer")
+    parser.add_argument("--engine", default=".journal", help="data file extension, eg .json, .journal or .db")
+    parser.add_argument("--write-policy", default="immediate", choices=["immediate", "batched", "on_exit"])
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        location = os.path.join(directory, "contacts" + args.engine)
+        PhoneBook().set_data_file(location)
+
+        with multiprocessing.Manager() as manager:
+            start = manager.Barrier(args.writers)
+            with multiprocessing.Pool(args.writers) as pool:
+                started = time.perf_counter()
+                durations = pool.starmap(
+                    writer,
+                    [(location, number, args.contacts, args.write_policy, start) for number in range(args.writers)]
+                )
+                elapsed = time.perf_counter() - started
+
+        book = PhoneBook()
+        book.set_data_file(location)
+        contact_ids = book.get_all_contact_ids() or []
+        names = {
+            (data["first_name"], data["last_name"])
+            for _, data in book.iter_contacts()
+        }
+        book.close()
+
+    expected = args.writers * args.contacts
+    lost = expected - len(names)
+    duplicated = len(contact_ids) - len(names)
+
+    print(f"engine {args.engine}, policy {args.write_policy}, {args.writers} writers x {args.contacts} contacts")
+    print(f"contacts:   {len(contact_ids)} of {expected} ({lost} lost, {duplicated} duplicated)")
+    print(f"throughput: {expected / elapsed:.0f} adds/sec overall, slowest writer {max(durations):.2f}s")
+    return 0 if lost == 0 and duplicated == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#! /usr/bin/env python3
+"""
+Benchmark for finding duplicate contacts in a large synthetic phonebook.
+
+A book of `--contacts` people is generated, a share of them are added
+again with their details written differently (phone formatting, email
+case, typos in the name) and the duplicates are searched for. Prints the
+time taken and how many of the planted duplicates were found.
+
+Usage: `python benchmarks/dedup.py --contacts 1000000`
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+# run from anywhere, the phonebook package lives next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phonebook.phonebook import PhoneBook
+
+
+FIRST_NAMES:list[str] = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William", "Elizabeth",
+    "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+]
+LAST_NAMES:list[str] = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+]
+
+
+def typo(name:str, rng:random.Random) -> str:
+    """
+    Swaps two neighbouring letters of a name.
+    """
+    if len(name) < 3:
+        return name
+    position = rng.randrange(1, len(name) - 1)
+    return name[:position] + name[position + 1] + name[position] + name[position + 2:]
+
+
+def generate(contacts:int, duplicate_share:float, seed:int):
+    """
+    Yields `(record, person)` pairs. Records of the same person are duplicates.
+    """
+    rng = random.Random(seed)
+    people:list[tuple[str, str, int, str]] = []
+
+    for person in range(contacts):
+        if people and rng.random() < duplicate_share:
+            # the same person again, written down differently
+            number = rng.randrange(len(people))
+            first_name, last_name, phone, email = people[number]
+            variation = rng.randrange(3)
+            if variation == 0:
+                record = {"name": f"{first_name} {last_name}", "phone": f"({str(phone)[:3]}) {str(phone)[3:6]} {str(phone)[6:]}", "email": None}
+            elif variation == 1:
+                record = {"name": f"{first_name} {typo(last_name, rng)}", "phone": None, "email": email.upper()}
+            else:
+                record = {"name": f"{first_name} {last_name}", "phone": None, "email": email}
+            yield {**record, "address": None, "identifiers": ["duplicate"]}, number
+            continue
+
+        first_name = rng.choice(FIRST_NAMES)
+        # plenty of people share a name, so names alone can't be trusted
+        last_name = rng.choice(LAST_NAMES) + str(rng.randrange(500))
+        phone = 2000000000 + person
+        email = f"{first_name}.{last_name}.{person}@example.com".lower()
+        people.append((first_name, last_name, phone, email))
+        yield {"name": f"{first_name} {last_name}", "phone": phone, "email": email, "address": None, "identifiers": None}, len(people) - 1
+
+
+def main(argv:list[str]|None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--contacts", type=int, default=1_000_000)
+    parser.add_argument("--duplicates", type=float, default=0.05, help="share of contacts that are duplicates")
+    parser.add_argument("--engine", default=".journal", help="data file extension, eg .json, .journal or .db")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        book = PhoneBook("on_exit")
+        book.set_data_file(os.path.join(directory, "contacts" + args.engine))
+
+        people:list[int] = []
+        def records():
+            for record, person in generate(args.contacts, args.duplicates, args.seed):
+                people.append(person)
+                yield record
+
+        started = time.perf_counter()
+        book.bulk_add(records())
+        print(f"generated {args.contacts} contacts in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        groups = book.find_duplicates()
+        elapsed = time.perf_counter() - started
+
+        # compare with the planted duplicates
+        person_of = {f"contact_{number + 1}": person for number, person in enumerate(people)}
+        planted = len(people) - len(set(people))
+        found = sum(len(group) - 1 for group in groups)
+        mixed = sum(len({person_of[contact_id] for contact_id in group}) > 1 for group in groups)
+
+        print(f"found {found} duplicates in {len(groups)} groups in {elapsed:.1f}s ({args.contacts / elapsed:.0f} contacts/sec)")
+        print(f"planted {planted} duplicates, {mixed} groups mixing different people")
+        book.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+#! /usr/bin/env python3
+"""
+Benchmark harness for the everyday `PhoneBook` operations.
+
+Synthetic phonebooks of each `--sizes` are generated for each storage
+engine in `--engines`, from a fixed seed so every run times the same
+books. Each operation is then timed one call at a time: `lookup_contact`,
+`find_contact_lists`, `get_all_contact_ids`, `add_contact` and
+`remove_contact`. Results are written to `--output` as JSON with the
+operations per second and the p50/p99 latency of every operation, and
+`--compare` checks them against the results of an earlier run.
+
+Usage:
+
+    python benchmarks/operations.py --sizes 1000 100000 1000000 --output results.json
+    python benchmarks/operations.py --sizes 1000 100000 --compare results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+# run from anywhere, the phonebook package lives next to this folder
+ROOT:str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from phonebook.phonebook import PhoneBook
+
+
+ENGINES:tuple[str, ...] = (".json", ".journal", ".pbk", ".db")
+OPERATIONS:tuple[str, ...] = ("lookup_contact", "find_contact_lists", "get_all_contact_ids", "add_contact", "remove_contact")
+
+
+def make_names(rng:random.Random, amount:int) -> list[str]:
+    """
+    Makes up pronounceable names, so the books have realistic amounts
+    of people sharing a name.
+    """
+    consonants, vowels = "bcdfghjklmnprstvwz", "aeiou"
+    names:set[str] = set()
+    while len(names) < amount:
+        length = rng.randrange(2, 4)
+        names.add("".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(length)).capitalize())
+    return sorted(names)
+
+
+class Generator:
+    """
+    Makes up contacts from a seed.
+    """
+
+    def __init__(self, seed:int) -> None:
+        self.rng = random.Random(seed)
+        self.first_names = make_names(self.rng, 500)
+        self.last_names = make_names(self.rng, 5000)
+        self.keywords = [name.lower() for name in make_names(self.rng, 1000)]
+
+
+    def name(self) -> str:
+        return f"{self.rng.choice(self.first_names)} {self.rng.choice(self.last_names)}"
+
+
+    def record(self) -> dict:
+        rng = self.rng
+        return {
+            "name": self.name(),
+            "phone": f"{rng.randrange(200, 1000)}-{rng.randrange(1000):03d}-{rng.randrange(10000):04d}",
+            "email": f"user{rng.randrange(10**9)}@example.com" if rng.random() < 0.7 else None,
+            "address": None,
+            "identifiers": rng.sample(self.keywords, rng.randrange(0, 4)) or None,
+        }
+
+
+def git_commit() -> str|None:
+    """
+    Returns the commit being benchmarked, if this is a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(timings:list[int]) -> dict:
+    """
+    Returns the throughput and latency percentiles of some call timings,
+    given in nanoseconds.
+    """
+    timings = sorted(timings)
+    total = sum(timings)
+
+    def percentile(share:float) -> float:
+        return timings[min(len(timings) - 1, int(share * len(timings)))] / 1000
+
+    return {
+        "samples": len(timings),
+        "ops_per_sec": round(len(timings) / (total / 1e9), 1) if total else None,
+        "p50_us": round(percentile(0.50), 1),
+        "p99_us": round(percentile(0.99), 1),
+        "max_us": round(timings[-1] / 1000, 1),
+    }
+
+
+def time_calls(call, arguments, budget:float) -> list[int]:
+    """
+    Times a call once per set of arguments, stopping early once
+    `budget` seconds have been spent. Returns the timings in nanoseconds.
+    """
+    timings:list[int] = []
+    clock = time.perf_counter_ns
+    deadline = clock() + budget * 1e9
+    for args in arguments:
+        started = clock()
+        call(*args)
+        finished = clock()
+        timings.append(finished - started)
+        if finished > deadline:
+            break
+    return timings
+
+
+def benchmark_book(location:str, size:int, args) -> list[dict]:
+    """
+    Generates a book of `size` contacts at `location` and times every operation on it.
+    """
+    generator = Generator(args.seed)
+
+    # generated with one write at the end, which is far quicker than the policy being timed
+    started = time.perf_counter()
+    book = PhoneBook("on_exit")
+    book.set_data_file(location)
+    book.bulk_add(generator.record() for _ in range(size))
+    book.close()
+    print(f"  generated {size} contacts in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    book = PhoneBook(args.write_policy)
+    book.set_data_file(location)
+    rng = random.Random(args.seed)
+    samples = args.samples
+    ids = book.get_all_contact_ids()
+
+    # the first call builds the indexes a search needs, which is timed on its own
+    warmup:dict[str, float] = {}
+    for operation, warmup_args in (
+        ("lookup_contact", (generator.name(),)),
+        ("find_contact_lists", ([rng.choice(generator.keywords)],)),
+    ):
+        started = time.perf_counter_ns()
+        getattr(book, operation)(*warmup_args)
+        warmup[operation] = round((time.perf_counter_ns() - started) / 1000, 1)
+
+    arguments:dict[str, list[tuple]] = {
+        "lookup_contact": [(generator.name(),) for _ in range(samples)],
+        "find_contact_lists": [([rng.choice(generator.keywords)],) for _ in range(samples)],
+        # it returns every id, so a few calls are plenty
+        "get_all_contact_ids": [() for _ in range(max(1, samples // 50))],
+        "add_contact": [tuple(generator.record().values()) for _ in range(samples)],
+        "remove_contact": [(contact_id,) for contact_id in rng.sample(ids, min(samples, len(ids)))],
+    }
+
+    results:list[dict] = []
+    for operation in args.operations:
+        timings = time_calls(getattr(book, operation), arguments[operation], args.budget)
+        result = {"engine": args.engine, "size": size, "operation": operation, **summarize(timings)}
+        if operation in warmup:
+            result["first_call_us"] = warmup[operation]
+        results.append(result)
+        print(
+            f"  {operation:<20} {result['ops_per_sec']:>12,.0f} ops/s   "
+            f"p50 {result['p50_us']:>10,.1f}us   p99 {result['p99_us']:>10,.1f}us   ({result['samples']} calls)",
+            file=sys.stderr
+        )
+    book.close()
+    return results
+
+
+def compare(results:list[dict], location:str, threshold:float) -> int:
+    """
+    Prints how the results changed since an earlier run, and returns
+    the amount of operations that got slower by more than `threshold`.
+    """
+    with open(location, "r") as file:
+        baseline = json.load(file)
+    earlier = {(result["engine"], result["size"], result["operation"]): result for result in baseline["results"]}
+
+    regressions:int = 0
+    print(f"compared with {baseline['meta'].get('commit') or location}:", file=sys.stderr)
+    for result in results:
+        before = earlier.get((result["engine"], result["size"], result["operation"]))
+        if before is None or not before["p50_us"]:
+            continue
+        change = result["p50_us"] / before["p50_us"] - 1
+        slower = change > threshold
+        regressions += slower
+        print(
+            f"  {result['engine']:<9} {result['size']:>9} {result['operation']:<20} "
+            f"p50 {before['p50_us']:>10,.1f}us -> {result['p50_us']:>10,.1f}us ({change:+.0%}){'  SLOWER' if slower else ''}",
+            file=sys.stderr
+        )
+    return regressions
+
+
+def main(argv:list[str]|None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100_000, 1_000_000])
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=ENGINES)
+    parser.add_argument("--operations", nargs="+", default=list(OPERATIONS), choices=OPERATIONS)
+    parser.add_argument("--write-policy", default="batched", choices=("immediate", "batched", "on_exit"))
+    parser.add_argument("--samples", type=int, default=1000, help="calls timed per operation")
+    parser.add_argument("--budget", type=float, default=10.0, help="most seconds spent timing one operation on one book")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", default=None, help="results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25, help="how much slower p50 can get before --compare fails")
+    args = parser.parse_args(argv)
+
+    results:list[dict] = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            for engine in args.engines:
+                print(f"{engine} with {size} contacts", file=sys.stderr)
+                args.engine = engine
+                results += benchmark_book(os.path.join(directory, f"book-{size}{engine}"), size, args)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "write_policy": args.write_policy,
+            "samples": args.samples,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=4)
+    print(f"results written to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,41 +1,54 @@
 #! /usr/bin/env python3
 """
 A Phonebook system. requires `colorama`, `tqdm`, and `windows-curses` if on Windows.
+
+Set `PHONEBOOK_ANIMATIONS=0` to skip the progress bars and pauses.
 """
+import os
+import sys
+from importlib.util import find_spec
+
 
-def auto_install(package):
+def missing_packages(headless:bool) -> list[str]:
     """
-    Installs non-standard packages.
-    
+    Finds the non-standard packages that are not installed, without
+    importing them.
+
     ### Parameters
 
-    `package` the name of the package.
+    `headless` - Whether only a single command is being run, which
+    doesn't need the packages used by the interactive menu.
 
     ### Returns
 
-    `int` - 0.
+    `list[str]` - The pip names of the missing packages.
     """
+    # import name: pip name
+    packages:dict[str, str] = {"colorama": "colorama"}
+    if not headless:
+        packages["tqdm"] = "tqdm"
+        # windows only package
+        if os.name == "nt":
+            packages["_curses"] = "windows-curses"
 
-    if os.name == "nt":
-        os.system(f"python -m pip install {package}")
-        return 0
-    else:
-        os.system(f"python3 -m pip install {package}")
-        return 0
-
-import os
+    return [package for module, package in packages.items() if find_spec(module) is None]
 
-# installing other packages
-non_standard_packages = ["colorama", "tqdm"]
-# windows only import
-if os.name == "nt":
-    auto_install("windows-curses")
 
-# install packages.
-for package in non_standard_packages:
-    auto_install(package)
+# any arguments run a single command instead of the interactive menu,
+# see `python main.py --help`
+headless = len(sys.argv) > 1
 
 
-from phonebook.phonebook import init_program
 if __name__ == "__main__":
-    init_program()
\ No newline at end of file
+    missing = missing_packages(headless)
+    if missing:
+        print(f"Missing packages: {', '.join(missing)}", file=sys.stderr)
+        print(f"Install them with: {'python' if os.name == 'nt' else 'python3'} -m pip install {' '.join(missing)}", file=sys.stderr)
+        sys.exit(1)
+
+    if headless:
+        from phonebook.commands import main
+        sys.exit(main())
+
+    from phonebook.phonebook import init_program
+    init_program(os.environ.get("PHONEBOOK_ANIMATIONS", "1") != "0")
@@ -0,0 +1,168 @@
+#! /usr/bin/env python3
+"""
+Append-only log of the changes written to a phonebook, so copies of it
+can be kept up to date by shipping only what changed.
+
+Every change written to the data file is appended to the log as a line of
+JSON with a sequence number that only goes up: `{"seq": 12, "op": "add",
+"id": "contact_7", "data": {...}}`. The op is `"add"`, `"edit"` or
+`"remove"`. A replica remembers the last sequence number it applied and
+asks for the changes after it.
+"""
+import os
+import json
+from bisect import bisect_right
+
+
+class ChangeLog:
+    """
+    A change log kept in a JSON Lines file. Appends must be made while
+    holding the lock on the data file, reads can be made at any time.
+    """
+
+    # a checkpoint is kept every this many records, so reading the changes
+    # after a sequence number starts close to it instead of at the top
+    CHECKPOINT_EVERY:int = 1000
+
+
+    def __init__(self, location:str) -> None:
+        """
+        ### Parameters
+
+        `location` - The location of the log file. Created on the first change.
+        """
+        self.location = location
+        # (seq, offset) of every `CHECKPOINT_EVERY`th record
+        self.checkpoints:list[tuple[int, int]] = []
+        # how far into the file the checkpoints cover
+        self.scanned_offset:int = 0
+        self.scanned_records:int = 0
+
+
+    def last_seq(self) -> int:
+        """
+        Returns the sequence number of the last change, or 0 if there
+        are none. Only reads the end of the file.
+        """
+        return self._tail()[0]
+
+
+    def append(self, records:list[dict]) -> int:
+        """
+        Numbers change records and appends them to the log.
+
+        ### Parameters
+
+        `records` - The changes, as created by `ContactStore`.
+
+        ### Returns
+
+        `int` - The sequence number of the last change.
+        """
+        seq, end = self._tail()
+        if not records:
+            return seq
+
+        lines:list[str] = []
+        for record in records:
+            seq += 1
+            # the sequence number goes first, see `_record_seq`
+            lines.append(json.dumps({"seq": seq, **record}) + "\n")
+
+        with open(self.location, "a+b") as file:
+            # drop the half written line of an append that crashed
+            if file.seek(0, os.SEEK_END) != end:
+                file.truncate(end)
+            file.write("".join(lines).encode())
+        return seq
+
+
+    def since(self, seq:int, limit:int|None = None) -> list[dict]:
+        """
+        Returns the changes after a sequence number, oldest first.
+
+        ### Parameters
+
+        `seq` - The sequence number of the last change already seen.
+        0 returns every change.
+
+        `limit` - The most changes to return. `None` returns them all.
+        """
+        self._scan()
+
+        # start from the last checkpoint at or before the requested change
+        position = bisect_right(self.checkpoints, seq, key=lambda checkpoint: checkpoint[0]) - 1
+        offset = self.checkpoints[position][1] if position >= 0 else 0
+
+        changes:list[dict] = []
+        try:
+            file = open(self.location, "rb")
+        except FileNotFoundError:
+            return changes
+
+        with file:
+            file.seek(offset)
+            for line in file:
+                # a line still being written by another process
+                if not line.endswith(b"\n") or limit is not None and len(changes) >= limit:
+                    break
+                if self._record_seq(line) > seq:
+                    changes.append(json.loads(line))
+        return changes
+
+
+    def _tail(self) -> tuple[int, int]:
+        """
+        Returns the sequence number of the last whole line in the file
+        and the offset just past it.
+        """
+        try:
+            file = open(self.location, "rb")
+        except FileNotFoundError:
+            return 0, 0
+
+        with file:
+            position = file.seek(0, os.SEEK_END)
+            block = b""
+            # read backwards until there's a whole line
+            while position > 0 and block.count(b"\n") < 2:
+                step = min(4096, position)
+                position -= step
+                file.seek(position)
+                block = file.read(step) + block
+
+        # anything after the last newline is a half written line
+        end = block.rfind(b"\n")
+        if end == -1:
+            return 0, 0
+        start = block.rfind(b"\n", 0, end) + 1
+        return self._record_seq(block[start:end + 1]), position + end + 1
+
+
+    def _scan(self) -> None:
+        """
+        Adds checkpoints for the records appended since the last scan.
+        """
+        try:
+            file = open(self.location, "rb")
+        except FileNotFoundError:
+            return
+
+        with file:
+            file.seek(self.scanned_offset)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                if self.scanned_records % self.CHECKPOINT_EVERY == 0:
+                    self.checkpoints.append((self._record_seq(line), self.scanned_offset))
+                self.scanned_offset += len(line)
+                self.scanned_records += 1
+
+
+    @staticmethod
+    def _record_seq(line:bytes) -> int:
+        """
+        Returns the sequence number of a log line without parsing all of it.
+        Lines always start with `{"seq": N,`.
+        """
+        return int(line[8:line.index(b",", 8)])
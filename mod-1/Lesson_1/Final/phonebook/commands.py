@@ -0,0 +1,347 @@
+#! /usr/bin/env python3
+"""
+Non-interactive interface to the phonebook, for driving it from scripts
+and cron jobs. Results are printed as JSON, one object per line.
+
+Usage:
+
+    python main.py add "John Smith" --phone 5551234567 --identifiers work london
+    python main.py remove contact_3
+    python main.py edit contact_3 --email john@example.org
+    python main.py search "Jo" --prefix
+    python main.py search "Jon Smyth" --fuzzy
+    python main.py search --keywords "work +london -old"
+    python main.py reverse "(555) 123-4567" 555.765.4321
+    python main.py reverse --file calls.txt
+    python main.py list --offset 0 --limit 50
+    python main.py export contacts.csv
+    python main.py dedup --merge
+    python main.py --change-log add "Jane Doe" --phone 5557654321
+    python main.py changes --since 120 > delta.jsonl
+    python main.py apply delta.jsonl
+    python main.py serve 127.0.0.1:5151
+    python main.py pull 127.0.0.1:5151 --since 120
+    python main.py script < requests.jsonl
+
+In script mode every line of stdin is a JSON request such as
+`{"command": "add", "name": "John Smith", "email": "john@example.com"}`
+and every request gets one JSON response line:
+`{"ok": true, "result": ...}` or `{"ok": false, "error": "..."}`.
+"""
+import sys
+import json
+import argparse
+from .phonebook import PhoneBook, NoIDError, IDsChangedError
+from .indexes import parse_keyword_query
+from .storage import WRITE_POLICIES
+from . import sync
+
+
+def contact_json(contact_id:str, data:dict) -> dict:
+    """
+    Returns a contact as a JSON friendly dictionary.
+    """
+    return {"contact_id": contact_id, **data}
+
+
+def iter_call_log(location:str):
+    """
+    Yields the phone numbers in a call log, one per line. Only the first
+    column of CSV style lines is used. `-` reads from stdin.
+    """
+    file = sys.stdin if location == "-" else open(location, encoding="utf-8")
+    try:
+        for line in file:
+            phone = line.split(",", 1)[0].strip()
+            if phone:
+                yield phone
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+def iter_reverse_lookup(book:PhoneBook, phones):
+    """
+    Yields a JSON friendly result for every number reverse looked up.
+    """
+    for phone, contact_ids in book.reverse_lookup_many(phones):
+        yield {"phone": phone, "contact_ids": contact_ids}
+
+
+def request_contact_ids(request:dict) -> list[str]:
+    """
+    Returns the contact ids a request is about, from `contact_ids` or `contact_id`.
+
+    ### Raises
+
+    `ValueError` - There are no contact ids, or one of them is not a string.
+    """
+    ids = request["contact_ids"] if "contact_ids" in request else [request.get("contact_id")]
+    if not isinstance(ids, list) or not ids or not all(isinstance(contact_id, str) for contact_id in ids):
+        raise ValueError("\"contact_id\" must be a string, and \"contact_ids\" a list of strings.")
+    return ids
+
+
+def execute(book:PhoneBook, request:dict):
+    """
+    Runs a single request against a phonebook.
+
+    ### Parameters
+
+    `book` - The phonebook to run the request on.
+
+    `request` - The request. `command` names the operation and the other
+    keys are its arguments.
+
+    ### Returns
+
+    The result of the command. Anything `json.dumps` can handle.
+
+    ### Raises
+
+    `ValueError` - The request is not an object, or the command or its arguments are invalid.
+
+    `NoIDError` - A contact was added or edited without a phone number or email.
+    """
+    if not isinstance(request, dict):
+        raise ValueError("Requests must be JSON objects.")
+    command = request.get("command")
+
+    match command:
+        case "add":
+            return book.add_contact(
+                request.get("name") or "",
+                request.get("phone") or None,
+                request.get("email"),
+                request.get("address"),
+                request.get("identifiers") or None,
+            )
+        case "remove":
+            return {contact_id: book.remove_contact(contact_id) == 0 for contact_id in request_contact_ids(request)}
+        case "edit":
+            contact_id = request_contact_ids(request)[0]
+            current = book.get_contact_data(contact_id)
+            if current == -1:
+                return False
+            current["name"] = " ".join(part for part in (current["first_name"], current["last_name"]) if part)
+            # details that aren't given stay as they are, given ones can be cleared with null or ""
+            details = {key: request[key] if key in request else current[key] for key in ("name", "phone", "email", "address", "identifiers")}
+            return book.edit_contact(
+                contact_id,
+                details["name"] or "",
+                details["phone"] or None,
+                details["email"] or None,
+                details["address"] or None,
+                details["identifiers"] or None,
+            ) == 0
+        case "get":
+            contact_id = request_contact_ids(request)[0]
+            data = book.get_contact_data(contact_id)
+            return None if data == -1 else contact_json(contact_id, data)
+        case "search":
+            if request.get("keywords") is not None:
+                found = book.search_keywords(*parse_keyword_query(request["keywords"]))
+            elif request.get("fuzzy"):
+                found = book.fuzzy_search(request.get("name") or "", request.get("limit"))
+            elif request.get("prefix"):
+                found = book.prefix_search(request.get("name") or "", request.get("limit"))
+            else:
+                found = book.lookup_contact(request.get("name") or "")
+            return [contact_json(contact_id, book.get_contact_data(contact_id)) for contact_id in found or []]
+        case "reverse":
+            phones = request.get("phones") or []
+            if request.get("file"):
+                phones = iter_call_log(request["file"])
+            return list(iter_reverse_lookup(book, phones))
+        case "list":
+            return [
+                contact_json(contact_id, data)
+                for contact_id, data in book.iter_contacts(request.get("offset") or 0, request.get("limit"))
+            ]
+        case "import":
+            return book.bulk_import(request["file"], request.get("format"), skip_invalid=bool(request.get("skip_invalid")))
+        case "export":
+            return book.export(request["file"], request.get("format"))
+        case "dedup":
+            if request.get("merge"):
+                return book.merge_duplicates(request.get("threshold") or 0.8)
+            return book.find_duplicates(request.get("threshold") or 0.8)
+        case "changes":
+            return book.changes_since(request.get("since") or 0, request.get("limit"))
+        case "apply":
+            if request.get("changes") is not None:
+                return book.apply_changes(request["changes"])
+            return sync.import_changes(book, request["file"])
+        case "pull":
+            return sync.pull(book, request["address"], request.get("since") or 0)
+        case "flush":
+            return book.flush()
+        case _:
+            raise ValueError(f"Unknown command \"{command}\".")
+
+
+def run_script(book:PhoneBook, lines, output) -> int:
+    """
+    Runs JSON requests, one per line, writing one JSON response per line.
+
+    ### Parameters
+
+    `book` - The phonebook to run the requests on.
+
+    `lines` - An iterable of request lines, eg `sys.stdin`.
+
+    `output` - A file to write the responses to, eg `sys.stdout`.
+
+    ### Returns
+
+    `int` - The amount of requests that failed.
+    """
+    failed:int = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            response = {"ok": True, "result": execute(book, json.loads(line))}
+        # a bad request only fails its own line, the rest still get answered
+        except (ValueError, KeyError, TypeError, AttributeError, NoIDError, IDsChangedError, OSError) as e:
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            failed += 1
+        output.write(json.dumps(response) + "\n")
+    output.flush()
+    return failed
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the command line parser.
+    """
+    parser = argparse.ArgumentParser(prog="main.py", description="Phonebook command interface. Run without arguments for the interactive menu.")
+    parser.add_argument("--data-file", default=".contacts.json", help="the phonebook data file (default: .contacts.json)")
+    parser.add_argument("--write-policy", choices=WRITE_POLICIES, default=None,
+                        help="when changes are written (default: immediate, or batched in script mode)")
+    parser.add_argument("--change-log", action="store_true",
+                        help="log the changes made, so copies of the phonebook can sync them (always on for changes and serve)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add a contact")
+    add.add_argument("name")
+    add.add_argument("--phone")
+    add.add_argument("--email")
+    add.add_argument("--address")
+    add.add_argument("--identifiers", nargs="*", default=None, help="keywords to search the contact by")
+
+    remove = commands.add_parser("remove", help="remove contacts by id")
+    remove.add_argument("contact_ids", nargs="+")
+
+    edit = commands.add_parser("edit", help="change the details of a contact")
+    edit.add_argument("contact_id")
+    edit.add_argument("--name")
+    edit.add_argument("--phone")
+    edit.add_argument("--email")
+    edit.add_argument("--address")
+    edit.add_argument("--identifiers", nargs="*", default=None, help="replaces the keywords of the contact")
+
+    get = commands.add_parser("get", help="show a contact by id")
+    get.add_argument("contact_id")
+
+    search = commands.add_parser("search", help="search contacts by name or keywords")
+    search.add_argument("name", nargs="?", default="")
+    search.add_argument("--prefix", action="store_true", help="match the start of the full or last name")
+    search.add_argument("--fuzzy", action="store_true", help="match names with typos or that sound alike")
+    search.add_argument("--limit", type=int, default=None)
+    search.add_argument("--keywords", default=None, help="keyword query, eg \"work +london -old\"")
+
+    reverse = commands.add_parser("reverse", help="find the contacts with phone numbers, like caller ID")
+    reverse.add_argument("phones", nargs="*", help="phone numbers in any format")
+    reverse.add_argument("--file", default=None, help="a call log with a phone number per line, or - for stdin")
+
+    list_ = commands.add_parser("list", help="list contacts")
+    list_.add_argument("--offset", type=int, default=0)
+    list_.add_argument("--limit", type=int, default=None)
+
+    import_ = commands.add_parser("import", help="import a CSV, JSON Lines or vCard file")
+    import_.add_argument("file")
+    import_.add_argument("--format", choices=["csv", "jsonl", "vcard"], default=None)
+    import_.add_argument("--skip-invalid", action="store_true", help="skip contacts without a phone or email")
+
+    export = commands.add_parser("export", help="export to a CSV, JSON Lines or vCard file")
+    export.add_argument("file")
+    export.add_argument("--format", choices=["csv", "jsonl", "vcard"], default=None)
+
+    dedup = commands.add_parser("dedup", help="find duplicate contacts")
+    dedup.add_argument("--merge", action="store_true", help="merge each group of duplicates into its oldest contact")
+    dedup.add_argument("--threshold", type=float, default=0.8, help="how similar names sharing a phone or email must be (0-1)")
+
+    changes = commands.add_parser("changes", help="print the change log, to sync a copy of the phonebook")
+    changes.add_argument("--since", type=int, default=0, help="the last change the copy has")
+    changes.add_argument("--limit", type=int, default=None)
+
+    apply = commands.add_parser("apply", help="apply changes printed by the changes command")
+    apply.add_argument("file")
+
+    serve = commands.add_parser("serve", help="serve the change log for copies to pull")
+    serve.add_argument("address", help="host:port, or a path for a Unix socket")
+
+    pull = commands.add_parser("pull", help="apply the changes served by another phonebook")
+    pull.add_argument("address", help="host:port, or a path for a Unix socket")
+    pull.add_argument("--since", type=int, default=0, help="the number printed by the last pull")
+
+    commands.add_parser("script", help="read JSON requests from stdin, one per line")
+
+    return parser
+
+
+def main(argv:list[str]|None = None) -> int:
+    """
+    Command line entry point. Returns the exit code.
+    """
+    args = build_parser().parse_args(argv)
+
+    # scripts send many requests, so only write every so often by default
+    write_policy = args.write_policy or ("batched" if args.command == "script" else "immediate")
+    # the change log is opt in, but there's nothing to print or serve without it
+    change_log = args.change_log or args.command in ("changes", "serve")
+    book = PhoneBook(write_policy, change_log=change_log)
+    if book.set_data_file(args.data_file) != 0:
+        print(f"Unsupported data file \"{args.data_file}\".", file=sys.stderr)
+        return 2
+
+    try:
+        if args.command == "script":
+            failed = run_script(book, sys.stdin, sys.stdout)
+            return 1 if failed else 0
+
+        if args.command == "serve":
+            sync.serve(book, args.address)
+            return 0
+
+        if args.command == "reverse" and args.file:
+            # call logs can have millions of rows, so stream them through
+            for item in iter_reverse_lookup(book, iter_call_log(args.file)):
+                sys.stdout.write(json.dumps(item) + "\n")
+            return 0
+
+        # options that weren't given are left out, so edit keeps those details
+        request = {key: value for key, value in vars(args).items() if key not in ("data_file", "write_policy", "change_log") and value is not None}
+        result = execute(book, request)
+    except (ValueError, KeyError, NoIDError, IDsChangedError, OSError) as e:
+        print(f"{type(e).__name__}: {e}", file=sys.stderr)
+        return 1
+    finally:
+        try:
+            book.close()
+        # the held back changes are written all the same, but ids printed for them are stale
+        except IDsChangedError as e:
+            print(f"{type(e).__name__}: {e}", file=sys.stderr)
+
+    # lists of contacts come out one per line so they can be streamed into other tools
+    if isinstance(result, list):
+        for item in result:
+            print(json.dumps(item))
+    else:
+        print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
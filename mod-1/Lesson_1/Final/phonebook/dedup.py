@@ -0,0 +1,218 @@
+#! /usr/bin/env python3
+"""
+Finds and merges duplicate contacts.
+
+Rather than comparing every contact with every other contact, contacts are
+put into buckets by normalized keys: their phone digits, their lowercased
+email and their name (the `hash_id` of the first name plus the last name).
+Only contacts sharing a bucket are compared, so the work grows with the
+size of the phonebook rather than with its square. Matching contacts are
+joined into groups with a union-find, so a contact that shares a phone with
+one duplicate and an email with another ends up in one group with both.
+"""
+from difflib import SequenceMatcher
+from .phones import normalize_phone
+
+
+def phone_digits(phone:str|int|None) -> str|None:
+    """
+    Returns the canonical form of a phone number, or `None` if there are
+    too few digits to tell people apart.
+    """
+    digits = normalize_phone(phone)
+    return digits if digits is not None and len(digits) >= 7 else None
+
+
+def match_fields(data:dict) -> tuple[str, str|None, str|None]:
+    """
+    Returns the lowercased full name, phone digits and lowercased
+    email of a contact, which are what contacts are compared on.
+    """
+    name = " ".join(part for part in (data["first_name"], data["last_name"]) if part).lower()
+    email = (data["email"] or "").strip().lower() or None
+    return name, phone_digits(data["phone"]), email
+
+
+def bucket_keys(data:dict) -> list[str]:
+    """
+    Returns the buckets a contact goes in.
+    """
+    name, phone, email = match_fields(data)
+    keys:list[str] = []
+    if phone:
+        keys.append(f"p:{phone}")
+    if email:
+        keys.append(f"e:{email}")
+    if data["hash_id"] and data["last_name"]:
+        # the hash only covers the first name, so the last name is added on
+        keys.append(f"n:{data['hash_id'][:16]}:{data['last_name'].lower()}")
+    return keys
+
+
+def similar_names(first:str, second:str, threshold:float = 0.8) -> bool:
+    """
+    Returns whether two lowercased names could belong to the same person,
+    allowing for typos and missing names.
+    """
+    if not first or not second or first == second:
+        return True
+    if first.split()[0] == second.split()[0]:
+        return True
+    return SequenceMatcher(None, first, second).ratio() >= threshold
+
+
+def is_duplicate(kind:str, first:tuple, second:tuple, threshold:float = 0.8) -> bool:
+    """
+    Decides whether two contacts sharing a bucket are the same person.
+
+    ### Parameters
+
+    `kind` - The kind of bucket: `"p"` for phone, `"e"` for email or `"n"` for name.
+
+    `first` - The `match_fields` of one contact.
+
+    `second` - The `match_fields` of the other contact.
+
+    `threshold` - How similar names sharing a phone or email need to be.
+    """
+    if kind == "n":
+        # same name, so only conflicting details tell them apart
+        _, first_phone, first_email = first
+        _, second_phone, second_email = second
+        if first_phone and second_phone and first_phone != second_phone:
+            return False
+        if first_email and second_email and first_email != second_email:
+            return False
+        return True
+
+    # a shared phone or email could still be a household or an office
+    return similar_names(first[0], second[0], threshold)
+
+
+class UnionFind:
+    """
+    Disjoint sets over the numbers `0` to `size - 1`. The lowest number
+    in a set is its root.
+    """
+
+    def __init__(self, size:int = 0) -> None:
+        self.parent:list[int] = list(range(size))
+
+
+    def add(self) -> int:
+        """
+        Adds a new set and returns its number.
+        """
+        self.parent.append(len(self.parent))
+        return len(self.parent) - 1
+
+
+    def find(self, item:int) -> int:
+        parent = self.parent
+        while parent[item] != item:
+            # path halving keeps the trees flat
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+
+    def union(self, first:int, second:int) -> None:
+        first, second = self.find(first), self.find(second)
+        if first < second:
+            self.parent[second] = first
+        elif second < first:
+            self.parent[first] = second
+
+
+def find_duplicates(contacts, lookup, max_bucket:int = 1000, threshold:float = 0.8) -> list[list[str]]:
+    """
+    Finds groups of duplicate contacts in one pass over the contacts.
+
+    ### Parameters
+
+    `contacts` - An iterable of `(contact_id, data)` pairs, in id order.
+
+    `lookup` - A function returning the data of a contact id. Only called
+    for contacts sharing a bucket, so the data doesn't have to be kept around.
+
+    `max_bucket` - Buckets holding more contacts than this are skipped, as
+    the key is too common to say anything, eg a company switchboard number.
+
+    `threshold` - How similar names sharing a phone or email need to be,
+    from 0 to 1.
+
+    ### Returns
+
+    `list[list[str]]` - The groups of duplicates. Each group is in id order,
+    so the first contact is the oldest.
+    """
+    ids:list[str] = []
+    sets = UnionFind()
+
+    # the first contact in each bucket, and every contact once there's a second
+    first_in_bucket:dict[str, int] = {}
+    shared_buckets:dict[str, list[int]] = {}
+
+    for contact_id, data in contacts:
+        number = sets.add()
+        ids.append(contact_id)
+        for key in bucket_keys(data):
+            first = first_in_bucket.setdefault(key, number)
+            if first != number:
+                shared_buckets.setdefault(key, [first]).append(number)
+    del first_in_bucket
+
+    for key, members in shared_buckets.items():
+        if len(members) > max_bucket:
+            continue
+        kind = key[0]
+        fields = {number: match_fields(lookup(ids[number])) for number in members}
+
+        # compare against one contact at a time, the union-find links the rest up
+        while len(members) > 1:
+            anchor, unmatched = members[0], []
+            for number in members[1:]:
+                if is_duplicate(kind, fields[anchor], fields[number], threshold):
+                    sets.union(anchor, number)
+                else:
+                    unmatched.append(number)
+            members = unmatched
+
+    # roots are the lowest number in their set, so they come before their duplicates
+    groups:dict[int, list[str]] = {}
+    for number in range(len(ids)):
+        root = sets.find(number)
+        if root != number:
+            groups.setdefault(root, [ids[root]]).append(ids[number])
+    return list(groups.values())
+
+
+def merge_contacts(contacts:list[dict]) -> dict:
+    """
+    Merges the data of duplicate contacts into one contact. Details are
+    taken from the first contact that has them, and identifiers are combined.
+
+    ### Parameters
+
+    `contacts` - The data of the duplicates, oldest first.
+
+    ### Returns
+
+    `dict` - The merged contact data.
+    """
+    merged:dict = dict(contacts[0])
+    for data in contacts[1:]:
+        if not merged["first_name"] and data["first_name"]:
+            merged["first_name"] = data["first_name"]
+            merged["hash_id"] = data["hash_id"]
+        for field in ("last_name", "phone", "email", "address"):
+            if not merged[field] and data[field]:
+                merged[field] = data[field]
+
+    identifiers:list[str] = []
+    for data in contacts:
+        for keyword in data["identifiers"] or ():
+            if keyword not in identifiers:
+                identifiers.append(keyword)
+    merged["identifiers"] = identifiers or None
+    return merged
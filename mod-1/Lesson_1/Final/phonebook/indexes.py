@@ -0,0 +1,513 @@
+#! /usr/bin/env python3
+"""
+In-memory indexes kept by the storage engines so searches don't have to
+scan every contact.
+"""
+from bisect import bisect_left, insort
+from itertools import chain
+from collections import Counter
+from .phones import normalize_phone
+
+
+def contact_sort_key(contact_id:str) -> int:
+    """
+    Sort key that orders contact ids (`contact_N`) by their number,
+    so `contact_10` comes after `contact_9`.
+    """
+    return int(contact_id.rpartition("_")[2])
+
+
+def parse_keyword_query(query:str) -> tuple[list[str], list[str], list[str]]:
+    """
+    Splits a keyword search typed by the user into its parts.
+    Keywords starting with `+` are required, keywords starting
+    with `-` are excluded and every other keyword is optional.
+
+    ### Parameters
+
+    `query` - The keywords, separated by spaces. Eg: `work +london -old`.
+
+    ### Returns
+
+    `tuple` - The required, optional and excluded keywords.
+    """
+    all_of:list = []
+    any_of:list = []
+    none_of:list = []
+
+    for keyword in query.split():
+        if keyword.startswith("+") and len(keyword) > 1:
+            all_of.append(keyword[1:])
+        elif keyword.startswith("-") and len(keyword) > 1:
+            none_of.append(keyword[1:])
+        else:
+            any_of.append(keyword)
+
+    return all_of, any_of, none_of
+
+
+class KeywordIndex:
+    """
+    Inverted index from identifier keyword to the ids of the contacts
+    tagged with it.
+    """
+
+    def __init__(self) -> None:
+        self.postings:dict[str, set[str]] = {}
+
+
+    def add(self, contact_id:str, keywords:list[str]|None) -> None:
+        """
+        Indexes a contact under each of its keywords.
+        """
+        for keyword in keywords or ():
+            self.postings.setdefault(keyword, set()).add(contact_id)
+
+
+    def remove(self, contact_id:str, keywords:list[str]|None) -> None:
+        """
+        Removes a contact from the index.
+        """
+        for keyword in keywords or ():
+            posting = self.postings.get(keyword)
+            if posting is None:
+                continue
+            posting.discard(contact_id)
+            if not posting:
+                del self.postings[keyword]
+
+
+    def query(self, all_of:list[str] = (), any_of:list[str] = (), none_of:list[str] = (), universe = None) -> list[str]:
+        """
+        Finds the contacts matching a keyword query.
+
+        The work done is proportional to the size of the keyword postings
+        involved, not to the amount of contacts in the phonebook. Only a query
+        made of nothing but excluded keywords has to look at every contact.
+
+        ### Parameters
+
+        `all_of` - Keywords a contact must have every one of.
+
+        `any_of` - Keywords a contact must have at least one of. Ignored for
+        deciding matches when `all_of` is given, but still used for ranking.
+
+        `none_of` - Keywords a contact must have none of.
+
+        `universe` - An iterable of every contact id, used when the query only
+        excludes keywords.
+
+        ### Returns
+
+        `list[str]` - The matching contact ids without duplicates, ranked by how
+        many of the required and optional keywords they have and then by id.
+        """
+        empty:set = set()
+
+        if all_of:
+            # intersect starting from the smallest posting
+            postings = sorted((self.postings.get(keyword, empty) for keyword in all_of), key=len)
+            matches = set(postings[0])
+            for posting in postings[1:]:
+                matches.intersection_update(posting)
+        elif any_of:
+            matches = set()
+            for keyword in any_of:
+                matches.update(self.postings.get(keyword, empty))
+        elif none_of and universe is not None:
+            matches = set(universe)
+        else:
+            return []
+
+        # filter by membership so the cost follows the matches, not the postings
+        excluded = [self.postings[keyword] for keyword in none_of if keyword in self.postings]
+        if excluded:
+            matches = {contact_id for contact_id in matches if not any(contact_id in posting for posting in excluded)}
+
+        ranking_keywords = set(all_of) | set(any_of)
+        hits = {
+            contact_id: sum(contact_id in self.postings.get(keyword, empty) for keyword in ranking_keywords)
+            for contact_id in matches
+        }
+        return sorted(matches, key=lambda contact_id: (-hits[contact_id], contact_sort_key(contact_id)))
+
+
+class PhoneIndex:
+    """
+    Hash index from canonical phone number to the ids of the contacts
+    with that number, for caller ID style reverse lookups.
+
+    Numbers are normalized when indexed, so contacts stored before phone
+    numbers were normalized on write are still found.
+    """
+
+    def __init__(self) -> None:
+        # most numbers belong to one contact, and a list is far smaller than a set
+        self.postings:dict[str, list[str]] = {}
+
+
+    def add(self, contact_id:str, phone:str|None) -> None:
+        """
+        Indexes a contact under its phone number.
+        """
+        phone = normalize_phone(phone)
+        if phone is None:
+            return
+        posting = self.postings.setdefault(phone, [])
+        if contact_id not in posting:
+            posting.append(contact_id)
+
+
+    def remove(self, contact_id:str, phone:str|None) -> None:
+        """
+        Removes a contact from the index.
+        """
+        phone = normalize_phone(phone)
+        posting = self.postings.get(phone)
+        if posting is None or contact_id not in posting:
+            return
+        posting.remove(contact_id)
+        if not posting:
+            del self.postings[phone]
+
+
+    def lookup(self, phone:str|int|None) -> list[str]:
+        """
+        Returns the ids of the contacts with a phone number, in id order.
+        The number can be in any format.
+        """
+        posting = self.postings.get(normalize_phone(phone))
+        if not posting:
+            return []
+        return sorted(posting, key=contact_sort_key)
+
+
+class NameIndex:
+    """
+    Sorted index of contact names for prefix searches.
+
+    Every contact is indexed under its full name (`first last`) and its last
+    name, lowercased, so a prefix finds contacts by either name. Finding the
+    first match is a binary search, so searches stay fast however large the
+    phonebook is. Removed contacts are skipped until the index is compacted.
+    """
+
+    def __init__(self) -> None:
+        # (name key, id number, contact id), kept sorted
+        self.entries:list[tuple[str, int, str]] = []
+        # ids of removed contacts still in `entries`
+        self.removed:set[str] = set()
+
+
+    @staticmethod
+    def keys(data:dict) -> list[str]:
+        """
+        Returns the keys a contact is indexed under.
+        """
+        first_name = (data["first_name"] or "").lower()
+        last_name = (data["last_name"] or "").lower()
+        if not last_name:
+            return [first_name]
+        return [f"{first_name} {last_name}", last_name]
+
+
+    def build(self, contacts) -> None:
+        """
+        Indexes every contact at once.
+
+        ### Parameters
+
+        `contacts` - An iterable of `(contact_id, data)` pairs.
+        """
+        self.removed = set()
+        self.entries = sorted(
+            (key, contact_sort_key(contact_id), contact_id)
+            for contact_id, data in contacts
+            for key in self.keys(data)
+        )
+
+
+    def add(self, contact_id:str, data:dict) -> None:
+        """
+        Indexes a contact.
+        """
+        if contact_id in self.removed:
+            self.compact()
+        for key in self.keys(data):
+            insort(self.entries, (key, contact_sort_key(contact_id), contact_id))
+
+
+    def remove(self, contact_id:str, data:dict) -> None:
+        """
+        Removes a contact from the index.
+        """
+        self.removed.add(contact_id)
+        if len(self.removed) > max(1000, len(self.entries) // 4):
+            self.compact()
+
+
+    def update(self, contact_id:str, old:dict, new:dict) -> None:
+        """
+        Reindexes a contact whose data changed, keeping its place in
+        the index if its names didn't.
+        """
+        old_keys, new_keys = self.keys(old), self.keys(new)
+        if old_keys == new_keys:
+            return
+
+        # the contact stays, so its old entries are taken out now rather than skipped
+        number = contact_sort_key(contact_id)
+        for key in old_keys:
+            position = bisect_left(self.entries, (key, number, contact_id))
+            if position < len(self.entries) and self.entries[position][2] == contact_id:
+                del self.entries[position]
+        for key in new_keys:
+            insort(self.entries, (key, number, contact_id))
+
+
+    def compact(self) -> None:
+        """
+        Drops the entries of removed contacts.
+        """
+        if self.removed:
+            self.entries = [entry for entry in self.entries if entry[2] not in self.removed]
+            self.removed = set()
+
+
+    def iter_prefix(self, prefix:str):
+        """
+        Yields the ids of the contacts whose full or last name starts with
+        the given prefix, ignoring case, in name order and without duplicates.
+        """
+        prefix = prefix.lower()
+        entries = self.entries
+        removed = self.removed
+        seen:set = set()
+
+        position = bisect_left(entries, (prefix,))
+        while position < len(entries) and entries[position][0].startswith(prefix):
+            contact_id = entries[position][2]
+            if contact_id not in seen and contact_id not in removed:
+                seen.add(contact_id)
+                yield contact_id
+            position += 1
+
+
+# soundex codes by letter. vowels, h, w and y have none
+SOUNDEX_CODES:dict[str, str] = {
+    letter: code
+    for code, letters in (("1", "bfpv"), ("2", "cgjkqsxz"), ("3", "dt"), ("4", "l"), ("5", "mn"), ("6", "r"))
+    for letter in letters
+}
+
+
+def soundex(word:str) -> str:
+    """
+    Returns the Soundex code of a word, which is the same for names that
+    sound alike, eg `Smith` and `Smyth` are both `S530`.
+    """
+    letters = [char for char in word.lower() if char.isalpha()]
+    if not letters:
+        return ""
+
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], "")
+    for char in letters[1:]:
+        digit = SOUNDEX_CODES.get(char, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # h and w don't separate letters with the same code, vowels do
+        if char not in "hw":
+            previous = digit
+    return code.ljust(4, "0")
+
+
+def edit_distance(first:str, second:str, limit:int|None = None) -> int:
+    """
+    Returns the Levenshtein distance between two strings, the least amount
+    of single character insertions, deletions and substitutions needed to
+    turn one into the other.
+
+    ### Parameters
+
+    `first`, `second` - The strings to compare.
+
+    `limit` - Stop as soon as the distance is known to be over this,
+    returning `limit + 1`. Optional.
+    """
+    if first == second:
+        return 0
+    if len(first) < len(second):
+        first, second = second, first
+
+    previous = list(range(len(second) + 1))
+    for row, first_char in enumerate(first, start=1):
+        current = [row]
+        # the cheapest of deleting, inserting or substituting, written out
+        # since calling min for every cell is most of the cost
+        left = row
+        for column, second_char in enumerate(second, start=1):
+            cost = previous[column - 1] + (first_char != second_char)
+            left += 1
+            if previous[column] + 1 < left:
+                left = previous[column] + 1
+            if cost < left:
+                left = cost
+            current.append(left)
+        # every later row is at least the smallest value in this one
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+
+    if limit is not None and previous[-1] > limit:
+        return limit + 1
+    return previous[-1]
+
+
+def bigrams(word:str) -> list[str]:
+    """
+    Returns the pairs of neighbouring letters in a word, with the start
+    and end of the word marked so they count too.
+    """
+    padded = f"^{word}$"
+    return [padded[position:position + 2] for position in range(len(padded) - 1)]
+
+
+class FuzzyIndex:
+    """
+    Index of the words in contact names for searches that forgive typos and
+    spelling differences, eg `Jon Smyth` finds `John Smith`.
+
+    Words in a name are found by spelling through an index of their
+    `bigrams` and by sound through their `soundex` code. A word within `k`
+    edits of another shares all but at most `2k` of its bigrams, so only
+    the few words sharing enough bigrams with the query are compared with
+    it, never every contact.
+    """
+
+    def __init__(self) -> None:
+        # name word -> ids of the contacts with it
+        self.words:dict[str, set[str]] = {}
+        # soundex code -> name words with it
+        self.sounds:dict[str, set[str]] = {}
+        # bigram -> name words with it. removed words stay behind,
+        # searches skip them as they're no longer in `words`
+        self.grams:dict[str, list[str]] = {}
+        # every word ever put in `grams`
+        self.gram_words:set[str] = set()
+
+
+    @staticmethod
+    def name_words(data:dict) -> set[str]:
+        """
+        Returns the lowercased words of a contact's names.
+        """
+        return set(f"{data['first_name'] or ''} {data['last_name'] or ''}".lower().split())
+
+
+    def add(self, contact_id:str, data:dict) -> None:
+        """
+        Indexes a contact.
+        """
+        for word in self.name_words(data):
+            contacts = self.words.get(word)
+            if contacts is None:
+                contacts = self.words[word] = set()
+                if word not in self.gram_words:
+                    self.gram_words.add(word)
+                    for gram in set(bigrams(word)):
+                        self.grams.setdefault(gram, []).append(word)
+                self.sounds.setdefault(soundex(word), set()).add(word)
+            contacts.add(contact_id)
+
+
+    def remove(self, contact_id:str, data:dict) -> None:
+        """
+        Removes a contact from the index.
+        """
+        for word in self.name_words(data):
+            contacts = self.words.get(word)
+            if contacts is None:
+                continue
+            contacts.discard(contact_id)
+            if not contacts:
+                del self.words[word]
+                self.sounds.get(soundex(word), set()).discard(word)
+
+
+    def similar_words(self, word:str, max_distance:int|None = None) -> dict[str, int]:
+        """
+        Returns the indexed words that are spelled or sound like a word,
+        mapped to their edit distance from it.
+
+        ### Parameters
+
+        `word` - The lowercased word.
+
+        `max_distance` - The most edits a match can be away. Defaults to 1
+        for words of up to 4 letters and 2 for longer words.
+        """
+        if max_distance is None:
+            max_distance = 1 if len(word) <= 4 else 2
+
+        # each edit changes at most two bigrams, so a close word shares the rest
+        grams = set(bigrams(word))
+        needed = len(grams) - 2 * max_distance
+        shared = Counter(chain.from_iterable(self.grams.get(gram, ()) for gram in grams))
+
+        found:dict[str, int] = {}
+        words = self.words
+        for match, count in shared.items():
+            if count >= needed and abs(len(match) - len(word)) <= max_distance and match in words:
+                distance = edit_distance(word, match, max_distance)
+                if distance <= max_distance:
+                    found[match] = distance
+
+        # names that sound the same can be one edit further apart, as long as
+        # they share spelling past the first letter, which soundex keeps anyway.
+        # soundex alone matches jon and jane
+        sound_limit = max_distance + 1
+        for match in self.sounds.get(soundex(word), ()):
+            if match not in found and shared.get(match, 0) >= 2 and abs(len(match) - len(word)) <= sound_limit:
+                distance = edit_distance(word, match, sound_limit)
+                if distance <= sound_limit:
+                    found[match] = distance
+        return found
+
+
+    def search(self, query:str, max_distance:int|None = None) -> list[str]:
+        """
+        Finds the contacts with names like a query.
+
+        ### Parameters
+
+        `query` - The name to search for, eg `Jon Smyth`.
+
+        `max_distance` - See `similar_words`.
+
+        ### Returns
+
+        `list[str]` - The matching contact ids. Contacts matching more of
+        the query's words come first, then the closest spelled ones.
+        """
+        words = query.lower().split()
+        # contact id -> best distance for each query word it matches
+        matches:dict[str, dict[int, int]] = {}
+
+        for position, word in enumerate(words):
+            for match, distance in self.similar_words(word, max_distance).items():
+                for contact_id in self.words[match]:
+                    best = matches.setdefault(contact_id, {})
+                    if distance < best.get(position, distance + 1):
+                        best[position] = distance
+
+        return sorted(
+            matches,
+            key=lambda contact_id: (
+                -len(matches[contact_id]),
+                sum(matches[contact_id].values()),
+                contact_sort_key(contact_id),
+            )
+        )
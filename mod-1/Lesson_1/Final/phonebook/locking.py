@@ -0,0 +1,89 @@
+#! /usr/bin/env python3
+"""
+Advisory file locks, so several processes can share one phonebook without
+overwriting each other's changes. Uses `fcntl` on POSIX and `msvcrt` on
+Windows.
+"""
+import os
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock:
+    """
+    Exclusive lock held on a separate lock file next to the data file.
+
+    The lock is re-entrant within a process, so code holding it can call
+    other code that takes it too. Other processes block until it is released.
+    """
+
+    def __init__(self, location:str) -> None:
+        """
+        ### Parameters
+
+        `location` - The location of the lock file. Will be created if needed.
+        """
+        self.location = location
+        self.file = None
+        self.depth:int = 0
+
+
+    def acquire(self) -> None:
+        """
+        Waits for and takes the lock.
+        """
+        if self.depth == 0:
+            # the file is kept open between locks, opening it is the slow part
+            if self.file is None:
+                self.file = open(self.location, "a+b")
+            if os.name == "nt":
+                self.file.seek(0)
+                while True:
+                    # LK_LOCK only retries for 10 seconds before giving up
+                    try:
+                        msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+            else:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        self.depth += 1
+
+
+    def release(self) -> None:
+        """
+        Releases the lock once every `acquire` has been matched by a `release`.
+        """
+        if self.depth == 0:
+            return
+        self.depth -= 1
+        if self.depth == 0:
+            if os.name == "nt":
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+
+    def close(self) -> None:
+        """
+        Releases the lock and closes the lock file.
+        """
+        if self.depth:
+            self.depth = 1
+            self.release()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
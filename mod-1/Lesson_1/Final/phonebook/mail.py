@@ -0,0 +1,320 @@
+#! /usr/bin/env python3
+"""
+Email delivery for the phonebook.
+
+Messages are queued and sent by a few worker threads, each keeping its own
+SMTP connection open between messages. The TLS handshake and login are done
+once per connection instead of once per message, so sending to many
+recipients is limited by how fast the server accepts mail.
+
+Usage:
+
+    with MailSender("smtp.gmail.com", 465, "me@gmail.com", password) as sender:
+        for address in addresses:
+            sender.submit(build_message("me@gmail.com", address, "Hello", "Hi there!"))
+
+Any host and port can be used, so tests can point the sender at a local
+server with `use_ssl=False`.
+"""
+import ssl
+import time
+import queue
+import string
+import smtplib
+import threading
+from concurrent.futures import Future
+from email.message import EmailMessage
+
+
+# errors that are worth trying again on a new connection
+TRANSIENT_ERRORS:tuple[type[Exception], ...] = (
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPConnectError,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def build_message(sender_email:str, reciever_emails:str|list[str], subject_header:str, contents:str) -> EmailMessage:
+    """
+    Builds an email.
+
+    ### Parameters
+
+    `sender_email` - The email of the sender.
+
+    `reciever_emails` - The email or emails to send the message to.
+
+    `subject_header` - The subject header of the email.
+
+    `contents` - The body of the email.
+
+    ### Returns
+
+    `EmailMessage` - The email, ready for `MailSender.submit`.
+    """
+    if isinstance(reciever_emails, str):
+        reciever_emails = [reciever_emails]
+
+    message = EmailMessage()
+    message["From"] = sender_email
+    message["To"] = ", ".join(email for email in reciever_emails if email)
+    message["Subject"] = subject_header
+    message.set_content(contents)
+    return message
+
+
+def render_template(template:str, contact_id:str, data:dict) -> str:
+    """
+    Fills in a mail merge template for a contact.
+
+    Placeholders are written `$name` or `${name}` and can be any stored
+    field (`$first_name`, `$last_name`, `$phone`, `$email`, `$address`),
+    `$name` for the full name, `$identifiers` or `$contact_id`. Missing
+    fields are left blank and unknown placeholders are left as they are.
+
+    ### Parameters
+
+    `template` - The template, eg `"Hi $first_name,"`.
+
+    `contact_id` - The id of the contact.
+
+    `data` - The stored data of the contact.
+
+    ### Returns
+
+    `str` - The filled in template.
+    """
+    fields:dict = {key: "" if value is None else value for key, value in data.items()}
+    fields["name"] = " ".join(part for part in (data.get("first_name"), data.get("last_name")) if part)
+    fields["identifiers"] = ", ".join(data.get("identifiers") or ())
+    fields["contact_id"] = contact_id
+    return string.Template(template).safe_substitute(fields)
+
+
+def is_transient(error:Exception) -> bool:
+    """
+    Returns whether a failed delivery might succeed if tried again.
+    SMTP replies in the 4xx range are temporary failures.
+    """
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and 400 <= error.smtp_code < 500
+
+
+class MailSender:
+    """
+    Sends queued emails over a pool of persistent SMTP connections.
+
+    Every worker thread owns one connection, which is opened on its first
+    message and reused until the sender is closed or the server drops it.
+    Temporary failures are retried on a new connection, waiting longer
+    after every attempt.
+    """
+
+    def __init__(
+        self,
+        host:str = "smtp.gmail.com",
+        port:int = 465,
+        username:str|None = None,
+        password:str|None = None,
+        use_ssl:bool = True,
+        concurrency:int = 4,
+        retries:int = 3,
+        backoff:float = 1.0,
+        timeout:float = 30.0,
+        queue_size:int = 1000
+    ) -> None:
+        """
+        ### Parameters
+
+        `host` - The SMTP server.
+
+        `port` - The port of the SMTP server. 465 for SSL, often 25 or 1025
+        for a local server.
+
+        `username` - The account to log in with.
+
+        `password` - The password of the account. No login if `None`,
+        for servers that don't need one.
+
+        `use_ssl` - Whether to connect with SSL.
+
+        `concurrency` - The amount of connections, and threads, to send with.
+
+        `retries` - How many times a message is retried after a temporary failure.
+
+        `backoff` - The seconds to wait before the first retry. Doubles with
+        every retry after that.
+
+        `timeout` - Seconds to wait on the server before giving up on a connection.
+
+        `queue_size` - The amount of messages that can wait to be sent.
+        `submit` blocks while the queue is full.
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        # (message, future) pairs, with a `None` per worker to stop them
+        self.queue:queue.Queue = queue.Queue(queue_size)
+        self.workers:list[threading.Thread] = []
+        self.context = ssl.create_default_context() if use_ssl else None
+
+        # delivery statistics, updated by the workers
+        self.stats_lock = threading.Lock()
+        self.sent:int = 0
+        self.failed:int = 0
+        self.retried:int = 0
+        self.connections:int = 0
+
+
+    def start(self) -> None:
+        """
+        Starts the worker threads. Called by `submit` if needed.
+        """
+        if self.workers:
+            return
+        for number in range(self.concurrency):
+            worker = threading.Thread(target=self._work, name=f"mail-sender-{number}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+
+    def submit(self, message:EmailMessage) -> Future:
+        """
+        Queues an email to be sent.
+
+        ### Parameters
+
+        `message` - The email, eg from `build_message`. The recipients
+        are taken from its headers.
+
+        ### Returns
+
+        `Future` - Resolves to a dictionary of the recipients the server
+        refused, or to the error that stopped the email being sent.
+        """
+        self.start()
+        future:Future = Future()
+        self.queue.put((message, future))
+        return future
+
+
+    def send(self, message:EmailMessage) -> dict:
+        """
+        Sends an email and waits for it to be delivered.
+
+        ### Returns
+
+        `dict` - The recipients the server refused.
+
+        ### Raises
+
+        `smtplib.SMTPException` - The email could not be sent.
+        """
+        return self.submit(message).result()
+
+
+    def close(self) -> None:
+        """
+        Waits for the queued emails to be sent, then closes the connections.
+        """
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+    def _connect(self) -> smtplib.SMTP:
+        """
+        Opens and logs in a new connection.
+        """
+        if self.use_ssl:
+            connection = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=self.context)
+        else:
+            connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+
+        try:
+            if self.password is not None:
+                connection.login(self.username, self.password)
+        except Exception:
+            connection.close()
+            raise
+
+        with self.stats_lock:
+            self.connections += 1
+        return connection
+
+
+    def _work(self) -> None:
+        """
+        Worker thread. Sends queued messages until it's told to stop.
+        """
+        connection:smtplib.SMTP|None = None
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                message, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                connection = self._deliver(connection, message, future)
+        finally:
+            if connection is not None:
+                try:
+                    connection.quit()
+                except (smtplib.SMTPException, OSError):
+                    connection.close()
+
+
+    def _deliver(self, connection:smtplib.SMTP|None, message:EmailMessage, future:Future) -> smtplib.SMTP|None:
+        """
+        Sends a message, retrying temporary failures, and resolves its future.
+        Returns the connection to use for the next message.
+        """
+        attempt:int = 0
+        while True:
+            try:
+                if connection is None:
+                    connection = self._connect()
+                refused = connection.send_message(message)
+
+            except Exception as error:
+                # the connection may be halfway through a message, start over
+                if connection is not None:
+                    connection.close()
+                    connection = None
+
+                if not is_transient(error) or attempt >= self.retries:
+                    with self.stats_lock:
+                        self.failed += 1
+                    future.set_exception(error)
+                    return connection
+
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+                with self.stats_lock:
+                    self.retried += 1
+                continue
+
+            with self.stats_lock:
+                self.sent += 1
+            future.set_result(refused)
+            return connection
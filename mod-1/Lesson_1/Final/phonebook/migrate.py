@@ -0,0 +1,81 @@
+#! /usr/bin/env python3
+"""
+Copies a phonebook from one data file to another, for example to move an
+existing `.json` book into a SQLite database.
+
+Usage: `python -m phonebook.migrate .contacts.json contacts.db`
+"""
+import sys
+import argparse
+from .storage import engine_for
+
+
+def migrate(source:str, destination:str, batch_size:int = 10000) -> int:
+    """
+    Copies every contact from one data file into another. The storage
+    engines are picked from the file extensions.
+
+    ### Parameters
+
+    `source` - The data file to read the contacts from.
+
+    `destination` - The data file to write the contacts to. Will be created
+    if needed, and must not hold any contacts yet.
+
+    `batch_size` - The amount of contacts written per commit.
+
+    ### Returns
+
+    `int` - The amount of contacts copied.
+
+    ### Raises
+
+    `ValueError` - A file extension has no storage engine, or the destination
+    already holds contacts.
+    """
+    source_engine = engine_for(source)
+    destination_engine = engine_for(destination)
+    if source_engine is None or destination_engine is None:
+        raise ValueError(f"No storage engine for \"{source if source_engine is None else destination}\".")
+
+    source_store = source_engine(source)
+    destination_store = destination_engine(destination, "batched", batch_size)
+    try:
+        source_store.open()
+        destination_store.open()
+        if destination_store.count() != 0:
+            raise ValueError(f"\"{destination}\" already holds contacts.")
+
+        # contacts keep their ids, so anything referring to them stays valid
+        copied:int = 0
+        for contact_id in source_store.ids():
+            destination_store.add(source_store.get(contact_id), contact_id)
+            copied += 1
+    finally:
+        destination_store.close()
+        source_store.close()
+    return copied
+
+
+def main(argv:list[str]|None = None) -> int:
+    """
+    Command line entry point. Returns the exit code.
+    """
+    parser = argparse.ArgumentParser(prog="python -m phonebook.migrate", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="the data file to copy from, eg .contacts.json")
+    parser.add_argument("destination", help="the data file to copy to, eg contacts.db")
+    parser.add_argument("--batch-size", type=int, default=10000, help="contacts written per commit")
+    args = parser.parse_args(argv)
+
+    try:
+        copied = migrate(args.source, args.destination, args.batch_size)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"Migration failed: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Copied {copied} contacts from {args.source} to {args.destination}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
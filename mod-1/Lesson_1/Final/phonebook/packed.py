@@ -0,0 +1,266 @@
+#! /usr/bin/env python3
+"""
+A compact binary file format for phonebooks, read through `mmap`.
+
+Layout, all numbers little endian:
+
+    header    magic "PBK1", format version, file version, count,
+              amount of records and the offsets of the sections below
+    index     one u32 per contact id number up to the count, holding the
+              position of its record plus one, or 0 for no contact
+    records   one fixed size record per contact: its id number and an
+              (offset, length) reference into the string table per field
+    strings   the UTF-8 text of every field, back to back
+
+Looking up a contact reads one index slot, one record and the strings it
+refers to, so it only touches a few pages of the file however large the
+phonebook is, and opening a file only reads the header.
+"""
+import os
+import sys
+import mmap
+import struct
+from array import array
+from collections.abc import MutableMapping
+from .indexes import contact_sort_key
+
+
+MAGIC:bytes = b"PBK1"
+FORMAT_VERSION:int = 1
+
+# magic, format version, file version, count, records, index/records/strings offsets
+HEADER = struct.Struct("<4sHxxQIIQQQ")
+
+# the fields stored per contact. identifiers are joined by the unit separator
+FIELDS:tuple[str, ...] = ("first_name", "last_name", "phone", "email", "address", "hash_id", "identifiers")
+
+# id number, then (offset, length) per field
+RECORD = struct.Struct("<I" + "II" * len(FIELDS))
+
+SLOT = struct.Struct("<I")
+
+# string offset marking a field that is `None`
+NONE:int = 0xFFFFFFFF
+
+# fields with few distinct values, which are only stored once
+SHARED_FIELDS:frozenset[str] = frozenset(("first_name", "last_name", "hash_id"))
+
+
+class PackedFile:
+    """
+    Read-only view of a packed phonebook file.
+    """
+
+    def __init__(self, location:str) -> None:
+        """
+        ### Parameters
+
+        `location` - The location of the file.
+
+        ### Raises
+
+        `ValueError` - The file is not a packed phonebook.
+        """
+        self.file = open(location, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        # slicing a memoryview doesn't copy, so strings decode straight from the map
+        self.view = memoryview(self.map)
+
+        magic, format_version, self.version, self.count, self.records, \
+            self.index_offset, self.records_offset, self.strings_offset = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"\"{location}\" is not a packed phonebook.")
+
+
+    def position(self, number:int) -> int|None:
+        """
+        Returns the position of the record of a contact id number,
+        or `None` if there is no such contact.
+        """
+        if not 1 <= number <= self.count:
+            return None
+        slot = SLOT.unpack_from(self.map, self.index_offset + SLOT.size * (number - 1))[0]
+        return slot - 1 if slot else None
+
+
+    def read(self, position:int) -> dict:
+        """
+        Returns the data of the contact with the record at a position.
+        """
+        values = RECORD.unpack_from(self.map, self.records_offset + RECORD.size * position)
+        view = self.view
+        strings_offset = self.strings_offset
+
+        data:dict = {}
+        for field, offset, length in zip(FIELDS, values[1::2], values[2::2]):
+            if offset == NONE:
+                data[field] = None
+            else:
+                start = strings_offset + offset
+                data[field] = str(view[start:start + length], "utf-8")
+
+        identifiers = data["identifiers"]
+        data["identifiers"] = identifiers.split("\x1f") if identifiers else None
+        return data
+
+
+    def close(self) -> None:
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+
+def write_packed(location:str, contacts, count:int, version:int) -> int:
+    """
+    Writes a packed phonebook file.
+
+    ### Parameters
+
+    `location` - The location to write to. Overwritten if it exists.
+
+    `contacts` - An iterable of `(contact_id, data)` pairs in id order.
+
+    `count` - The highest contact id number handed out.
+
+    `version` - The version to store in the header.
+
+    ### Returns
+
+    `int` - The amount of contacts written.
+    """
+    index = array("I", bytes(4 * count))
+    records = bytearray()
+    strings = bytearray()
+    shared:dict[str, tuple[int, int]] = {}
+
+    def store(value:str) -> tuple[int, int]:
+        encoded = value.encode()
+        reference = (len(strings), len(encoded))
+        strings.extend(encoded)
+        return reference
+
+    position:int = 0
+    for contact_id, data in contacts:
+        number = contact_sort_key(contact_id)
+        references:list[int] = [number]
+        for field in FIELDS:
+            value = data.get(field)
+            if field == "identifiers":
+                value = "\x1f".join(value) if value else None
+            if value is None:
+                references += (NONE, 0)
+                continue
+            value = str(value)
+            if field in SHARED_FIELDS:
+                reference = shared.get(value)
+                if reference is None:
+                    reference = shared[value] = store(value)
+            else:
+                reference = store(value)
+            references += reference
+
+        records += RECORD.pack(*references)
+        index[number - 1] = position + 1
+        position += 1
+
+    if sys.byteorder == "big":
+        index.byteswap()
+
+    index_offset = HEADER.size
+    records_offset = index_offset + SLOT.size * count
+    strings_offset = records_offset + len(records)
+    with open(location, "wb") as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, version, count, position, index_offset, records_offset, strings_offset))
+        file.write(index.tobytes())
+        file.write(records)
+        file.write(strings)
+    return position
+
+
+class PackedContacts(MutableMapping):
+    """
+    The contacts of a packed file as a dictionary keyed by contact id.
+
+    Contacts are read from the file when asked for. Changes are held on top
+    of the file until it is rewritten.
+    """
+
+    def __init__(self, packed:PackedFile) -> None:
+        self.packed = packed
+        # contacts added or replaced since the file was written
+        self.changed:dict[str, dict] = {}
+        # contacts in the file that have been removed since
+        self.removed:set[str] = set()
+        self.size:int = packed.records
+
+
+    def __getitem__(self, contact_id:str) -> dict:
+        data = self.changed.get(contact_id)
+        if data is not None:
+            return data
+        if contact_id in self.removed:
+            raise KeyError(contact_id)
+        position = self._position(contact_id)
+        if position is None:
+            raise KeyError(contact_id)
+        return self.packed.read(position)
+
+
+    def __contains__(self, contact_id) -> bool:
+        if contact_id in self.changed:
+            return True
+        return contact_id not in self.removed and self._position(contact_id) is not None
+
+
+    def __setitem__(self, contact_id:str, data:dict) -> None:
+        if contact_id not in self:
+            self.size += 1
+        self.changed[contact_id] = data
+        self.removed.discard(contact_id)
+
+
+    def __delitem__(self, contact_id:str) -> None:
+        if contact_id not in self:
+            raise KeyError(contact_id)
+        self.size -= 1
+        self.changed.pop(contact_id, None)
+        if self._position(contact_id) is not None:
+            self.removed.add(contact_id)
+
+
+    def __iter__(self):
+        return self.iter_ids()
+
+
+    def __len__(self) -> int:
+        return self.size
+
+
+    def iter_ids(self, after:int = 0):
+        """
+        Yields the contact ids in id order, starting after an id number.
+        """
+        packed = self.packed
+        changed = self.changed
+        removed = self.removed
+        # contacts added since the file was written are numbered after it
+        newer = sorted(
+            (number, contact_id) for contact_id in changed
+            if (number := contact_sort_key(contact_id)) > packed.count
+        )
+
+        for number in range(after + 1, packed.count + 1):
+            contact_id = f"contact_{number}"
+            if contact_id in changed or (contact_id not in removed and packed.position(number) is not None):
+                yield contact_id
+        for number, contact_id in newer:
+            if number > after:
+                yield contact_id
+
+
+    def _position(self, contact_id) -> int|None:
+        prefix, _, number = str(contact_id).partition("_")
+        if prefix != "contact" or not number.isdigit():
+            return None
+        return self.packed.position(int(number))
@@ -1,21 +1,30 @@
 #! /usr/bin/env python3
 """
 Module containing resources for interacting with a digital form of a phonebook.
+
+`curses`, `tqdm`, the email modules, importing and exporting (`csv`) and
+finding duplicates (`difflib`) are only imported by the features that use
+them, and each storage engine only imports what it needs when it's opened,
+so scripts that only look contacts up start quickly.
 """
 import os
-import ssl
-import json
 import time
-import curses
+import weakref
 import string
 import random
-import smtplib
-from tqdm import tqdm
+import itertools
+import collections
 from colorama import Fore
 from hashlib import sha256
 from getpass import getpass
-from .textpad import Textbox
-from typing import NoReturn
+from functools import lru_cache
+from .storage import WRITE_POLICIES, ContactStore, IDsChangedError, engine_for
+from .indexes import parse_keyword_query
+from .phones import normalize_phone, format_phone
+from typing import NoReturn, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .mail import MailSender
 
 
 class NoIDError(Exception):
@@ -25,62 +34,175 @@ class NoIDError(Exception):
     pass
 
 
+@lru_cache(maxsize=65536)
+def hash_name(first_name:str) -> str:
+    """
+    Returns the sha256 hash id for a first name. Cached, since
+    imports tend to repeat the same first names many times.
+    """
+    return sha256(first_name.encode()).hexdigest()
+
+
+def progress(iterable, description:str):
+    """
+    Wraps an iterable in a green `tqdm` progress bar.
+    """
+    from tqdm import tqdm
+    return tqdm(iterable, description, colour="green")
+
+
 class PhoneBook:
     """
     Phonebook construct for interacting with a digital phonebook.
+
+    The contacts are kept in memory by a storage engine, which is picked
+    from the extension of the data file. Changes are written back to disk
+    according to the write policy.
+
+    Under the `"batched"` and `"on_exit"` policies, another process can hand
+    out the ids of contacts added here before they are written. They are
+    then given new ids, and the next call raises `IDsChangedError` with the
+    new ids. The call can be retried.
     """
 
-    def __init__(self) -> None:
-        pass
+    def __init__(self, write_policy:str = "immediate", batch_size:int = 50, change_log:bool = False) -> None:
+        """
+        ### Parameters
+
+        `write_policy` - How changes are written back to the data file.
+        One of `"immediate"`, `"batched"` or `"on_exit"`.
 
+        `batch_size` - The amount of changes to hold before writing them
+        when using the `"batched"` policy.
 
-    def set_data_file(self, location:str) -> int:
+        `change_log` - Whether to log every change written, so copies of
+        the phonebook can sync with `changes_since` and `apply_changes`.
+        Off by default. Only the changes made while it's on are logged,
+        so a primary copy should always be opened with it.
+
+        ### Raises
+
+        `ValueError` - The write policy is not recognised.
+        """
+        if write_policy not in WRITE_POLICIES:
+            raise ValueError(f"Unknown write policy \"{write_policy}\". Expected one of {WRITE_POLICIES}.")
+
+        self.write_policy = write_policy
+        self.batch_size = batch_size
+        self.change_log = change_log
+
+        self.data_location:str|None = None
+        self.store:ContactStore|None = None
+        # closes the store once this phonebook is garbage collected, or when the
+        # interpreter shuts down, so held back changes are never lost. weak, so
+        # it doesn't keep the phonebook and every contact alive until exit
+        self.closer:weakref.finalize|None = None
+
+
+    def set_data_file(self, location:str, engine:type[ContactStore]|None = None) -> int:
         """
         Sets the location of the data file. Will create a data file
         if needed.
 
         ### Parameters
 
-        `location` - The location to create the file. Must end in `.json`.
+        `location` - The location to create the file. The extension selects
+        the storage engine: `.json` for a single JSON document, `.journal`
+        for an append-only journal, `.pbk` for a compact memory mapped file
+        or `.db`/`.sqlite` for a SQLite database.
+
+        `engine` - A storage engine to use instead of the one selected by
+        the extension. Optional.
 
         ### Returns
 
-        `int` - The return status of the function. If the file does not end 
-        in `.json`, the return code will be `-1. Otherwise, it will be 0.
+        `int` - The return status of the function. If no storage engine
+        handles the file extension, the return code will be `-1`. Otherwise, it will be 0.
         """
 
-        if not location.endswith(".json"):
+        if engine is None:
+            engine = engine_for(location)
+        if engine is None:
             return -1
 
+        # write out anything still held for the previous file
+        self.close()
+
         # assign internal data
         self.data_location = location
+        self.store = engine(location, self.write_policy, self.batch_size, change_log=self.change_log)
+        self.closer = weakref.finalize(self, self.store.close)
 
         # create file if it doesn't exist
-        if not os.path.exists(self.data_location):
-            with open(os.path.abspath(self.data_location), "w") as file:
+        self.store.open()
+        return 0
+
 
-                # constructing a base
-                tmp = {
-                    "contacts" : {
+    def flush(self) -> int:
+        """
+        Writes any changes held in memory to the data file.
+        Requires no parameters.
 
-                    },
-                    "count": 0
-                }
+        ### Returns
 
-                json.dump(tmp, file, indent=4),
+        `int` - The amount of changes written.
 
+        ### Raises
+
+        `IDsChangedError` - Contacts added since the last write had to be
+        given new ids, as another process wrote to the data file first.
+        Its `renumbered` maps the ids `add_contact` returned to the new ones.
+        """
+        if self.store is None:
+            return 0
+        return self.store.flush()
+
+
+    def close(self) -> None:
+        """
+        Writes any changes held in memory and closes the data file, along
+        with its lock and database connection. Requires no parameters.
+        `set_data_file` has to be called again before the phonebook is used.
+        """
+        try:
+            if self.closer is not None:
+                self.closer()
+        finally:
+            self.closer = None
+            self.store = None
+            self.data_location = None
+
+
+    def compact(self) -> int:
+        """
+        Cleans up after removed contacts, which are only marked as
+        removed to keep removal fast. Requires no parameters.
+
+        ### Returns
+
+        `int` - A return code of 0.
+        """
+        self.store.compact()
         return 0
 
 
+    def version(self) -> int:
+        """
+        Returns the version of the data file, which goes up every time
+        changes are written to it, by this or any other process.
+        Requires no parameters.
+        """
+        self.store.refresh()
+        return self.store.version()
+
+
     def get_all_contact_ids(self):
         """
         Returns a list of all contact ids.
         Requires no parameters.
         """
-        with open(self.data_location, "r") as file:
-            data:dict = json.load(file)
-
-        available_ids = list(data["contacts"].keys())
+        self.store.refresh()
+        available_ids = self.store.ids()
         return available_ids
 
 
@@ -99,15 +221,65 @@ class PhoneBook:
         `int` - Indicates that given contact ID does not exist.
         """
 
-        # load data and return
-        with open(self.data_location, "r") as file:
-            data = json.load(file)
+        self.store.refresh()
+        data = self.store.get(contact_id)
 
         # check that ID exists
-        if data["contacts"].get(contact_id) is None:
+        if data is None:
             return -1
-        
-        return data["contacts"][contact_id]
+
+        return data
+
+
+    def iter_contacts(self, offset:int = 0, limit:int|None = None):
+        """
+        Yields contacts one at a time, in the order they were added.
+
+        ### Parameters
+
+        `offset` - The amount of contacts to skip.
+
+        `limit` - The most contacts to yield. `None` yields every contact.
+
+        ### Returns
+
+        `Generator` - `(contact_id, data)` pairs.
+        """
+        self.store.refresh()
+        for contact_id, data in itertools.islice(self.store.iter_items(offset), limit):
+            yield contact_id, dict(data)
+
+
+    def page_contacts(self, cursor:str|None = None, limit:int = 20) -> tuple[list, str|None]:
+        """
+        Returns a page of contacts. Pass the returned cursor back in to get
+        the next page. Unlike an offset, a cursor keeps its place when
+        contacts are added or removed between pages, and finding it doesn't
+        get slower further into the phonebook.
+
+        ### Parameters
+
+        `cursor` - The cursor returned with the previous page. `None` starts
+        from the first contact.
+
+        `limit` - The most contacts on the page.
+
+        ### Returns
+
+        `tuple` - A list of `(contact_id, data)` pairs and the cursor for the
+        next page, or `None` if this is the last page.
+        """
+        self.store.refresh()
+        page:list = [
+            (contact_id, dict(data))
+            for contact_id, data in itertools.islice(self.store.iter_items(after=cursor), limit + 1)
+        ]
+
+        # the extra contact only tells us whether there's another page
+        if len(page) > limit:
+            page = page[:limit]
+            return page, page[-1][0]
+        return page, None
 
 
     def lookup_contact(self, name:str) -> list|None:
@@ -132,27 +304,155 @@ class PhoneBook:
         if last_name == first_name:
             last_name = None
 
-        # load file and search
-        with open(self.data_location, "r") as file:
-            contents:dict = json.load(file)
+        self.store.refresh()
+        possible_contacts:list = self.store.lookup_name(first_name, last_name)
+
+        if len(possible_contacts) == 0:
+            return None
         
-        contacts = list(contents["contacts"].keys())
-        possible_contacts:list = []
+        else:
+            return possible_contacts
 
-        for contact in contacts:
-            if contents["contacts"][contact]["first_name"] == first_name:
-                possible_contacts.append(str(contact))
-            
-            elif contents["contacts"][contact]["last_name"] == last_name:
-                possible_contacts.append(str(contact))
+
+    def prefix_search(self, prefix:str, limit:int|None = 10) -> list|None:
+        """
+        Looks up contacts whose full name or last name starts with
+        a prefix, ignoring case.
+
+        ### Parameters
+
+        `prefix` - The start of the name to search for.
+
+        `limit` - The most contacts to return. `None` returns every match.
+
+        ### Returns
+
+        `list` - Matching contacts, in name order.
+
+        `None` - No Contact found.
+        """
+        self.store.refresh()
+        possible_contacts:list = list(itertools.islice(self.store.iter_prefix(prefix), limit))
 
         if len(possible_contacts) == 0:
             return None
-        
+
         else:
             return possible_contacts
 
 
+    def fuzzy_search(self, name:str, limit:int|None = 10, max_distance:int|None = None) -> list|None:
+        """
+        Looks up contacts with names spelled or sounding like the given
+        name, so `Jon Smyth` finds `John Smith`.
+
+        ### Parameters
+
+        `name` - The name to search for.
+
+        `limit` - The most contacts to return. `None` returns every match.
+
+        `max_distance` - The most typos a name can be away from the search.
+        By default 1 for short names and 2 for longer ones.
+
+        ### Returns
+
+        `list` - Matching contacts, best matches first.
+
+        `None` - No Contact found.
+        """
+        self.store.refresh()
+        possible_contacts:list = self.store.fuzzy_search(name, max_distance)[:limit]
+
+        if len(possible_contacts) == 0:
+            return None
+
+        else:
+            return possible_contacts
+
+
+    def reverse_lookup(self, phone:str|int) -> list|None:
+        """
+        Looks up the contacts with a phone number, like caller ID.
+
+        ### Parameters
+
+        `phone` - The phone number, in any format. `(555) 123-4567`,
+        `555.123.4567` and `+1 555 123 4567` are the same number.
+
+        ### Returns
+
+        `list` - The contacts with the number, oldest first.
+
+        `None` - No Contact found.
+        """
+        self.store.refresh()
+        possible_contacts:list = self.store.lookup_phone(phone)
+
+        if len(possible_contacts) == 0:
+            return None
+
+        else:
+            return possible_contacts
+
+
+    def reverse_lookup_many(self, phones, chunk_size:int = 1000):
+        """
+        Looks up the contacts for many phone numbers, eg every row of a
+        call log. Numbers are looked up a chunk at a time, so the numbers
+        can be streamed from a file of any size.
+
+        ### Parameters
+
+        `phones` - An iterable of phone numbers, in any format.
+
+        `chunk_size` - The amount of numbers to look up at once.
+
+        ### Returns
+
+        `generator` - Yields a `(phone, contact_ids)` pair for every number,
+        in the order they were given. `contact_ids` is empty for numbers
+        that don't belong to any contact.
+        """
+        self.store.refresh()
+        phones = iter(phones)
+
+        while chunk := list(itertools.islice(phones, chunk_size)):
+            canonical = [normalize_phone(phone) for phone in chunk]
+            # call logs repeat numbers a lot, so each is only looked up once
+            matches = self.store.lookup_phones(list({phone for phone in canonical if phone is not None}))
+            for phone, digits in zip(chunk, canonical):
+                yield phone, matches.get(digits, [])
+
+
+    def autocomplete(self, prefix:str, limit:int = 10) -> list[str]:
+        """
+        Suggests names that complete a prefix.
+
+        ### Parameters
+
+        `prefix` - The start of the name typed so far.
+
+        `limit` - The most suggestions to return.
+
+        ### Returns
+
+        `list[str]` - Distinct contact names starting with the prefix, in name order.
+        """
+        self.store.refresh()
+        suggestions:list[str] = []
+
+        for contact_id in self.store.iter_prefix(prefix):
+            if len(suggestions) == limit:
+                break
+            data = self.store.get(contact_id)
+            name = " ".join(part for part in (data["first_name"], data["last_name"]) if part)
+            if name not in suggestions:
+                suggestions.append(name)
+
+        return suggestions
+
+
     def add_contact(
         self,
         name:str,
@@ -160,7 +460,7 @@ class PhoneBook:
         email:str|None,
         address:str|None,
         identifiers:list|None
-        ) -> int|NoIDError:
+        ) -> str:
         """
         Adds a Contact to the contacts list. At least one form of contact
         id is required.
@@ -180,7 +480,9 @@ class PhoneBook:
 
         ### Returns
 
-        `int` - The Contact was added successfully.
+        `str` - The contact id of the new contact, which stays the same
+        until the contact is removed. This used to be a return code of `0`,
+        so callers checking for `0` need to check for an id instead.
 
         ### Raises
 
@@ -188,23 +490,145 @@ class PhoneBook:
         contact ID.
         """
 
+        data:dict = self._build_contact(name, phone, email, address, identifiers)
+
+        self.store.refresh()
+
+        # the store gives it the next contact id and writes it back
+        return self.store.add(data)
+
+
+    def bulk_add(self, records, chunk_size:int = 10000, skip_invalid:bool = False) -> int:
+        """
+        Adds many contacts at once. The records are consumed lazily in
+        chunks and each chunk is written back to the data file once.
+
+        ### Parameters
+
+        `records` - An iterable of dictionaries with the keys `name`, `phone`,
+        `email`, `address` and `identifiers`, as taken by `add_contact`.
+
+        `chunk_size` - The amount of contacts added per write.
+
+        `skip_invalid` - Whether to skip records without a phone number or
+        email address instead of raising.
+
+        ### Returns
+
+        `int` - The amount of contacts added.
+
+        ### Raises
+
+        `NoIDError` - A record did not contain a valid form of contact ID.
+        Contacts from earlier chunks have already been added.
+        """
+        self.store.refresh()
+        records = iter(records)
+        added:int = 0
+
+        while True:
+            chunk = list(itertools.islice(records, max(1, chunk_size)))
+            if not chunk:
+                return added
+
+            with self.store.batch():
+                for record in chunk:
+                    try:
+                        data = self._build_contact(
+                            record.get("name") or "",
+                            record.get("phone"),
+                            record.get("email"),
+                            record.get("address"),
+                            record.get("identifiers"),
+                        )
+                    except NoIDError:
+                        if skip_invalid:
+                            continue
+                        raise
+                    self.store.add(data)
+                    added += 1
+
+
+    def bulk_import(self, location:str, file_format:str|None = None, chunk_size:int = 10000, skip_invalid:bool = False) -> int:
+        """
+        Adds every contact in a CSV, JSON Lines or vCard file.
+        The file is streamed, so it is never held in memory whole.
+
+        ### Parameters
+
+        `location` - The file to import.
+
+        `file_format` - `"csv"`, `"jsonl"` or `"vcard"`. Worked out from the
+        file extension if not given.
+
+        `chunk_size` - See `bulk_add`.
+
+        `skip_invalid` - See `bulk_add`.
+
+        ### Returns
+
+        `int` - The amount of contacts added.
+        """
+        from .transfer import detect_format, read_records
+
+        if file_format is None:
+            file_format = detect_format(location)
+
+        with open(location, "r", newline="", encoding="utf-8") as file:
+            return self.bulk_add(read_records(file, file_format), chunk_size, skip_invalid)
+
+
+    def export(self, location:str, file_format:str|None = None) -> int:
+        """
+        Writes every contact to a CSV, JSON Lines or vCard file,
+        one contact at a time.
+
+        ### Parameters
+
+        `location` - The file to write to. Will be overwritten.
+
+        `file_format` - `"csv"`, `"jsonl"` or `"vcard"`. Worked out from the
+        file extension if not given.
+
+        ### Returns
+
+        `int` - The amount of contacts written.
+        """
+        from .transfer import detect_format, write_records
+
+        if file_format is None:
+            file_format = detect_format(location)
+
+        self.store.refresh()
+        with open(location, "w", newline="", encoding="utf-8") as file:
+            return write_records(file, file_format, self.store.iter_items())
+
+
+    def _build_contact(
+        self,
+        name:str,
+        phone:str|int|None,
+        email:str|None,
+        address:str|None,
+        identifiers:list|None
+        ) -> dict:
+        """
+        Builds the stored data for a new contact. Takes the same
+        parameters as `add_contact`.
+
+        ### Raises
+
+        `NoIDError` - No phone number or email address was given.
+        """
+
+        # stored as digits only, however it was typed, so the same number
+        # always looks the same. see `format_phone` for showing it
+        phone = normalize_phone(phone)
+
         # checking that we have some form of id
         if phone is None and email is None:
             raise NoIDError("No ID Found.")
 
-        # encoding everything to string
-        # also handling pure int so its more readable
-        if isinstance(phone, int):
-            tmp:list = []
-            phone = str(phone)
-            tmp.append(phone[0:3])
-            tmp.append("-")
-            tmp.append(phone[3:6])
-            tmp.append("-")
-            tmp.append(phone[6:])
-            phone = "".join(tmp)
-            pass
-
         # dealing with names
         name_list = name.split(" ")
         first_name:str = name_list[0]
@@ -216,20 +640,10 @@ class PhoneBook:
         # generate a hash for id
         # aggregating data
         data:str = first_name
-        hash_id = sha256(data.encode()).hexdigest()
-
-
-        with open(self.data_location, "r") as file:
-            contents = json.load(file)
-
-        # create new key name and increment count
-        current_count = contents["count"]
-        contact_key_name = f"contact_{current_count+1}"
-        contents["count"] += 1
+        hash_id = hash_name(data)
 
 
-        # instantiate the new object
-        contents["contacts"][contact_key_name] = {
+        return {
             "first_name" : first_name,
             "last_name" : last_name,
             "phone" : phone,
@@ -239,17 +653,110 @@ class PhoneBook:
             "hash_id":hash_id
         }
 
-        # dumping data to file
-        with open(self.data_location, "w") as file:
-            json.dump(contents, file, indent=4)
 
+    def edit_contact(
+        self,
+        contact_id:str,
+        name:str,
+        phone:str|int|None,
+        email:str|None,
+        address:str|None,
+        identifiers:list|None
+        ) -> int:
+        """
+        Replaces the details of a contact, keeping its contact id.
+        Takes the same details as `add_contact`, so pass the current
+        values of the details that stay the same.
 
-        return 0
+        ### Parameters
+
+        `contact_id` - The contact id of the contact to change.
+
+        The other parameters are the new details, see `add_contact`.
+
+        ### Returns
+
+        `int` - Exit code of this method. -1 if the given ID
+        does not exist, otherwise 0.
+
+        ### Raises
+
+        `NoIDError` - The new details don't contain a phone number or email.
+        """
+        data:dict = self._build_contact(name, phone, email, address, identifiers)
+
+        self.store.refresh()
+        return self.store.edit(contact_id, data)
+
+
+    def change_seq(self) -> int:
+        """
+        Returns the sequence number of the last change in the change log.
+        A copy that has applied the changes up to this number is up to date.
+        Requires no parameters.
+
+        ### Raises
+
+        `ValueError` - The phonebook keeps no change log.
+        """
+        return self.store.change_seq()
+
+
+    def changes_since(self, seq:int = 0, limit:int|None = None) -> list[dict]:
+        """
+        Returns the changes made after a sequence number, to bring a
+        copy of the phonebook up to date with `apply_changes`.
+
+        ### Parameters
+
+        `seq` - The sequence number of the last change the copy applied.
+        0 returns every change.
+
+        `limit` - The most changes to return. `None` returns them all.
+
+        ### Returns
+
+        `list[dict]` - The changes, oldest first. Each has the `seq`, the
+        `op` (`"add"`, `"edit"` or `"remove"`), the contact `id` and, unless
+        it was removed, the contact `data`.
+
+        ### Raises
+
+        `ValueError` - The phonebook keeps no change log.
+        """
+        # changes held back by the write policy aren't logged until written
+        self.flush()
+        return self.store.changes_since(seq, limit)
+
+
+    def apply_changes(self, batch:list[dict]) -> int:
+        """
+        Applies changes from another copy of the phonebook, as returned by
+        its `changes_since`. Contacts keep the ids they have in the other
+        copy, so changes should only flow one way, from the copy contacts
+        are added to. A batch can safely be applied again.
+
+        ### Parameters
+
+        `batch` - The changes, oldest first.
+
+        ### Returns
+
+        `int` - The sequence number of the last change applied, to pass
+        to `changes_since` next time. 0 if the batch is empty.
+        """
+        seq:int = 0
+        with self.store.batch():
+            for change in batch:
+                self.store.apply_change(change)
+                seq = change["seq"]
+        return seq
 
 
     def remove_contact(self, contact_id:str) -> int:
         """
-        Removes a contact from the contact list.
+        Removes a contact from the contact list. The ids of the
+        other contacts stay the same.
 
         ### Parameters
 
@@ -261,31 +768,57 @@ class PhoneBook:
         `int` - Exit code of this method. -1 if the given ID 
         does not exist, otherwise 0.
         """
-        # loading contacts
+        self.store.refresh()
+        return self.store.remove(contact_id)
 
-        with open(self.data_location, "r") as file:
-            data:dict = json.load(file)
 
-        if data["contacts"].get(contact_id) is None:
-            return -1
-        new_instance = {
-            "contacts":{
+    def find_duplicates(self, threshold:float = 0.8) -> list[list[str]]:
+        """
+        Finds contacts that look like the same person, going by their
+        phone, email and name. See `phonebook.dedup`.
 
-            },
-            "count": 0
-        }
+        ### Parameters
 
-        contacts_list = list(data["contacts"].keys())
-        for contact in contacts_list:
-            if contact != contact_id:
-                new_instance_keyname = f"contact_{new_instance['count']+1}"
-                new_instance["contacts"][new_instance_keyname] = data["contacts"][contact]
-                new_instance["count"] += 1
+        `threshold` - How similar the names of contacts sharing a phone
+        or email need to be, from 0 to 1.
+
+        ### Returns
+
+        `list[list[str]]` - Groups of duplicate contact ids, oldest first.
+        """
+        from . import dedup
+
+        self.store.refresh()
+        return dedup.find_duplicates(self.store.iter_items(), self.store.get, threshold=threshold)
 
-        with open(self.data_location, "w") as file:
-            json.dump(new_instance, file, indent=4)
-        
-        return 0
+
+    def merge_duplicates(self, threshold:float = 0.8) -> dict[str, list[str]]:
+        """
+        Merges every group of duplicate contacts into its oldest contact,
+        which keeps its id. Missing details are filled in from the
+        duplicates and their identifiers are combined.
+
+        ### Parameters
+
+        `threshold` - See `find_duplicates`.
+
+        ### Returns
+
+        `dict` - The ids of the merged duplicates, by the id they were merged into.
+        """
+        from .dedup import merge_contacts
+
+        groups = self.find_duplicates(threshold)
+
+        with self.store.batch():
+            for group in groups:
+                merged = merge_contacts([self.store.get(contact_id) for contact_id in group])
+                # kept under the same id, so anything referring to it stays valid
+                self.store.edit(group[0], merged)
+                for contact_id in group[1:]:
+                    self.store.remove(contact_id)
+
+        return {group[0]: group[1:] for group in groups}
 
 
     def find_contact_lists(self, identifers:list[str]) -> list|None:
@@ -298,34 +831,58 @@ class PhoneBook:
 
         ### Returns
 
-        `list` - A list of possible contacts fitting the keyword constraints.
+        `list` - A list of possible contacts fitting the keyword constraints,
+        without duplicates. Contacts matching more keywords come first.
 
         `None` - No contacts found.
         """
-        
-        # loading content
-        with open(self.data_location, "r") as file:
-            contacts:dict = json.load(file)
+        return self.search_keywords(any_of=identifers)
 
-        targets:list = []
 
-        for _ in contacts["contacts"]:
-            for identifier in identifers:
-                if contacts["contacts"][_]["identifiers"] is None:
-                    continue
-                if identifier in contacts["contacts"][_]["identifiers"]:
-                    targets.append(_)
-        
+    def search_keywords(self, all_of:list[str] = (), any_of:list[str] = (), none_of:list[str] = ()) -> list|None:
+        """
+        Searches contacts with a keyword query.
+
+        ### Parameters
+
+        `all_of` - Keywords a contact must have every one of.
+
+        `any_of` - Keywords a contact must have at least one of, if
+        `all_of` is empty. Always used for ranking.
+
+        `none_of` - Keywords a contact must not have.
+
+        ### Returns
+
+        `list` - The matching contacts without duplicates. Contacts matching
+        more keywords come first.
+
+        `None` - No contacts found.
+        """
+        self.store.refresh()
+        targets:list = self.store.query_identifiers(all_of, any_of, none_of)
+
         if len(targets) == 0:
             return None
-        
+
         else:
             return targets
 
 
-    def send_email(self, sender_email:str, reciever_emails:str|list[str], subject_header:str, contents:str, sender_password:str) -> int:
+    def send_email(
+        self,
+        sender_email:str,
+        reciever_emails:str|list[str],
+        subject_header:str,
+        contents:str,
+        sender_password:str,
+        host:str = "smtp.gmail.com",
+        port:int = 465,
+        use_ssl:bool = True
+    ) -> int:
         """
-        Sends an email to a given reciever.
+        Sends an email to a given reciever. To send many emails, use a
+        `MailSender` from `phonebook.mail`, which keeps its connections open.
 
         ### Parameters
 
@@ -336,33 +893,146 @@ class PhoneBook:
         `subject_header` - The subject header of the email.
 
         `contents` - The contents of the email to send.
+
+        `sender_password` - The password of the sender's email account.
+
+        `host` - The SMTP server to send through.
+
+        `port` - The port of the SMTP server.
+
+        `use_ssl` - Whether to connect to the server with SSL.
+
+        ### Returns
+
+        `int` - 0 if the email was sent, -1 if logging in failed.
         """
-        # creating context and opening default port for ssl
-        port:int = 465
-        
-        context = ssl.create_default_context()
+        import smtplib
+        from .mail import MailSender, build_message
 
-        # catching possible authentication error
-        try:
-            # instantiating connection
-            with smtplib.SMTP_SSL("smtp.gmail.com", port, context) as server:
-                # login
-                server.login(sender_email, sender_password)
+        message = build_message(sender_email, reciever_emails, subject_header, contents)
 
-                # construct and send
-                message = f"""\
-                Subject: {subject_header}
+        with MailSender(host, port, sender_email, sender_password, use_ssl, concurrency=1) as sender:
+            # catching possible authentication error
+            try:
+                sender.send(message)
+            except smtplib.SMTPAuthenticationError:
+                return -1
 
-                {contents}
-                """
+        return 0
 
-                server.sendmail(sender_email, reciever_emails, message)
 
+    def _iter_recipients(self, identifiers:list[str]|None, names:list[str]|None):
+        """
+        Yields the id and data of every contact with any of the keywords or
+        names, once each, running each search only when it's reached.
 
-                return 0
-        # auth error
-        except smtplib.SMTPAuthenticationError:
-            return -1
+        Contacts are deduplicated by checking what found them instead of
+        remembering every id yielded, so memory doesn't grow with the amount
+        of recipients. The keyword search is already a set union.
+        """
+        wanted:set[str] = set(identifiers or ())
+        if wanted:
+            for contact_id in self.find_contact_lists(list(wanted)) or ():
+                data = self.store.get(contact_id)
+                if data is not None:
+                    yield contact_id, data
+
+        # (first name, last name) of the names already searched
+        searched:list[tuple] = []
+        for name in dict.fromkeys(names or ()):
+            first_name, last_name = name.split(" ")[0], name.split(" ")[-1]
+            if last_name == first_name:
+                last_name = None
+
+            for contact_id in self.lookup_contact(name) or ():
+                data = self.store.get(contact_id)
+                if data is None or wanted.intersection(data["identifiers"] or ()):
+                    continue
+                # found by an earlier name
+                if any(
+                    data["first_name"] == first or (last is not None and data["last_name"] == last)
+                    for first, last in searched
+                ):
+                    continue
+                yield contact_id, data
+
+            searched.append((first_name, last_name))
+
+
+    def mail_merge(
+        self,
+        sender:"MailSender",
+        sender_email:str,
+        subject_template:str,
+        body_template:str,
+        identifiers:list[str]|None = None,
+        names:list[str]|None = None,
+        batch_size:int = 100
+    ) -> dict:
+        """
+        Emails every contact found by keywords or names, filling in the
+        subject and body templates for each contact (see `render_template`).
+
+        Contacts are read, rendered and handed to the sender one at a time,
+        and at most `batch_size` emails are in flight at once, so memory use
+        doesn't grow with the amount of recipients.
+
+        ### Parameters
+
+        `sender` - The `MailSender` to deliver the emails with.
+
+        `sender_email` - The email the messages are sent from.
+
+        `subject_template` - The subject header, eg `"News for $first_name"`.
+
+        `body_template` - The body of the email, eg `"Hi $name, ..."`.
+
+        `identifiers` - Email the contacts with any of these keywords.
+        Searched with `find_contact_lists`.
+
+        `names` - Email the contacts with these names. Searched with `lookup_contact`.
+
+        `batch_size` - The most emails waiting to be delivered at once.
+
+        ### Returns
+
+        `dict` - The amount of emails `"sent"`, the amount of contacts
+        `"skipped"` for having no email, and the contacts that `"failed"`
+        mapped to the error.
+        """
+        from .mail import build_message, render_template
+
+        report:dict = {"sent": 0, "skipped": 0, "failed": {}}
+
+        def settle(contact_id:str, future) -> None:
+            error = future.exception()
+            if error is None:
+                report["sent"] += 1
+            else:
+                report["failed"][contact_id] = f"{type(error).__name__}: {error}"
+
+        in_flight:collections.deque = collections.deque()
+        for contact_id, data in self._iter_recipients(identifiers, names):
+            if not data["email"]:
+                report["skipped"] += 1
+                continue
+
+            message = build_message(
+                sender_email,
+                data["email"],
+                render_template(subject_template, contact_id, data),
+                render_template(body_template, contact_id, data)
+            )
+            in_flight.append((contact_id, sender.submit(message)))
+
+            # wait on the oldest email before rendering any more
+            if len(in_flight) >= batch_size:
+                settle(*in_flight.popleft())
+
+        while in_flight:
+            settle(*in_flight.popleft())
+
+        return report
 
 
 class Wrapper(PhoneBook):
@@ -373,7 +1043,7 @@ class Wrapper(PhoneBook):
         self.set_data_file(".contacts.json")
 
 
-    def prettify_contact_dictionary(self, contact_id) -> str:
+    def prettify_contact_dictionary(self, contact_id, data:dict|None = None) -> str:
         """
         Formats data to a more human friendly type.
 
@@ -382,13 +1052,16 @@ class Wrapper(PhoneBook):
         `contact_id` - the contact id of the contact as seen in the json file.
         Ie: contact_1, etc
 
+        `data` - The contact's data, if already fetched. Optional.
+
         ### Returns
         
         `str` - A formatted string containing the data in the contact.
         """
 
         # get data
-        data = self.get_contact_data(contact_id)
+        if data is None:
+            data = self.get_contact_data(contact_id)
 
         # list all keys
         key_list:list = list(data.keys())
@@ -405,7 +1078,7 @@ class Wrapper(PhoneBook):
         # format data
         # spaces are for the Fore colored text.
         formatted_data = (f'Name: { data["first_name"] } {data["last_name"]}\n'
-        f' Phone Number: {data["phone"]}\n'
+        f' Phone Number: {format_phone(data["phone"])}\n'
         f' Email Address: {data["email"]}\n'
         f' Street Address: {data["address"]}\n'
         f' Contact ID: {contact_id}'
@@ -417,9 +1090,16 @@ class Wrapper(PhoneBook):
 class CLI(Wrapper):
 
 
-    def __init__(self) -> None:
+    def __init__(self, animations:bool = True) -> None:
+        """
+        ### Parameters
+
+        `animations` - Whether to show the progress bars and pauses
+        between menu options.
+        """
         # inherit
         super().__init__()
+        self.animations = animations
 
 
     def system_clear(self):
@@ -430,6 +1110,22 @@ class CLI(Wrapper):
         os.system("cls" if os.name == "nt" else "clear")
 
 
+    def animate(self, description:str, steps:int = 25) -> None:
+        """
+        Shows a progress bar that fills up at random, if animations are on.
+
+        ### Parameters
+
+        `description` - The text shown next to the progress bar.
+
+        `steps` - The amount of steps in the progress bar.
+        """
+        if not self.animations:
+            return
+        for i in progress(range(steps), description):
+            time.sleep(random.random() * 0.1)
+
+
     def add_contact_dialog(self) -> int:
         """
         The CLI Dialog required to add a contact to the phonebook.
@@ -445,12 +1141,10 @@ class CLI(Wrapper):
         print(Fore.GREEN, "What is the phone number of the new contact? (press enter to leave blank)")
         phone_number:str = input(" ").strip(" ")
         
-        # phone number conversion
+        # any format is fine, the number is normalized when stored
         if phone_number == "":
             phone_number = None
-        if "-" not in phone_number:
-            phone_number = int(phone_number)
-        
+
         # email
         self.system_clear()
         print(Fore.GREEN, "What is the email address of the new contact? (press enter to leave blank)")
@@ -496,11 +1190,10 @@ class CLI(Wrapper):
 
 
         self.system_clear()
-        for i in tqdm(range(25), "Adding Contact", colour="green"):
-            time.sleep(random.random() * 0.1)
+        self.animate("Adding Contact")
         
         try:
-            self.add_contact(
+            contact_id:str = self.add_contact(
                 name,
                 phone_number,
                 email,
@@ -513,7 +1206,7 @@ class CLI(Wrapper):
             input(" ")
             return 0
 
-        print(Fore.GREEN, "Contact Added.")
+        print(Fore.GREEN, f"Contact Added as {contact_id}.")
         print(Fore.GREEN, "Click Enter to Continue.")
         input(" ")
         return 0
@@ -548,8 +1241,7 @@ class CLI(Wrapper):
         self.system_clear()
 
         # make it seem like we are doing something
-        for i in tqdm(range(25), "Removing Contact", colour="green"):
-            time.sleep(random.random() * 0.1)
+        self.animate("Removing Contact")
         
         # remove
         self.remove_contact(contact_id)
@@ -566,18 +1258,67 @@ class CLI(Wrapper):
         CLI Dialog for searching contacts based on names.
         Requires no Parameters and always returns `0`.
         """
+
+        def live_search(stdscr) -> str:
+            """
+            Shows the contacts matching the name as it is typed.
+            Returns the name once Enter is pressed.
+            """
+            name:str = ""
+            while True:
+                stdscr.erase()
+                height, width = stdscr.getmaxyx()
+                stdscr.addstr(0, 0, "Please enter the Name you wish to search for. Press Enter when done."[:width-1])
+                stdscr.addstr(1, 0, f" {name}"[:width-1])
+
+                # the prefix search only touches the rows it shows
+                for row, contact_id in enumerate(self.prefix_search(name, max(height-3, 0)) or [], start=3):
+                    data = self.get_contact_data(contact_id)
+                    stdscr.addstr(row, 0, f" {data['first_name']} {data['last_name'] or ''} ({contact_id})"[:width-1])
+                stdscr.move(1, min(len(name)+1, width-1))
+                stdscr.refresh()
+
+                key = stdscr.get_wch()
+                if key in ("\n", "\r", curses.KEY_ENTER):
+                    return name
+                elif key in ("\b", "\x7f", curses.KEY_BACKSPACE):
+                    name = name[:-1]
+                elif isinstance(key, str) and key.isprintable():
+                    name += key
+
         self.system_clear()
-        # get name
-        print(Fore.GREEN, "Please enter the Name you you wish to search for.")
-        name:str = input(" ")
+
+        # get name, showing matches as the user types.
+        # falls back to plain input if curses isn't installed (eg windows
+        # without windows-curses) or the terminal can't run it.
+        name:str|None = None
+        try:
+            import curses
+            name = curses.wrapper(live_search)
+        except ImportError:
+            pass
+        except curses.error:
+            pass
+        if name is None:
+            print(Fore.GREEN, "Please enter the Name you you wish to search for.")
+            name = input(" ")
         self.system_clear()
 
-        # make it seem like we are searching hard
-        for i in tqdm(range(25), "Searching...", colour="green"):
-            time.sleep(random.random() * 0.1)
+        # an empty name would match the whole book, so take it as cancelling
+        if not name.strip():
+            print(Fore.GREEN, "Cancelled.")
+            print(Fore.GREEN, "Press Enter to Continue.")
+            input(" ")
+            return 0
 
         # do the search
-        found:list|None = self.lookup_contact(name)
+        found:list|None = self.prefix_search(name, None)
+
+        # nothing starts with that, so look for names that are close
+        if found is None:
+            found = self.fuzzy_search(name)
+            if found is not None:
+                print(Fore.GREEN, f"No exact matches for \"{name}\". Showing similar names.")
 
         # none found
         if found is None:
@@ -602,10 +1343,11 @@ class CLI(Wrapper):
         return 0
 
 
-    def send_email_dialog(self) -> None:
+    def compose_email(self) -> str:
         """
-        CLI Dialog needed to send an email.
-        Requires no parameters and always returns `None`.
+        CLI Dialog for writing the body of an email. Uses the curses editor,
+        or a line by line editor if curses fails.
+        Requires no parameters and returns the body as a string.
         """
 
         # Curses email editor.
@@ -614,6 +1356,9 @@ class CLI(Wrapper):
             """
             Minimalist Email Editor for sending an email.
             """
+            import curses
+            from .textpad import Textbox
+
             # try for error catching and returning terminal to defaults
             try:
                 # creating a mainwindow for the header message
@@ -682,7 +1427,24 @@ class CLI(Wrapper):
             # return input
             return "".join(lines)
 
+        # make it look like we're actually doing something
+        self.animate("Booting Email Editor...")
         
+        # boot it
+        try:
+            return email_editor()
+        except:
+            self.system_clear()
+            print(Fore.RED, "EMAIL BOOT FAILED.")
+            print(Fore.RED, "USING ALPHA EMAIL EDITOR...")
+            return email_editor_alpha()
+
+
+    def send_email_dialog(self) -> None:
+        """
+        CLI Dialog needed to send an email.
+        Requires no parameters and always returns `None`.
+        """
         # clear after everything
         self.system_clear()
 
@@ -709,19 +1471,8 @@ class CLI(Wrapper):
         # using the curses editor because you can edit input after hitting enter.
         self.system_clear()
 
-        # make it look like we're actually doing something
-        for i in tqdm(range(25), "Booting Email Editor...", colour="green"):
-            time.sleep(random.random() * 0.1)
-        
-        # boot it
-        try:
-            subject_content:str = email_editor()
-        except:
-            self.system_clear()
-            print(Fore.RED, "EMAIL BOOT FAILED.")
-            print(Fore.RED, "USING ALPHA EMAIL EDITOR...")
-            subject_content = email_editor_alpha()
-            pass
+        subject_content:str = self.compose_email()
+
         # confirm with user
         self.system_clear()
         print(Fore.GREEN, "Are you sure you want to send this email? [Y/N]")
@@ -738,8 +1489,7 @@ class CLI(Wrapper):
         # clear
         self.system_clear()
         # make it look like something is happening.
-        for i in tqdm(range(25), "Sending Email", colour="green"):
-            time.sleep(random.random() * 0.1)
+        self.animate("Sending Email")
 
         # try to send the email. Catch server errors.
         try:
@@ -762,6 +1512,70 @@ class CLI(Wrapper):
             return
 
 
+    def mail_merge_dialog(self) -> None:
+        """
+        CLI Dialog to email every contact with some keywords, filling
+        in the email for each contact.
+        Requires no parameters and always returns `None`.
+        """
+        from .mail import MailSender
+
+        self.system_clear()
+
+        # get sender email
+        print(Fore.GREEN, "What is your email?")
+        sender_email:str = input(" ")
+
+        # get sender password
+        self.system_clear()
+        print(Fore.GREEN, "What is your email password?")
+        sender_password:str = getpass(" ")
+
+        # get the recipients
+        self.system_clear()
+        print(Fore.GREEN, "Which keywords should the recipients have?\n Seperate multiple keywords with spaces.")
+        identifiers:list[str] = input(" ").split()
+
+        # get the templates
+        self.system_clear()
+        print(Fore.GREEN, "The subject and message can use the contact's details:")
+        print(Fore.GREEN, "$name, $first_name, $last_name, $phone, $email and $address.")
+        print(Fore.GREEN, "What is the subject header?")
+        subject_header:str = input(" ")
+        subject_content:str = self.compose_email()
+
+        # confirm with user
+        self.system_clear()
+        print(Fore.GREEN, f"Are you sure you want to email every contact with the keywords {' '.join(identifiers)}? [Y/N]")
+        confirm:str = input(" ")
+
+        if "y" not in confirm:
+            self.system_clear()
+            print(Fore.GREEN, "Cancelling...")
+            print(Fore.GREEN, "Press Enter to Continue.")
+            input(" ")
+            return
+
+        self.system_clear()
+        print(Fore.GREEN, "Sending Emails...")
+        try:
+            with MailSender(username=sender_email, password=sender_password) as sender:
+                report:dict = self.mail_merge(sender, sender_email, subject_header, subject_content, identifiers)
+        except Exception as e:
+            # informing user of error.
+            print(Fore.RED, f"UNCAUGHT EXCEPTION: {e}")
+            print(Fore.RED, "EMAILS COULD NOT BE SENT.")
+            print(Fore.RED, "Press Enter to Continue.")
+            input(" ")
+            return
+
+        print(Fore.GREEN, f"Sent {report['sent']} emails. Skipped {report['skipped']} contacts without an email.")
+        for contact_id, error in report["failed"].items():
+            print(Fore.RED, f"Could not email {contact_id}: {error}")
+        print(Fore.GREEN, "Press Enter to Continue.")
+        input(" ")
+
+
     def search_contact_keywords(self) -> int:
         """
         Searches through available contacts based on set keywords.
@@ -772,17 +1586,17 @@ class CLI(Wrapper):
         
         # get keywords
         print(Fore.GREEN, "Please enter a list of keywords you want to search for, seperated by spaces.")
-        keywords:str = input(" ").split(" ")
+        print(Fore.GREEN, "Start a keyword with + to require it or - to exclude it.")
+        all_of, any_of, none_of = parse_keyword_query(input(" "))
         
         # clear again
         self.system_clear()
 
         # search bar to make it look a lot harder than it actually is
-        for i in tqdm(range(25), "Searching...", colour="green"):
-            time.sleep(random.random() * 0.1)
+        self.animate("Searching...")
         
         # search
-        found:list|None = self.find_contact_lists(keywords)
+        found:list|None = self.search_keywords(all_of, any_of, none_of)
         
         # nothing found
         if found is None:
@@ -803,21 +1617,37 @@ class CLI(Wrapper):
         return 0
 
 
-    def list_all_contacts(self) -> None:
+    def list_all_contacts(self, page_size:int = 20) -> None:
         """
-        Lists all contact IDs.
-        Requires no parameters and always returns `None`.
+        Lists all contacts, a page at a time.
+
+        ### Parameters
+
+        `page_size` - The amount of contacts shown per page.
+
+        ### Returns
+
+        `None`
         """
-        
-        # iterate through contacts
-        for i in self.get_all_contact_ids():
-            # print them + add breakline
-            print(Fore.GREEN, self.prettify_contact_dictionary(i))
-            print(Fore.GREEN, "~"*10)
-        
-        # allow user to wait
-        print(Fore.GREEN, "Press Enter to Continue.")
-        input(" ")
+        cursor:str|None = None
+
+        while True:
+            # only one page is ever fetched
+            page, cursor = self.page_contacts(cursor, page_size)
+            for contact_id, data in page:
+                # print them + add breakline
+                print(Fore.GREEN, self.prettify_contact_dictionary(contact_id, data))
+                print(Fore.GREEN, "~"*10)
+
+            # allow user to wait
+            if cursor is None:
+                print(Fore.GREEN, "Press Enter to Continue.")
+                input(" ")
+                return
+
+            print(Fore.GREEN, "Press Enter for more contacts, or type Q to stop.")
+            if "q" in input(" ").lower():
+                return
 
 
     def boot_menu(self) -> NoReturn:
@@ -827,9 +1657,10 @@ class CLI(Wrapper):
         """
         # make it feel cool
         self.system_clear()
-        for i in tqdm(range(0, 100), "Booting...", colour="green"):
-            # randomizing time
-            time.sleep(0.1 * random.random())
+        if self.animations:
+            for i in progress(range(0, 100), "Booting..."):
+                # randomizing time
+                time.sleep(0.1 * random.random())
 
         # clear screen
         self.system_clear()
@@ -844,12 +1675,14 @@ class CLI(Wrapper):
         print(Fore.GREEN,"Phonebook System Booted.")
         print(Fore.GREEN, "Interface Options:")
         for i in options_list:
-            time.sleep(0.5)
+            if self.animations:
+                time.sleep(0.5)
             print(Fore.GREEN, f"{i} [{tmp}]")
             tmp += 1
 
         # ask for input, check to make sure numerical
-        time.sleep(0.5)
+        if self.animations:
+            time.sleep(0.5)
         print(Fore.GREEN, "Please Select An Interface (number): ")
         interface:str = input(" ")
 
@@ -877,8 +1710,9 @@ class CLI(Wrapper):
         # clear
         self.system_clear()
         # make user feel nice
-        for i in tqdm(range(50), "Booting CLI...", colour="green"):
-            time.sleep(random.random() / 10)
+        if self.animations:
+            for i in progress(range(50), "Booting CLI..."):
+                time.sleep(random.random() / 10)
 
         # giving user list of options
 
@@ -896,17 +1730,20 @@ class CLI(Wrapper):
                 "Find A Contact With A Name",
                 "Find A Contact With A Keyword",
                 "Send An Email (Assumes Access to Account)",
+                "Email Contacts With A Keyword",
                 "Exit"
             ]
 
             # list all options
             tmp:int = 0
             for i in options_list:
-                time.sleep(0.2)
+                if self.animations:
+                    time.sleep(0.2)
                 print(Fore.GREEN, f"{i} [{tmp}]")
                 tmp += 1
 
-            time.sleep(0.5)
+            if self.animations:
+                time.sleep(0.5)
             print(Fore.GREEN, "Please Select An Option (number): ")
             option:str = input(" ")
 
@@ -942,11 +1779,13 @@ class CLI(Wrapper):
                     # send email dialog
                     self.send_email_dialog()
                 case 6:
+                    # email contacts by keyword
+                    self.mail_merge_dialog()
+                case 7:
                     # exiting code
                     self.system_clear()
                     print(Fore.GREEN, "Beginning Exit...")
-                    for i in tqdm(range(25), "Saving Program State", colour="green"):
-                        time.sleep(random.random() * 0.1)
+                    self.animate("Saving Program State")
                     self.system_clear()
                     exit(0)
                 case _:
@@ -956,14 +1795,18 @@ class CLI(Wrapper):
                     exit(-1)
 
 
-def init_program():
+def init_program(animations:bool = True):
     """
     Intializes the main program.
+
+    ### Parameters
+
+    `animations` - Whether to show the progress bars and pauses, see `CLI`.
     """
     # catching errors
     try:
 
-        i = CLI()
+        i = CLI(animations)
         i.boot_menu()
 
     # informing user of error, providing them with a solution, and exiting
@@ -0,0 +1,88 @@
+#! /usr/bin/env python3
+"""
+Phone number handling. Numbers are stored in one canonical form, just
+their digits, so the same number typed as `555-123-4567`, `(555) 123 4567`
+or `+1 555 123 4567` is stored, indexed and compared the same way.
+Extensions, like `555-123-4567 x89`, are split off so the number is
+found by its main line.
+"""
+import re
+
+
+# an extension at the end of a number, eg "x89", "ext. 89" or "#89"
+EXTENSION = re.compile(r"\s*(?:#|x|ext\.?|extension)\s*(\d+)\s*$", re.IGNORECASE)
+
+# the longest international number, country code included (E.164)
+MAX_INTERNATIONAL_DIGITS:int = 15
+
+# the shortest, a short country code plus a short subscriber number
+MIN_INTERNATIONAL_DIGITS:int = 8
+
+# the country code dropped from the front of numbers in that country
+DEFAULT_COUNTRY_CODE:str = "1"
+
+
+def split_extension(phone:str) -> tuple[str, str|None]:
+    """
+    Splits the extension off the end of a phone number.
+
+    ### Parameters
+
+    `phone` - The phone number, as typed.
+
+    ### Returns
+
+    `tuple[str, str|None]` - The number without the extension, and
+    the digits of the extension or `None` if there isn't one.
+    """
+    match = EXTENSION.search(phone)
+    if match is None:
+        return phone, None
+    return phone[:match.start()], match.group(1)
+
+
+def normalize_phone(phone:str|int|None, country_code:str = DEFAULT_COUNTRY_CODE) -> str|None:
+    """
+    Returns the canonical form of a phone number: its digits, without the
+    country code for numbers in the default country or the extension.
+
+    ### Parameters
+
+    `phone` - The phone number, as typed or as a number.
+
+    `country_code` - The country code dropped from 11 digit numbers starting with it.
+
+    ### Returns
+
+    `str` - The digits of the phone number.
+
+    `None` - The phone number has no digits.
+    """
+    if phone is None:
+        return None
+
+    number, _ = split_extension(str(phone))
+    digits = "".join(char for char in number if char.isdigit())
+    # "00" is the international call prefix in most countries, like "+",
+    # as long as a whole international number follows. country codes
+    # never start with 0
+    international = digits[2:]
+    if (
+        digits.startswith("00")
+        and not international.startswith("0")
+        and MIN_INTERNATIONAL_DIGITS <= len(international) <= MAX_INTERNATIONAL_DIGITS
+    ):
+        digits = international
+    if len(digits) == 10 + len(country_code) and digits.startswith(country_code):
+        digits = digits[len(country_code):]
+    return digits or None
+
+
+def format_phone(phone:str|None) -> str|None:
+    """
+    Formats a canonical phone number for people to read. Ten digit
+    numbers are shown as `xxx-xxx-xxxx`, others are left as they are.
+    """
+    if phone is None or len(phone) != 10 or not phone.isdigit():
+        return phone
+    return f"{phone[:3]}-{phone[3:6]}-{phone[6:]}"
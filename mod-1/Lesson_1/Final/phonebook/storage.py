@@ -0,0 +1,1496 @@
+#! /usr/bin/env python3
+"""
+Storage engines used by the `PhoneBook` to keep its contacts on disk.
+
+The file based engines keep the contacts in memory and serve reads from
+there, while the SQLite engine answers reads with indexed queries. Changes
+are made through `add` and `remove`, which describe the change as a record,
+apply it, and then hand it to the engine to be written back according to
+the write policy.
+
+Every change written is also appended to a change log (see
+`phonebook.changelog`), so copies of the phonebook can catch up by
+applying only the changes they missed.
+
+Several processes can share one data file. Changes are made while holding
+an advisory lock on the data file, after catching up with whatever other
+processes wrote, so no change is lost. Changes held back by the write
+policy are replayed on top of the file if someone else wrote to it first,
+and `IDsChangedError` reports any contacts that had to get new ids.
+"""
+import os
+import json
+import heapq
+import itertools
+from contextlib import contextmanager
+from bisect import bisect_left, bisect_right, insort
+from .indexes import KeywordIndex, NameIndex, FuzzyIndex, PhoneIndex, contact_sort_key
+from .locking import FileLock
+from .phones import normalize_phone
+from .changelog import ChangeLog
+from typing import TYPE_CHECKING
+
+# `sqlite3` and `mmap` are only imported by the engines that use them,
+# so opening a JSON phonebook doesn't pay for either
+if TYPE_CHECKING:
+    import sqlite3
+    from .packed import PackedFile
+
+
+# the ways in which changes to the in-memory contacts are written back to disk.
+# "immediate" writes after every change, "batched" writes once every `batch_size`
+# changes and "on_exit" only writes when the program exits (or `flush` is called).
+WRITE_POLICIES:tuple[str, ...] = ("immediate", "batched", "on_exit")
+
+
+class IDsChangedError(Exception):
+    """
+    Error occurring when contacts added under the `"batched"` or `"on_exit"`
+    write policy had to be given new ids, because another process handed
+    out the same ids first. The changes are kept under the new ids, so the
+    ids returned for them before are no longer valid.
+
+    `renumbered` maps the old ids to the new ones.
+    """
+
+    def __init__(self, location:str, renumbered:dict[str, str]) -> None:
+        # both passed up, so it survives being pickled back from another process
+        super().__init__(location, renumbered)
+        self.location = location
+        self.renumbered = renumbered
+
+
+    def __str__(self) -> str:
+        return (
+            f"{self.location} was changed by another process while changes were pending. "
+            f"Contacts were given new ids: {self.renumbered}"
+        )
+
+
+class ContactStore:
+    """
+    Base class for the storage engines.
+
+    Subclasses decide how the contacts are read from and written to disk by
+    overriding `_create`, `_read`, `_write` and `_signature`.
+    """
+
+    # file extensions this engine is selected for
+    extensions:tuple[str, ...] = ()
+    # whether changes are made holding a `FileLock` next to the data file,
+    # engines that lock some other way override `locked` and turn it off
+    uses_file_lock:bool = True
+
+
+    def __init__(self, location:str, write_policy:str = "immediate", batch_size:int = 50, change_log:bool = False) -> None:
+        """
+        ### Parameters
+
+        `location` - The location of the data file.
+
+        `write_policy` - How changes are written back to the data file.
+        One of `"immediate"`, `"batched"` or `"on_exit"`.
+
+        `batch_size` - The amount of changes to hold before writing them
+        when using the `"batched"` policy.
+
+        `change_log` - Whether to keep a log of the changes written, for
+        `changes_since`. Kept next to the data file, with `.changes`
+        appended to the name. Off by default, as it grows with every
+        change and doubles the writes. Changes made while it's off
+        are never logged.
+
+        ### Raises
+
+        `ValueError` - The write policy is not recognised.
+        """
+        if write_policy not in WRITE_POLICIES:
+            raise ValueError(f"Unknown write policy \"{write_policy}\". Expected one of {WRITE_POLICIES}.")
+
+        self.location = location
+        self.write_policy = write_policy
+        self.batch_size = max(1, batch_size)
+
+        # in-memory copy of the contacts. "count" is the number of the last
+        # contact id handed out, so ids are never reused.
+        self.contents:dict = {"contacts": {}, "count": 0}
+        self.pending_writes:int = 0
+        # the changes not yet written, replayed on top of the data file if
+        # another process writes to it before we do
+        self.pending_records:list[dict] = []
+        # the count on disk when we last read or wrote it
+        self.base_count:int = 0
+
+        # contact ids in id order. removed ids stay behind as tombstones until
+        # they are compacted away, so removing a contact is O(1)
+        self.order:list[str] = []
+        self.tombstones:int = 0
+
+        # open `batch` blocks; changes are held back while there are any
+        self.batch_depth:int = 0
+
+        # stat information of the files on disk when we last read or wrote them
+        self.file_signature:tuple|None = None
+        # held while changing the data file, see `locked`
+        self.lock:FileLock|None = FileLock(location + ".lock") if self.uses_file_lock else None
+        self.change_log:ChangeLog|None = ChangeLog(location + ".changes") if change_log else None
+
+        # built on the first search that needs them, then kept in sync by `apply`
+        self.keyword_index:KeywordIndex|None = None
+        self.name_index:NameIndex|None = None
+        self.fuzzy_index:FuzzyIndex|None = None
+        self.phone_index:PhoneIndex|None = None
+
+
+    @property
+    def contacts(self) -> dict:
+        """
+        The in-memory contacts, keyed by contact id.
+        """
+        return self.contents["contacts"]
+
+
+    # queries
+
+
+    def count(self) -> int:
+        """
+        Returns the contact count of the phonebook.
+        """
+        return self.contents["count"]
+
+
+    def version(self) -> int:
+        """
+        Returns the version of the data file, which goes up every
+        time changes are written to it.
+        """
+        return self.contents.get("version", 0)
+
+
+    def ids(self) -> list[str]:
+        """
+        Returns a list of all contact ids, in the order they were added.
+        """
+        contacts = self.contacts
+        return [contact_id for contact_id in self.order if contact_id in contacts]
+
+
+    def get(self, contact_id:str) -> dict|None:
+        """
+        Returns the data of a contact, or `None` if it does not exist.
+        """
+        data = self.contacts.get(contact_id)
+        if data is None:
+            return None
+        # hand out a copy so callers can't change the stored contact
+        return dict(data)
+
+
+    def iter_items(self, offset:int = 0, after:str|None = None):
+        """
+        Yields `(contact_id, data)` pairs for the contacts in id order.
+        The data is the stored contact itself and must not be changed.
+
+        ### Parameters
+
+        `offset` - The amount of contacts to skip.
+
+        `after` - Only yield contacts added after the contact with this id,
+        which doesn't have to exist anymore.
+        """
+        # skipping by position is only right once the tombstones are gone
+        if offset and self.tombstones:
+            self._drop_tombstones()
+
+        contacts = self.contacts
+        order = self.order
+        position = 0
+        if after is not None:
+            position = bisect_right(order, contact_sort_key(after), key=contact_sort_key)
+        position += offset
+
+        while position < len(order):
+            contact_id = order[position]
+            position += 1
+            data = contacts.get(contact_id)
+            if data is not None:
+                yield contact_id, data
+
+
+    def lookup_name(self, first_name:str, last_name:str|None) -> list[str]:
+        """
+        Returns the ids of the contacts with the given first name
+        or the given last name.
+        """
+        return [
+            contact for contact, data in self.contacts.items()
+            if data["first_name"] == first_name
+            or (last_name is not None and data["last_name"] == last_name)
+        ]
+
+
+    def query_identifiers(self, all_of:list[str] = (), any_of:list[str] = (), none_of:list[str] = ()) -> list[str]:
+        """
+        Returns the ids of the contacts matching a keyword query, without
+        duplicates and ranked by the amount of matching keywords.
+        See `KeywordIndex.query`.
+        """
+        if self.keyword_index is None:
+            self.keyword_index = KeywordIndex()
+            for contact, data in self.contacts.items():
+                self.keyword_index.add(contact, data["identifiers"])
+
+        return self.keyword_index.query(all_of, any_of, none_of, universe=self.contacts.keys())
+
+
+    def iter_prefix(self, prefix:str):
+        """
+        Yields the ids of the contacts whose full name or last name starts
+        with the given prefix, ignoring case, in name order.
+        See `NameIndex.iter_prefix`.
+        """
+        if self.name_index is None:
+            self.name_index = NameIndex()
+            self.name_index.build(self.contacts.items())
+
+        return self.name_index.iter_prefix(prefix)
+
+
+    def fuzzy_search(self, query:str, max_distance:int|None = None) -> list[str]:
+        """
+        Returns the ids of the contacts with names spelled or sounding like
+        the query, best matches first. See `FuzzyIndex.search`.
+        """
+        if self.fuzzy_index is None:
+            self.fuzzy_index = FuzzyIndex()
+            for contact_id, data in self.contacts.items():
+                self.fuzzy_index.add(contact_id, data)
+
+        return self.fuzzy_index.search(query, max_distance)
+
+
+    def lookup_phone(self, phone:str|int) -> list[str]:
+        """
+        Returns the ids of the contacts with a phone number, in id order.
+        The number can be in any format. See `PhoneIndex.lookup`.
+        """
+        if self.phone_index is None:
+            self.phone_index = PhoneIndex()
+            for contact_id, data in self.contacts.items():
+                self.phone_index.add(contact_id, data["phone"])
+
+        return self.phone_index.lookup(phone)
+
+
+    def lookup_phones(self, phones:list[str]) -> dict[str, list[str]]:
+        """
+        Looks up several canonical phone numbers at once.
+
+        ### Parameters
+
+        `phones` - The phone numbers, already normalized.
+
+        ### Returns
+
+        `dict[str, list[str]]` - The ids of the contacts with each number
+        that belongs to any contact. Numbers without contacts are left out.
+        """
+        matches:dict[str, list[str]] = {}
+        for phone in phones:
+            contact_ids = self.lookup_phone(phone)
+            if contact_ids:
+                matches[phone] = contact_ids
+        return matches
+
+
+    def change_seq(self) -> int:
+        """
+        Returns the sequence number of the last change in the change log.
+
+        ### Raises
+
+        `ValueError` - The store keeps no change log.
+        """
+        if self.change_log is None:
+            raise ValueError(f"{self.location} keeps no change log.")
+        return self.change_log.last_seq()
+
+
+    def changes_since(self, seq:int, limit:int|None = None) -> list[dict]:
+        """
+        Returns the changes written after a sequence number, oldest first.
+        See `ChangeLog.since`.
+
+        ### Raises
+
+        `ValueError` - The store keeps no change log.
+        """
+        if self.change_log is None:
+            raise ValueError(f"{self.location} keeps no change log.")
+        return self.change_log.since(seq, limit)
+
+
+    def open(self) -> None:
+        """
+        Creates the data file if needed and reads it into memory.
+        """
+        with self.locked():
+            if not os.path.exists(self.location):
+                self._create()
+            self.load()
+
+
+    def load(self) -> None:
+        """
+        Reads the data file into memory, discarding the current in-memory copy.
+        """
+        self.keyword_index = None
+        self.name_index = None
+        self.fuzzy_index = None
+        self.phone_index = None
+        # taken first, so a change made while we read is caught by the next refresh
+        signature = self._signature()
+        self.contents = self._read()
+        self.order = self._order()
+        self.tombstones = 0
+        self.pending_writes = 0
+        self.pending_records = []
+        self.base_count = self.count()
+        self.file_signature = signature
+
+
+    def refresh(self) -> None:
+        """
+        Reloads the data file if another process has changed it since
+        we last read or wrote it.
+
+        ### Raises
+
+        `IDsChangedError` - Pending contacts had to be given new ids. They
+        are up to date all the same, so the call can be retried.
+        """
+        signature = self._signature()
+        if signature == self.file_signature:
+            return
+
+        # our own unwritten changes would be lost by reloading, so replay them
+        if self.pending_records:
+            self._rebase()
+            return
+
+        self._reload(signature)
+
+
+    def flush(self) -> int:
+        """
+        Writes any changes held in memory to disk.
+        Requires no parameters.
+
+        ### Returns
+
+        `int` - The amount of changes written.
+
+        ### Raises
+
+        `IDsChangedError` - Pending contacts had to be given new ids. The
+        changes are written under the new ids before it is raised.
+        """
+        if self.pending_writes == 0:
+            return 0
+
+        renumbered:IDsChangedError|None = None
+        with self.locked():
+            # another process wrote first, so put our changes on top of theirs
+            try:
+                self.refresh()
+            except IDsChangedError as e:
+                renumbered = e
+            # taken before writing, as some engines clear them as they go
+            records = self.pending_records
+            self._write()
+            self._log_changes(records)
+
+            written = self.pending_writes
+            self.pending_writes = 0
+            self.pending_records = []
+            self.base_count = self.count()
+            self.file_signature = self._signature()
+
+        if renumbered is not None:
+            raise renumbered
+        return written
+
+
+    def close(self) -> None:
+        """
+        Writes any changes held in memory and closes the files held open.
+        Requires no parameters.
+        """
+        try:
+            self.flush()
+        finally:
+            if self.lock is not None:
+                self.lock.close()
+
+
+    @contextmanager
+    def locked(self):
+        """
+        Holds the lock on the data file for the length of a `with` block,
+        keeping other processes from changing it. Can be nested.
+        """
+        with self.lock:
+            yield self
+
+
+    @contextmanager
+    def batch(self):
+        """
+        Holds back writing the changes made inside a `with` block and writes
+        them all at once when the outermost block ends. The `"on_exit"` write
+        policy still waits for exit. The data file stays locked meanwhile.
+        """
+        with self.locked():
+            self.batch_depth += 1
+            try:
+                yield self
+            finally:
+                self.batch_depth -= 1
+                if self.batch_depth == 0 and self.write_policy != "on_exit":
+                    self.flush()
+
+
+    def add(self, data:dict, contact_id:str|None = None) -> str:
+        """
+        Adds a contact.
+
+        ### Parameters
+
+        `data` - The contact data.
+
+        `contact_id` - The id to store the contact under, for copying contacts
+        between phonebooks. A new id is handed out if not given.
+
+        ### Returns
+
+        `str` - The contact id of the new contact.
+        """
+        with self.locked():
+            # catch up first, so the new id isn't one another process handed out
+            self.refresh()
+            if contact_id is None:
+                contact_id = f"contact_{self.count()+1}"
+            self._commit({"op": "add", "id": contact_id, "data": data})
+        return contact_id
+
+
+    def remove(self, contact_id:str) -> int:
+        """
+        Removes a contact. The ids of the other contacts don't change.
+
+        ### Parameters
+
+        `contact_id` - The contact id of the contact to remove.
+
+        ### Returns
+
+        `int` - -1 if the given ID does not exist, otherwise 0.
+        """
+        with self.locked():
+            self.refresh()
+            if self.get(contact_id) is None:
+                return -1
+            self._commit({"op": "remove", "id": contact_id})
+        return 0
+
+
+    def edit(self, contact_id:str, data:dict) -> int:
+        """
+        Replaces the data of a contact, keeping its id.
+
+        ### Parameters
+
+        `contact_id` - The contact id of the contact to change.
+
+        `data` - The new contact data.
+
+        ### Returns
+
+        `int` - -1 if the given ID does not exist, otherwise 0.
+        """
+        with self.locked():
+            self.refresh()
+            if self.get(contact_id) is None:
+                return -1
+            self._commit({"op": "edit", "id": contact_id, "data": data})
+        return 0
+
+
+    def apply_change(self, change:dict) -> None:
+        """
+        Makes a change read from the change log of another copy of the
+        phonebook, keeping its contact id. Applying a change twice does
+        no harm, so a batch can be retried.
+
+        ### Parameters
+
+        `change` - The change, as returned by `changes_since`.
+        """
+        contact_id = change["id"]
+        with self.locked():
+            self.refresh()
+            exists = self.get(contact_id) is not None
+            if change["op"] == "remove":
+                if exists:
+                    self._commit({"op": "remove", "id": contact_id})
+            elif exists:
+                self._commit({"op": "edit", "id": contact_id, "data": change["data"]})
+            else:
+                self._commit({"op": "add", "id": contact_id, "data": change["data"]})
+
+
+    def apply(self, record:dict) -> None:
+        """
+        Applies a change record to the in-memory contacts.
+
+        ### Parameters
+
+        `record` - The change, as created by `add`, `edit` or `remove`.
+        """
+        contents = self.contents
+        contact_id = record["id"]
+
+        if record["op"] == "edit":
+            old = contents["contacts"].get(contact_id)
+            if old is None:
+                return
+            data = contents["contacts"][contact_id] = record["data"]
+            if self.keyword_index is not None:
+                self.keyword_index.remove(contact_id, old["identifiers"])
+                self.keyword_index.add(contact_id, data["identifiers"])
+            if self.name_index is not None:
+                self.name_index.update(contact_id, old, data)
+            if self.fuzzy_index is not None:
+                self.fuzzy_index.remove(contact_id, old)
+                self.fuzzy_index.add(contact_id, data)
+            if self.phone_index is not None:
+                self.phone_index.remove(contact_id, old["phone"])
+                self.phone_index.add(contact_id, data["phone"])
+            return
+
+        if record["op"] == "add":
+            number = contact_sort_key(contact_id)
+            contents["contacts"][contact_id] = record["data"]
+            self._insert_order(contact_id, number)
+            contents["count"] = max(contents["count"], number)
+            if self.keyword_index is not None:
+                self.keyword_index.add(contact_id, record["data"]["identifiers"])
+            if self.name_index is not None:
+                self.name_index.add(contact_id, record["data"])
+            if self.fuzzy_index is not None:
+                self.fuzzy_index.add(contact_id, record["data"])
+            if self.phone_index is not None:
+                self.phone_index.add(contact_id, record["data"]["phone"])
+
+        elif record["op"] == "remove":
+            data = contents["contacts"].pop(contact_id, None)
+            if data is None:
+                return
+
+            # the id is left in `order` as a tombstone
+            self.tombstones += 1
+            if self.keyword_index is not None:
+                self.keyword_index.remove(contact_id, data["identifiers"])
+            if self.name_index is not None:
+                self.name_index.remove(contact_id, data)
+            if self.fuzzy_index is not None:
+                self.fuzzy_index.remove(contact_id, data)
+            if self.phone_index is not None:
+                self.phone_index.remove(contact_id, data["phone"])
+
+            # keep the tombstones from outgrowing the contacts
+            if self.tombstones > max(1000, len(contents["contacts"])):
+                self._drop_tombstones()
+
+
+    def compact(self) -> None:
+        """
+        Drops the tombstones left behind by removed contacts.
+        Requires no parameters.
+        """
+        self._drop_tombstones()
+
+
+    def _drop_tombstones(self) -> None:
+        """
+        Removes the ids of removed contacts from `order` and the name index.
+        """
+        contacts = self.contacts
+        self.order = [contact_id for contact_id in self.order if contact_id in contacts]
+        self.tombstones = 0
+        if self.name_index is not None:
+            self.name_index.compact()
+
+
+    def _insert_order(self, contact_id:str, number:int) -> None:
+        """
+        Adds a contact id to `order`. New ids always go on the end,
+        ids copied from elsewhere may need to be slotted in.
+        """
+        # the count is the highest id number so far, which is always the last in order
+        if number > self.contents["count"]:
+            self.order.append(contact_id)
+            return
+
+        position = bisect_left(self.order, number, key=contact_sort_key)
+        if position < len(self.order) and self.order[position] == contact_id:
+            # re-adding a tombstoned id
+            self.tombstones -= 1
+            return
+        insort(self.order, contact_id, key=contact_sort_key)
+
+
+    # engine specific hooks
+
+
+    def _order(self) -> list[str]:
+        """
+        Returns the contact ids in id order, for `order`.
+        """
+        return sorted(self.contacts, key=contact_sort_key)
+
+
+    def _commit(self, record:dict) -> None:
+        """
+        Applies a change and writes it back according to the write policy.
+        """
+        # duplicate keywords are dropped here, so every engine stores the same list
+        identifiers = record.get("data", {}).get("identifiers")
+        if identifiers and len(set(identifiers)) != len(identifiers):
+            record = {**record, "data": {**record["data"], "identifiers": list(dict.fromkeys(identifiers))}}
+
+        self.apply(record)
+        self.pending_writes += 1
+        self.pending_records.append(record)
+
+        if self.batch_depth:
+            return
+        if self.write_policy == "immediate":
+            self.flush()
+        elif self.write_policy == "batched" and self.pending_writes >= self.batch_size:
+            self.flush()
+
+
+    def _log_changes(self, records:list[dict]) -> None:
+        """
+        Appends changes that have just been written to the change log.
+        The lock must be held.
+        """
+        if self.change_log is not None:
+            self.change_log.append(records)
+
+
+    def _reload(self, signature:tuple) -> None:
+        """
+        Brings the in-memory copy up to date after another process changed
+        the files on disk. Reloads everything unless overridden.
+        """
+        self.load()
+
+
+    def _rebase(self) -> None:
+        """
+        Reloads the data file after another process wrote to it and replays
+        the pending changes on top. Contacts added under an id the other
+        process handed out too are given a new id.
+
+        ### Raises
+
+        `IDsChangedError` - Contacts were given a new id.
+        """
+        pending = self.pending_records
+        base_count = self.base_count
+        self.load()
+
+        renumbered:dict[str, str] = {}
+        for record in pending:
+            contact_id = renumbered.get(record["id"], record["id"])
+            if record["op"] == "add" and base_count < contact_sort_key(contact_id) <= self.count():
+                contact_id = f"contact_{self.count()+1}"
+                renumbered[record["id"]] = contact_id
+            elif record["op"] in ("remove", "edit") and contact_id not in self.contacts:
+                continue
+
+            record = {**record, "id": contact_id}
+            self.apply(record)
+            self.pending_records.append(record)
+            self.pending_writes += 1
+
+        if renumbered:
+            raise IDsChangedError(self.location, renumbered)
+
+
+    def _stat(self, location:str) -> tuple|None:
+        """
+        Returns the modification time, size and inode of a file,
+        or `None` if it does not exist.
+        """
+        try:
+            stat = os.stat(location)
+        except FileNotFoundError:
+            return None
+        # files are replaced rather than rewritten, so the inode always changes
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+    def _signature(self) -> tuple|None:
+        raise NotImplementedError
+
+
+    def _create(self) -> None:
+        raise NotImplementedError
+
+
+    def _read(self) -> dict:
+        raise NotImplementedError
+
+
+    def _write(self) -> None:
+        raise NotImplementedError
+
+
+class JSONStore(ContactStore):
+    """
+    Stores the contacts as a single JSON document, which is rewritten
+    whenever changes are flushed. The new document is written next to the
+    old one and renamed over it, so readers never see a half written file.
+    """
+
+    extensions = (".json",)
+
+
+    def _signature(self) -> tuple|None:
+        return self._stat(self.location)
+
+
+    def _create(self) -> None:
+        with open(os.path.abspath(self.location), "w") as file:
+            json.dump({"contacts": {}, "count": 0, "version": 0}, file, indent=4)
+
+
+    def _read(self) -> dict:
+        with open(self.location, "r") as file:
+            return json.load(file)
+
+
+    def _write(self) -> None:
+        self.contents["version"] = self.version() + 1
+        tmp_location = self.location + ".tmp"
+        with open(tmp_location, "w") as file:
+            json.dump(self.contents, file, indent=4)
+        os.replace(tmp_location, self.location)
+
+
+class JournalStore(ContactStore):
+    """
+    Stores the contacts as a snapshot plus an append-only journal.
+
+    Every change is appended to the journal as a single line of JSON, so the
+    cost of a change does not depend on the size of the phonebook. On startup
+    the journal is replayed on top of the snapshot. Once the journal holds
+    more records than the snapshot holds contacts it is compacted into a new
+    snapshot, which keeps the amortised cost of a change constant.
+    """
+
+    extensions = (".journal",)
+
+
+    def __init__(self, location:str, write_policy:str = "immediate", batch_size:int = 50, change_log:bool = False, compact_every:int = 1000) -> None:
+        """
+        ### Parameters
+
+        `location` - The location of the journal. The snapshot is kept next
+        to it, with `.snapshot` appended to the name.
+
+        `write_policy` - See `ContactStore`.
+
+        `batch_size` - See `ContactStore`.
+
+        `change_log` - See `ContactStore`.
+
+        `compact_every` - The least amount of journal records to hold before
+        compacting them into the snapshot.
+        """
+        super().__init__(location, write_policy, batch_size, change_log)
+        self.snapshot_location = location + ".snapshot"
+        self.compact_every = compact_every
+
+        # records in the journal that are not in the snapshot
+        self.journal_records:int = 0
+        # contacts in the snapshot
+        self.snapshot_contacts:int = 0
+        # sequence number of the last applied record
+        self.seq:int = 0
+        # how far into the journal we have replayed
+        self.journal_offset:int = 0
+
+
+    def compact(self) -> None:
+        """
+        Drops the tombstones, writes the in-memory contacts to a new snapshot
+        and empties the journal. Requires no parameters.
+        """
+        with self.locked():
+            # written through `flush` first, so the changes are logged
+            self.flush()
+            self.refresh()
+            self._compact()
+
+
+    def version(self) -> int:
+        # every record in the journal is a version
+        return self.seq
+
+
+    def _compact(self) -> None:
+        """
+        Compacts the journal, see `compact`. The lock must be held.
+        """
+        super().compact()
+        self._append_pending()
+
+        # the snapshot is replaced atomically and remembers the last record it
+        # contains, so a crash before the journal is emptied can't apply a
+        # record twice.
+        tmp_location = self.snapshot_location + ".tmp"
+        with open(tmp_location, "w") as file:
+            # dumps goes through the C encoder, dump does not
+            file.write(json.dumps({"seq": self.seq, **self.contents}))
+        os.replace(tmp_location, self.snapshot_location)
+        self.snapshot_contacts = len(self.contacts)
+
+        open(self.location, "w").close()
+        self.journal_records = 0
+        self.journal_offset = 0
+        self.file_signature = self._signature()
+
+
+    def _signature(self) -> tuple:
+        return (self._stat(self.snapshot_location), self._stat(self.location))
+
+
+    def _create(self) -> None:
+        open(self.location, "a").close()
+
+
+    def _read(self) -> dict:
+        contents = {"contacts": {}, "count": 0}
+        seq:int = 0
+
+        if os.path.exists(self.snapshot_location):
+            with open(self.snapshot_location, "r") as file:
+                snapshot = json.load(file)
+            seq = snapshot.pop("seq")
+            contents = snapshot
+        snapshot_contacts = len(contents["contacts"])
+
+        # replayed into the new contents rather than through `apply`, so nothing
+        # of the old in-memory copy is touched until `load` swaps the new one in
+        contacts = contents["contacts"]
+        records, offset = 0, 0
+        for record, offset in self._iter_journal(0):
+            if record["seq"] <= seq:
+                continue
+            contact_id = record["id"]
+            if record["op"] == "add":
+                contacts[contact_id] = record["data"]
+                contents["count"] = max(contents["count"], contact_sort_key(contact_id))
+            elif record["op"] == "edit" and contact_id in contacts:
+                contacts[contact_id] = record["data"]
+            elif record["op"] == "remove":
+                contacts.pop(contact_id, None)
+            seq = record["seq"]
+            records += 1
+
+        self.seq = seq
+        self.snapshot_contacts = snapshot_contacts
+        self.journal_records = records
+        self.journal_offset = offset
+        return contents
+
+
+    def _reload(self, signature:tuple) -> None:
+        # another process only appended to the journal, so only replay the new records
+        if signature[0] == self.file_signature[0] and signature[1] is not None \
+                and signature[1][1] >= self.journal_offset:
+            self._replay()
+            self.file_signature = signature
+            return
+        self.load()
+
+
+    def _iter_journal(self, offset:int):
+        """
+        Yields the journal records written after a byte offset, each with
+        the offset just past it.
+        """
+        with open(self.location, "rb") as file:
+            file.seek(offset)
+            for line in file:
+                # a partially written last line is left for the next replay
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                yield json.loads(line), offset
+
+
+    def _replay(self) -> None:
+        """
+        Applies the journal records written after `journal_offset` to the
+        in-memory contacts, after another process appended them.
+        """
+        for record, self.journal_offset in self._iter_journal(self.journal_offset):
+            if record["seq"] <= self.seq:
+                continue
+            self.apply(record)
+            self.seq = record["seq"]
+            self.journal_records += 1
+
+
+    def _append_pending(self) -> None:
+        """
+        Appends the pending records to the journal. The lock must be held.
+        """
+        if not self.pending_records:
+            return
+
+        # records are numbered as they are appended, so the numbers follow
+        # the order in the journal whichever process wrote them
+        lines:list[str] = []
+        for record in self.pending_records:
+            self.seq += 1
+            lines.append(json.dumps({**record, "seq": self.seq}) + "\n")
+
+        with open(self.location, "a") as file:
+            file.write("".join(lines))
+            self.journal_offset = file.tell()
+
+        self.journal_records += len(self.pending_records)
+        self.pending_records = []
+        # nobody else can have written while we hold the lock
+        self.file_signature = self._signature()
+
+
+    def _write(self) -> None:
+        self._append_pending()
+        if self.journal_records >= max(self.compact_every, self.snapshot_contacts):
+            self._compact()
+
+
+class PackedStore(ContactStore):
+    """
+    Stores the contacts in a compact binary file, see `phonebook.packed`.
+
+    The file is memory mapped rather than read, so opening a phonebook
+    doesn't depend on its size and looking up a contact only reads that
+    contact. Changes are held in memory on top of the file, which is
+    rewritten when they are flushed.
+    """
+
+    extensions = (".pbk",)
+
+
+    def __init__(self, location:str, write_policy:str = "immediate", batch_size:int = 50, change_log:bool = False) -> None:
+        super().__init__(location, write_policy, batch_size, change_log)
+        self.packed:PackedFile|None = None
+
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            if self.packed is not None:
+                self.packed.close()
+                self.packed = None
+
+
+    def ids(self) -> list[str]:
+        return list(self.contacts.iter_ids())
+
+
+    def iter_items(self, offset:int = 0, after:str|None = None):
+        contacts = self.contacts
+        contact_ids = contacts.iter_ids(0 if after is None else contact_sort_key(after))
+        for contact_id in itertools.islice(contact_ids, offset, None):
+            yield contact_id, contacts[contact_id]
+
+
+    def _order(self) -> list[str]:
+        # the file is already in id order, `order` only has to hold new contacts
+        return []
+
+
+    def _signature(self) -> tuple|None:
+        return self._stat(self.location)
+
+
+    def _create(self) -> None:
+        from .packed import write_packed
+        write_packed(self.location, (), 0, 0)
+
+
+    def _read(self) -> dict:
+        from .packed import PackedFile, PackedContacts
+        if self.packed is not None:
+            self.packed.close()
+        self.packed = PackedFile(self.location)
+        return {"contacts": PackedContacts(self.packed), "count": self.packed.count, "version": self.packed.version}
+
+
+    def _write(self) -> None:
+        from .packed import PackedFile, PackedContacts, write_packed
+        tmp_location = self.location + ".tmp"
+        write_packed(tmp_location, self.iter_items(), self.count(), self.version() + 1)
+
+        # the old file has to be unmapped before it can be replaced on windows
+        self.packed.close()
+        os.replace(tmp_location, self.location)
+        self.packed = PackedFile(self.location)
+        self.contents = {"contacts": PackedContacts(self.packed), "count": self.packed.count, "version": self.packed.version}
+        self.order = []
+        self.tombstones = 0
+
+
+class SQLiteStore(ContactStore):
+    """
+    Stores the contacts in a SQLite database.
+
+    Nothing is held in memory. Names and hash ids are indexed columns and
+    identifier keywords live in their own table, so lookups are answered with
+    indexed queries rather than scans over every contact. Changes are made in
+    a transaction that is committed according to the write policy. SQLite
+    locks the database itself, and the transaction keeps other writers out
+    until it is committed, so `"on_exit"` is best kept to a single process.
+    The change log is a table committed in the same transaction as the
+    changes, so the two can't disagree.
+    """
+
+    extensions = (".db", ".sqlite", ".sqlite3")
+    # `BEGIN IMMEDIATE` does the locking, see `locked`
+    uses_file_lock = False
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS contacts (
+        id INTEGER PRIMARY KEY,
+        position INTEGER NOT NULL UNIQUE,
+        first_name TEXT,
+        last_name TEXT,
+        phone TEXT,
+        email TEXT,
+        address TEXT,
+        hash_id TEXT
+    );
+    CREATE INDEX IF NOT EXISTS contacts_first_name ON contacts (first_name);
+    CREATE INDEX IF NOT EXISTS contacts_last_name ON contacts (last_name);
+    CREATE INDEX IF NOT EXISTS contacts_hash_id ON contacts (hash_id);
+    CREATE INDEX IF NOT EXISTS contacts_phone ON contacts (phone);
+    CREATE INDEX IF NOT EXISTS contacts_first_name_nocase ON contacts (first_name COLLATE NOCASE);
+    CREATE INDEX IF NOT EXISTS contacts_last_name_nocase ON contacts (last_name COLLATE NOCASE);
+
+    CREATE TABLE IF NOT EXISTS identifiers (
+        keyword TEXT NOT NULL,
+        contact INTEGER NOT NULL REFERENCES contacts (id) ON DELETE CASCADE,
+        ordinal INTEGER NOT NULL,
+        PRIMARY KEY (keyword, contact)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS identifiers_contact ON identifiers (contact);
+
+    CREATE TABLE IF NOT EXISTS changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        op TEXT NOT NULL,
+        contact TEXT NOT NULL,
+        data TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER
+    );
+    INSERT OR IGNORE INTO meta (key, value)
+        VALUES ('count', (SELECT COALESCE(MAX(position), 0) FROM contacts));
+    INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+    """
+
+    FIELDS:tuple[str, ...] = ("first_name", "last_name", "phone", "email", "address", "hash_id")
+
+
+    def __init__(self, location:str, write_policy:str = "immediate", batch_size:int = 50, change_log:bool = False) -> None:
+        super().__init__(location, write_policy, batch_size, change_log)
+        self.connection:sqlite3.Connection|None = None
+        # `PRAGMA data_version` when the fuzzy index was built. it changes
+        # when another connection commits, which makes the index stale
+        self.fuzzy_data_version:int|None = None
+
+
+    def open(self) -> None:
+        import sqlite3
+        # wait for other writers rather than failing straight away
+        self.connection = sqlite3.connect(self.location, timeout=60)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(self.SCHEMA)
+        self._normalize_phones()
+        self.connection.commit()
+        self.pending_writes = 0
+
+
+    def _normalize_phones(self) -> None:
+        """
+        Rewrites the phones of databases from before phone numbers were
+        normalized on write, so they can be found with the phone index.
+        Only done once per database.
+        """
+        if self.connection.execute("SELECT 1 FROM meta WHERE key = 'normalized_phones'").fetchone():
+            return
+        self.connection.create_function("normalize_phone", 1, normalize_phone, deterministic=True)
+        self.connection.execute("UPDATE contacts SET phone = normalize_phone(phone) WHERE phone IS NOT NULL")
+        self.connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('normalized_phones', 1)")
+
+
+    def load(self) -> None:
+        # nothing to load, every read goes to the database
+        pass
+
+
+    def refresh(self) -> None:
+        # SQLite already sees changes committed by other processes
+        pass
+
+
+    def count(self) -> int:
+        return self.connection.execute("SELECT value FROM meta WHERE key = 'count'").fetchone()[0]
+
+
+    def version(self) -> int:
+        return self.connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+
+    @contextmanager
+    def locked(self):
+        # take the write lock up front, so the count read for a new id
+        # can't change before the contact is inserted
+        started = not self.connection.in_transaction
+        if started:
+            self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self
+        finally:
+            # nothing was changed, so let the other writers back in
+            if started and self.pending_writes == 0 and self.connection.in_transaction:
+                self.connection.commit()
+
+
+    def close(self) -> None:
+        super().close()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+    def compact(self) -> None:
+        # deleted rows are already gone, so this only gives the free pages back
+        self.flush()
+        self.connection.execute("VACUUM")
+
+
+    def ids(self) -> list[str]:
+        return [
+            f"contact_{position}"
+            for (position,) in self.connection.execute("SELECT position FROM contacts ORDER BY position")
+        ]
+
+
+    def get(self, contact_id:str) -> dict|None:
+        row = self.connection.execute(
+            f"SELECT {self._select_columns()} FROM contacts WHERE position = ?",
+            (self._position(contact_id),)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._row_data(row)
+
+
+    def iter_items(self, offset:int = 0, after:str|None = None):
+        after_position = 0 if after is None else self._position(after)
+        rows = self.connection.execute(
+            f"SELECT {self._select_columns()} FROM contacts WHERE position > ? "
+            "ORDER BY position LIMIT -1 OFFSET ?",
+            (after_position, offset)
+        )
+        for row in rows:
+            yield f"contact_{row[0]}", self._row_data(row)
+
+
+    def _select_columns(self) -> str:
+        """
+        Columns selected for a contact: its position, its fields and its
+        identifiers joined by the unit separator, all in one row.
+        """
+        return (
+            f"position, {', '.join(self.FIELDS)}, "
+            "(SELECT group_concat(keyword, char(31)) FROM "
+            "(SELECT keyword FROM identifiers WHERE contact = contacts.id ORDER BY ordinal))"
+        )
+
+
+    def _row_data(self, row:tuple) -> dict:
+        """
+        Turns a row selected with `_select_columns` into contact data.
+        """
+        data = dict(zip(self.FIELDS, row[1:-1]))
+        data["identifiers"] = row[-1].split("\x1f") if row[-1] else None
+        return data
+
+
+    def lookup_name(self, first_name:str, last_name:str|None) -> list[str]:
+        rows = self.connection.execute(
+            "SELECT position FROM contacts WHERE first_name = ? "
+            "UNION SELECT position FROM contacts WHERE last_name = ? "
+            "ORDER BY position",
+            (first_name, last_name)
+        )
+        return [f"contact_{position}" for (position,) in rows]
+
+
+    def query_identifiers(self, all_of:list[str] = (), any_of:list[str] = (), none_of:list[str] = ()) -> list[str]:
+        all_of, any_of, none_of = list(all_of), list(any_of), list(none_of)
+        if not all_of and not any_of and not none_of:
+            return []
+
+        def placeholders(values:list) -> str:
+            return ", ".join("?" * len(values))
+
+        excluded = (
+            f"AND contacts.id NOT IN (SELECT contact FROM identifiers WHERE keyword IN ({placeholders(none_of)})) "
+            if none_of else ""
+        )
+
+        # only excluded keywords, so every other contact matches
+        if not all_of and not any_of:
+            rows = self.connection.execute(
+                f"SELECT position FROM contacts WHERE 1 {excluded}ORDER BY position", none_of
+            )
+            return [f"contact_{position}" for (position,) in rows]
+
+        # one row per contact, counting its matching keywords for ranking
+        # and its required keywords to enforce `all_of`
+        rows = self.connection.execute(
+            "SELECT contacts.position, COUNT(*) AS hits, "
+            f"SUM(identifiers.keyword IN ({placeholders(all_of) or 'NULL'})) AS required "
+            "FROM identifiers JOIN contacts ON contacts.id = identifiers.contact "
+            f"WHERE identifiers.keyword IN ({placeholders(all_of + any_of)}) {excluded}"
+            "GROUP BY contacts.id "
+            f"HAVING COALESCE(required, 0) = {len(set(all_of))} "
+            "ORDER BY hits DESC, contacts.position",
+            all_of + all_of + any_of + none_of
+        )
+        return [f"contact_{position}" for (position, _, _) in rows]
+
+
+    def iter_prefix(self, prefix:str):
+        # the upper bound sorts after every string starting with the prefix
+        first_name, space, last_name = prefix.partition(" ")
+        upper = "\U0010ffff"
+
+        if space:
+            # "first l..." matches the whole first name and the start of the last name
+            queries = [(
+                "SELECT first_name || ' ' || last_name, position FROM contacts "
+                "WHERE first_name = ? COLLATE NOCASE AND last_name >= ? COLLATE NOCASE "
+                "AND last_name < ? COLLATE NOCASE ORDER BY last_name COLLATE NOCASE, position",
+                (first_name, last_name, last_name + upper)
+            )]
+        else:
+            queries = [(
+                "SELECT COALESCE(first_name || ' ' || last_name, first_name), position FROM contacts "
+                "WHERE first_name >= ? COLLATE NOCASE AND first_name < ? COLLATE NOCASE "
+                "ORDER BY first_name COLLATE NOCASE, last_name COLLATE NOCASE, position",
+                (prefix, prefix + upper)
+            ), (
+                "SELECT last_name, position FROM contacts "
+                "WHERE last_name >= ? COLLATE NOCASE AND last_name < ? COLLATE NOCASE "
+                "ORDER BY last_name COLLATE NOCASE, position",
+                (prefix, prefix + upper)
+            )]
+
+        # each query is already in name order, so merging them keeps it lazy
+        rows = heapq.merge(
+            *(self.connection.execute(query, parameters) for query, parameters in queries),
+            key=lambda row: (row[0].lower(), row[1])
+        )
+        seen:set = set()
+        for _, position in rows:
+            if position not in seen:
+                seen.add(position)
+                yield f"contact_{position}"
+
+
+    def fuzzy_search(self, query:str, max_distance:int|None = None) -> list[str]:
+        # the index lives in memory, so rebuild it when other processes change the names
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if self.fuzzy_index is None or data_version != self.fuzzy_data_version:
+            self.fuzzy_index = FuzzyIndex()
+            rows = self.connection.execute("SELECT position, first_name, last_name FROM contacts")
+            for position, first_name, last_name in rows:
+                self.fuzzy_index.add(f"contact_{position}", {"first_name": first_name, "last_name": last_name})
+            self.fuzzy_data_version = data_version
+
+        return self.fuzzy_index.search(query, max_distance)
+
+
+    def change_seq(self) -> int:
+        if self.change_log is None:
+            raise ValueError(f"{self.location} keeps no change log.")
+        return self.connection.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+
+    def changes_since(self, seq:int, limit:int|None = None) -> list[dict]:
+        if self.change_log is None:
+            raise ValueError(f"{self.location} keeps no change log.")
+        rows = self.connection.execute(
+            "SELECT seq, op, contact, data FROM changes WHERE seq > ? ORDER BY seq LIMIT ?",
+            (seq, -1 if limit is None else limit)
+        )
+        changes:list[dict] = []
+        for seq, op, contact_id, data in rows:
+            change = {"seq": seq, "op": op, "id": contact_id}
+            if data is not None:
+                change["data"] = json.loads(data)
+            changes.append(change)
+        return changes
+
+
+    def lookup_phone(self, phone:str|int) -> list[str]:
+        rows = self.connection.execute(
+            "SELECT position FROM contacts WHERE phone = ? ORDER BY position", (normalize_phone(phone),)
+        )
+        return [f"contact_{position}" for (position,) in rows]
+
+
+    def lookup_phones(self, phones:list[str]) -> dict[str, list[str]]:
+        matches:dict[str, list[str]] = {}
+        # one indexed query per chunk rather than per number. SQLite allows 999 parameters
+        for start in range(0, len(phones), 900):
+            chunk = phones[start:start + 900]
+            rows = self.connection.execute(
+                f"SELECT phone, position FROM contacts WHERE phone IN ({', '.join('?' * len(chunk))}) "
+                "ORDER BY position",
+                chunk
+            )
+            for phone, position in rows:
+                matches.setdefault(phone, []).append(f"contact_{position}")
+        return matches
+
+
+    def apply(self, record:dict) -> None:
+        position = self._position(record["id"])
+
+        # our own changes don't change the data version, so keep the index up to date
+        if self.fuzzy_index is not None:
+            if record["op"] != "add":
+                row = self.connection.execute(
+                    "SELECT first_name, last_name FROM contacts WHERE position = ?", (position,)
+                ).fetchone()
+                if row is not None:
+                    self.fuzzy_index.remove(record["id"], {"first_name": row[0], "last_name": row[1]})
+            if record["op"] != "remove":
+                self.fuzzy_index.add(record["id"], record["data"])
+
+        if record["op"] == "edit":
+            data = record["data"]
+            row = self.connection.execute("SELECT id FROM contacts WHERE position = ?", (position,)).fetchone()
+            if row is None:
+                return
+            self.connection.execute(
+                f"UPDATE contacts SET {', '.join(field + ' = ?' for field in self.FIELDS)} WHERE id = ?",
+                (*(data.get(field) for field in self.FIELDS), row[0])
+            )
+            self.connection.execute("DELETE FROM identifiers WHERE contact = ?", (row[0],))
+            self.connection.executemany(
+                "INSERT INTO identifiers (keyword, contact, ordinal) VALUES (?, ?, ?)",
+                [(keyword, row[0], ordinal) for ordinal, keyword in enumerate(data.get("identifiers") or [])]
+            )
+
+        elif record["op"] == "add":
+            data = record["data"]
+            cursor = self.connection.execute(
+                f"INSERT INTO contacts (position, {', '.join(self.FIELDS)}) VALUES (?{', ?' * len(self.FIELDS)})",
+                (position, *(data.get(field) for field in self.FIELDS))
+            )
+            self.connection.executemany(
+                "INSERT INTO identifiers (keyword, contact, ordinal) VALUES (?, ?, ?)",
+                [(keyword, cursor.lastrowid, ordinal) for ordinal, keyword in enumerate(data.get("identifiers") or [])]
+            )
+            self.connection.execute("UPDATE meta SET value = MAX(value, ?) WHERE key = 'count'", (position,))
+
+        elif record["op"] == "remove":
+            self.connection.execute("DELETE FROM contacts WHERE position = ?", (position,))
+
+
+    def _position(self, contact_id:str) -> int|None:
+        """
+        Returns the position encoded in a contact id, or `None` if it is malformed.
+        """
+        if not isinstance(contact_id, str):
+            return None
+        prefix, _, position = contact_id.partition("_")
+        if prefix != "contact" or not position.isdigit():
+            return None
+        return int(position)
+
+
+    def _signature(self) -> None:
+        return None
+
+
+    def _log_changes(self, records:list[dict]) -> None:
+        # already logged by `_write`, in the same transaction as the changes
+        pass
+
+
+    def _write(self) -> None:
+        if self.change_log is not None:
+            self.connection.executemany(
+                "INSERT INTO changes (op, contact, data) VALUES (?, ?, ?)",
+                [
+                    (record["op"], record["id"], json.dumps(record["data"]) if "data" in record else None)
+                    for record in self.pending_records
+                ]
+            )
+        self.connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        self.connection.commit()
+
+
+# storage engines by file extension
+STORAGE_ENGINES:dict[str, type[ContactStore]] = {
+    extension: engine
+    for engine in (JSONStore, JournalStore, PackedStore, SQLiteStore)
+    for extension in engine.extensions
+}
+
+
+def engine_for(location:str) -> type[ContactStore]|None:
+    """
+    Returns the storage engine used for a data file.
+
+    ### Parameters
+
+    `location` - The location of the data file.
+
+    ### Returns
+
+    `type[ContactStore]` - The engine selected by the file extension.
+
+    `None` - No engine handles this file extension.
+    """
+    return STORAGE_ENGINES.get(os.path.splitext(location)[1].lower())
@@ -0,0 +1,188 @@
+#! /usr/bin/env python3
+"""
+Keeps copies of a phonebook in sync by shipping the changes from its
+change log, rather than copying the whole data file. The primary copy
+has to be opened with `PhoneBook(change_log=True)`, as only the changes
+made while the log is on can be shipped.
+
+Through a file, eg one copied to the other machine:
+
+    seq = export_changes(primary, "delta.jsonl", since=last_exported)
+    last_applied = import_changes(replica, "delta.jsonl")
+
+Over a socket, with the primary serving its changes:
+
+    serve(primary, "127.0.0.1:5151")                    # on the primary
+    last_applied = pull(replica, "127.0.0.1:5151", last_applied)  # on the replica
+
+Addresses are `host:port` for TCP, or a path for a Unix socket. The
+protocol is one JSON line per request, `{"since": 12, "limit": 1000}`,
+answered by one JSON line, `{"seq": 40, "changes": [...]}`, where `seq`
+is the last change the primary has.
+"""
+import os
+import json
+import socket
+import itertools
+import socketserver
+from .phonebook import PhoneBook
+
+
+def export_changes(book:PhoneBook, location:str, since:int = 0) -> int:
+    """
+    Writes the changes after a sequence number to a JSON Lines file.
+
+    ### Parameters
+
+    `book` - The phonebook to export the changes of.
+
+    `location` - The file to write. Overwritten if it exists.
+
+    `since` - The sequence number of the last change the copy already has.
+
+    ### Returns
+
+    `int` - The sequence number of the last change written, or `since`
+    if there were none.
+    """
+    changes = book.changes_since(since)
+    with open(location, "w", encoding="utf-8") as file:
+        file.writelines(json.dumps(change) + "\n" for change in changes)
+    return changes[-1]["seq"] if changes else since
+
+
+def import_changes(book:PhoneBook, location:str, chunk_size:int = 10000) -> int:
+    """
+    Applies the changes in a file written by `export_changes`.
+
+    ### Parameters
+
+    `book` - The phonebook to apply the changes to.
+
+    `location` - The file to read.
+
+    `chunk_size` - The amount of changes applied and written at once.
+
+    ### Returns
+
+    `int` - The sequence number of the last change applied, or 0 if
+    the file has none.
+    """
+    seq:int = 0
+    with open(location, "r", encoding="utf-8") as file:
+        changes = (json.loads(line) for line in file if line.strip())
+        while chunk := list(itertools.islice(changes, chunk_size)):
+            seq = book.apply_changes(chunk)
+    return seq
+
+
+def parse_address(address:str) -> tuple[int, str|tuple[str, int]]:
+    """
+    Returns the socket family and address for a `host:port` or a Unix socket path.
+
+    ### Raises
+
+    `ValueError` - The address is a path, but Unix sockets aren't supported.
+    """
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return socket.AF_INET, (host, int(port))
+    if not hasattr(socket, "AF_UNIX"):
+        raise ValueError(f"\"{address}\" is not a host:port address, and Unix sockets aren't available here.")
+    return socket.AF_UNIX, address
+
+
+class ChangeRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Answers requests for changes until the client disconnects.
+    """
+
+    def handle(self) -> None:
+        book:PhoneBook = self.server.book
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                changes = book.changes_since(int(request.get("since", 0)), request.get("limit"))
+                response = {"seq": book.change_seq(), "changes": changes}
+            except (ValueError, TypeError, AttributeError) as e:
+                response = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+def make_server(book:PhoneBook, address:str) -> socketserver.BaseServer:
+    """
+    Creates a server for the changes of a phonebook, without starting it.
+    """
+    family, server_address = parse_address(address)
+    if family == socket.AF_INET:
+        server = socketserver.TCPServer(server_address, ChangeRequestHandler, bind_and_activate=False)
+        server.allow_reuse_address = True
+        server.server_bind()
+        server.server_activate()
+    else:
+        # a socket left behind by a server that didn't shut down cleanly
+        if os.path.exists(server_address):
+            os.remove(server_address)
+        server = socketserver.UnixStreamServer(server_address, ChangeRequestHandler)
+    server.book = book
+    return server
+
+
+def serve(book:PhoneBook, address:str) -> None:
+    """
+    Serves the changes of a phonebook to copies pulling them, until interrupted.
+
+    ### Parameters
+
+    `book` - The phonebook to serve.
+
+    `address` - `host:port`, or a path for a Unix socket. Only copies
+    that can reach the address can pull, so keep it local or firewalled.
+    """
+    with make_server(book, address) as server:
+        server.serve_forever()
+
+
+def pull(book:PhoneBook, address:str, since:int = 0, batch_size:int = 1000) -> int:
+    """
+    Brings a copy of a phonebook up to date with the one served at an address.
+
+    ### Parameters
+
+    `book` - The copy to apply the changes to.
+
+    `address` - Where the other phonebook is served, see `serve`.
+
+    `since` - The sequence number returned by the last pull, or 0 for every change.
+
+    `batch_size` - The amount of changes asked for at once.
+
+    ### Returns
+
+    `int` - The sequence number of the last change applied, to pass in next time.
+
+    ### Raises
+
+    `ConnectionError` - The server closed the connection or refused the request.
+    """
+    family, server_address = parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as connection:
+        connection.connect(server_address)
+        file = connection.makefile("rwb")
+
+        while True:
+            file.write(json.dumps({"since": since, "limit": batch_size}).encode() + b"\n")
+            file.flush()
+            line = file.readline()
+            if not line:
+                raise ConnectionError(f"{address} closed the connection.")
+            response = json.loads(line)
+            if "error" in response:
+                raise ConnectionError(f"{address} refused the request: {response['error']}")
+
+            if response["changes"]:
+                since = book.apply_changes(response["changes"])
+            # fewer than asked for means there are no more for now
+            if len(response["changes"]) < batch_size:
+                return since
@@ -26,11 +26,11 @@ class Textbox:
 
     Ctrl-A      Go to left edge of window.
     Ctrl-B      Cursor left, wrapping to previous line if appropriate.
-    Ctrl-D      Delete character under cursor.
+    Ctrl-D      Terminate, returning the text.
     Ctrl-E      Go to right edge (stripspaces off) or end of line (stripspaces on).
     Ctrl-F      Cursor right, wrapping to next line when appropriate.
-    Ctrl-G      Terminate, returning the window contents.
-    Ctrl-H      Delete character backward.
+    Ctrl-G      Terminate, returning the text.
+    Ctrl-H      Delete character backward, joining lines at the start of a line.
     Ctrl-J      Terminate if the window is 1 line, otherwise insert newline.
     Ctrl-K      If line is blank, delete it, otherwise clear to end of line.
     Ctrl-L      Refresh screen.
@@ -43,6 +43,12 @@ class Textbox:
 
     KEY_LEFT = Ctrl-B, KEY_RIGHT = Ctrl-F, KEY_UP = Ctrl-P, KEY_DOWN = Ctrl-N
     KEY_BACKSPACE = Ctrl-h
+
+    The text lives in a list of lines rather than in the window, so text
+    longer than the window scrolls and `gather` doesn't read the screen back.
+    Lines are never wider than the window; typing past the right edge
+    carries on at the start of a new line. Only lines that changed are
+    redrawn, so a keystroke costs the same however long the text is.
     """
     def __init__(self, win, insert_mode=False):
         self.win = win
@@ -50,133 +56,193 @@ class Textbox:
         self._update_max_yx()
         self.stripspaces = 1
         self.lastcmd = None
+        # the text, one string per line, and the cursor position in it
+        self.lines = [""]
+        self.row = 0
+        self.col = 0
+        # the first line shown in the window
+        self.top = 0
+        # lines to redraw, or everything if `redraw_all` is set
+        self.dirty = set()
+        self.redraw_all = True
         win.keypad(1)
+        self._render()
 
     def _update_max_yx(self):
         maxy, maxx = self.win.getmaxyx()
         self.maxy = maxy - 1
         self.maxx = maxx - 1
 
-    def _end_of_line(self, y):
-        """Go to the location of the first blank on the given line,
-        returning the index of the last non-blank character."""
-        self._update_max_yx()
-        last = self.maxx
-        while True:
-            if curses.ascii.ascii(self.win.inch(y, last)) != curses.ascii.SP:
-                last = min(self.maxx, last+1)
-                break
-            elif last == 0:
-                break
-            last = last - 1
-        return last
+    def _end_of_line(self, row):
+        """Return the index just past the last non-blank character
+        of the given line."""
+        return len(self.lines[row].rstrip())
+
+    def _set_line(self, row, text, carry=None):
+        """Replace a line, wrapping whatever doesn't fit. The overflow
+        is carried into the next line if it continues this one, which
+        is taken to be the case if this line was full, or onto a new line."""
+        width = self.maxx + 1
+        if carry is None:
+            carry = len(self.lines[row]) >= width
+        while len(text) > width:
+            self.lines[row] = text[:width]
+            self.dirty.add(row)
+            overflow = text[width:]
+            row += 1
+            if carry and row < len(self.lines):
+                carry = len(self.lines[row]) >= width
+                text = overflow + self.lines[row]
+            else:
+                self.lines.insert(row, "")
+                self.redraw_all = True
+                carry = False
+                text = overflow
+        self.lines[row] = text
+        self.dirty.add(row)
 
     def _insert_printable_char(self, ch):
-        self._update_max_yx()
-        (y, x) = self.win.getyx()
-        backyx = None
-        while y < self.maxy or x < self.maxx:
-            if self.insert_mode:
-                oldch = self.win.inch()
-            # The try-catch ignores the error we trigger from some curses
-            # versions by trying to write into the lowest-rightmost spot
-            # in the window.
-            try:
-                self.win.addch(ch)
-            except curses.error:
-                pass
-            if not self.insert_mode or not curses.ascii.isprint(oldch):
-                break
-            ch = oldch
-            (y, x) = self.win.getyx()
-            # Remember where to put the cursor back since we are in insert_mode
-            if backyx is None:
-                backyx = y, x
+        line = self.lines[self.row]
+        if self.col >= self.maxx + 1:
+            # past the right edge, carry on at the start of a new line
+            self._split_line()
+            line = ""
+        # moving past the end of a line leaves blanks behind
+        line = line.ljust(self.col)
+        if self.insert_mode:
+            line = line[:self.col] + chr(ch) + line[self.col:]
+        else:
+            line = line[:self.col] + chr(ch) + line[self.col+1:]
+        self._set_line(self.row, line)
+        self.col += 1
+
+    def _split_line(self):
+        """Break the line at the cursor and move to the start of the new line."""
+        line = self.lines[self.row]
+        self.lines[self.row:self.row+1] = [line[:self.col], line[self.col:]]
+        self.row += 1
+        self.col = 0
+        self.redraw_all = True
 
-        if backyx is not None:
-            self.win.move(*backyx)
+    def _scroll_to_cursor(self):
+        """Move the window over the text so the cursor is in view."""
+        if self.row < self.top:
+            self.top = self.row
+            self.redraw_all = True
+        elif self.row > self.top + self.maxy:
+            self.top = self.row - self.maxy
+            self.redraw_all = True
+
+    def _render(self):
+        """Redraw the lines that changed and place the cursor."""
+        self._scroll_to_cursor()
+        if self.redraw_all:
+            rows = range(self.top, self.top + self.maxy + 1)
+        else:
+            rows = [row for row in self.dirty if self.top <= row <= self.top + self.maxy]
+        for row in rows:
+            y = row - self.top
+            self.win.move(y, 0)
+            self.win.clrtoeol()
+            if row < len(self.lines) and self.lines[row]:
+                # The try-catch ignores the error we trigger from some curses
+                # versions by trying to write into the lowest-rightmost spot
+                # in the window.
+                try:
+                    self.win.addstr(y, 0, self.lines[row])
+                except curses.error:
+                    pass
+        self.dirty.clear()
+        self.redraw_all = False
+        self.win.move(self.row - self.top, min(self.col, self.maxx))
 
     def do_command(self, ch):
         "Process a single editing command."
         self._update_max_yx()
-        (y, x) = self.win.getyx()
         self.lastcmd = ch
+        line = self.lines[self.row]
         if curses.ascii.isprint(ch):
-            if y < self.maxy or x < self.maxx:
-                self._insert_printable_char(ch)
+            self._insert_printable_char(ch)
         elif ch == curses.ascii.SOH:                           # ^a
-            self.win.move(y, 0)
+            self.col = 0
         elif ch in (curses.ascii.STX,curses.KEY_LEFT, curses.ascii.BS,curses.KEY_BACKSPACE):
-            if x > 0:
-                self.win.move(y, x-1)
-            elif y == 0:
-                pass
-            elif self.stripspaces:
-                self.win.move(y-1, self._end_of_line(y-1))
-            else:
-                self.win.move(y-1, self.maxx)
-            if ch in (curses.ascii.BS, curses.KEY_BACKSPACE):
-                self.win.delch()
+            backspace = ch in (curses.ascii.BS, curses.KEY_BACKSPACE)
+            if self.col > 0:
+                self.col = min(self.col, self.maxx + 1) - 1
+                if backspace and self.col < len(line):
+                    self._set_line(self.row, line[:self.col] + line[self.col+1:])
+            elif self.row > 0:
+                self.row -= 1
+                self.col = self._end_of_line(self.row) if self.stripspaces else len(self.lines[self.row])
+                if backspace:
+                    # join the lines, wrapping what doesn't fit
+                    del self.lines[self.row+1]
+                    self._set_line(self.row, self.lines[self.row][:self.col] + line, carry=False)
+                    self.redraw_all = True
         elif ch == curses.ascii.EOT:                           # ^d
             return 0
         elif ch == curses.ascii.ENQ:                           # ^e
             if self.stripspaces:
-                self.win.move(y, self._end_of_line(y))
+                self.col = self._end_of_line(self.row)
             else:
-                self.win.move(y, self.maxx)
+                self.col = self.maxx
         elif ch in (curses.ascii.ACK, curses.KEY_RIGHT):       # ^f
-            if x < self.maxx:
-                self.win.move(y, x+1)
-            elif y == self.maxy:
-                pass
-            else:
-                self.win.move(y+1, 0)
+            if self.col < self.maxx:
+                self.col += 1
+            elif self.row + 1 < len(self.lines):
+                self.row += 1
+                self.col = 0
         elif ch == curses.ascii.BEL:                           # ^g
             return 0
         elif ch == curses.ascii.NL:                            # ^j
             if self.maxy == 0:
                 return 0
-            elif y < self.maxy:
-                self.win.move(y+1, 0)
+            elif self.insert_mode or self.row + 1 == len(self.lines):
+                self.col = min(self.col, len(line))
+                self._split_line()
+            else:
+                self.row += 1
+                self.col = 0
         elif ch == curses.ascii.VT:                            # ^k
-            if x == 0 and self._end_of_line(y) == 0:
-                self.win.deleteln()
+            if self.col == 0 and self._end_of_line(self.row) == 0:
+                if len(self.lines) > 1:
+                    del self.lines[self.row]
+                    self.row = min(self.row, len(self.lines) - 1)
+                    self.redraw_all = True
+                else:
+                    self._set_line(self.row, "")
             else:
-                # first undo the effect of self._end_of_line
-                self.win.move(y, x)
-                self.win.clrtoeol()
+                self._set_line(self.row, line[:self.col])
         elif ch == curses.ascii.FF:                            # ^l
+            self.redraw_all = True
+            self._render()
             self.win.refresh()
         elif ch in (curses.ascii.SO, curses.KEY_DOWN):         # ^n
-            if y < self.maxy:
-                self.win.move(y+1, x)
-                if x > self._end_of_line(y+1):
-                    self.win.move(y+1, self._end_of_line(y+1))
+            if self.row + 1 < len(self.lines):
+                self.row += 1
+                self.col = min(self.col, self._end_of_line(self.row))
         elif ch == curses.ascii.SI:                            # ^o
-            self.win.insertln()
+            self.lines.insert(self.row, "")
+            self.redraw_all = True
         elif ch in (curses.ascii.DLE, curses.KEY_UP):          # ^p
-            if y > 0:
-                self.win.move(y-1, x)
-                if x > self._end_of_line(y-1):
-                    self.win.move(y-1, self._end_of_line(y-1))
+            if self.row > 0:
+                self.row -= 1
+                self.col = min(self.col, self._end_of_line(self.row))
+        elif ch == curses.KEY_RESIZE:
+            self.redraw_all = True
+        self._render()
         return 1
 
     def gather(self):
-        "Collect and return the contents of the window."
-        result = ""
-        self._update_max_yx()
-        for y in range(self.maxy+1):
-            self.win.move(y, 0)
-            stop = self._end_of_line(y)
-            if stop == 0 and self.stripspaces:
-                continue
-            for x in range(self.maxx+1):
-                if self.stripspaces and x > stop:
-                    break
-                result = result + chr(curses.ascii.ascii(self.win.inch(y, x)))
-            if self.maxy > 0:
-                result = result + "\n"
-        return result
+        "Return the text, without trailing blanks if stripspaces is on."
+        lines = self.lines
+        if self.stripspaces:
+            lines = [line.rstrip() for line in lines]
+            while lines and not lines[-1]:
+                lines.pop()
+        if self.maxy > 0:
+            return "".join(line + "\n" for line in lines)
+        return "".join(lines)
 
     def edit(self, validate=None):
         "Edit in the widget window and collect the results."
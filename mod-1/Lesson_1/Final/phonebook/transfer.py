@@ -0,0 +1,270 @@
+#! /usr/bin/env python3
+"""
+Readers and writers for moving contacts in and out of a phonebook as CSV,
+JSON Lines or vCard files.
+
+Readers yield one record at a time and writers take any iterable of
+contacts, so files of any size can be streamed through without holding
+them in memory.
+
+A record is a dictionary with the keys `name`, `phone`, `email`, `address`
+and `identifiers`, matching the parameters of `PhoneBook.add_contact`.
+"""
+import os
+import csv
+import json
+
+
+# formats by file extension
+FORMATS:dict[str, str] = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".vcf": "vcard",
+    ".vcard": "vcard",
+}
+
+CSV_COLUMNS:list[str] = ["contact_id", "name", "phone", "email", "address", "identifiers"]
+
+
+def detect_format(location:str) -> str:
+    """
+    Returns the format of a file from its extension.
+
+    ### Raises
+
+    `ValueError` - The extension is not a supported format.
+    """
+    file_format = FORMATS.get(os.path.splitext(location)[1].lower())
+    if file_format is None:
+        raise ValueError(f"Unsupported file format \"{location}\". Expected one of {sorted(FORMATS)}.")
+    return file_format
+
+
+def read_records(file, file_format:str):
+    """
+    Yields the records in an open text file.
+
+    ### Parameters
+
+    `file` - The file to read from.
+
+    `file_format` - One of `"csv"`, `"jsonl"` or `"vcard"`.
+    """
+    readers = {"csv": _read_csv, "jsonl": _read_jsonl, "vcard": _read_vcard}
+    if file_format not in readers:
+        raise ValueError(f"Unsupported file format \"{file_format}\".")
+    return readers[file_format](file)
+
+
+def write_records(file, file_format:str, contacts) -> int:
+    """
+    Writes contacts to an open text file.
+
+    ### Parameters
+
+    `file` - The file to write to.
+
+    `file_format` - One of `"csv"`, `"jsonl"` or `"vcard"`.
+
+    `contacts` - An iterable of `(contact_id, data)` pairs.
+
+    ### Returns
+
+    `int` - The amount of contacts written.
+    """
+    writers = {"csv": _write_csv, "jsonl": _write_jsonl, "vcard": _write_vcard}
+    if file_format not in writers:
+        raise ValueError(f"Unsupported file format \"{file_format}\".")
+    return writers[file_format](file, contacts)
+
+
+def _record(name:str, phone, email, address, identifiers) -> dict:
+    """
+    Builds a record, turning blank values into `None`.
+    """
+    return {
+        "name": name or "",
+        "phone": phone or None,
+        "email": email or None,
+        "address": address or None,
+        "identifiers": list(identifiers) if identifiers else None,
+    }
+
+
+def _full_name(data:dict) -> str:
+    """
+    Joins the stored first and last names.
+    """
+    return " ".join(part for part in (data["first_name"], data["last_name"]) if part)
+
+
+# CSV
+
+
+def _read_csv(file):
+    for row in csv.DictReader(file):
+        name = row.get("name") or " ".join(
+            part for part in (row.get("first_name"), row.get("last_name")) if part
+        )
+        yield _record(
+            name,
+            row.get("phone"),
+            row.get("email"),
+            row.get("address"),
+            (row.get("identifiers") or "").split(),
+        )
+
+
+def _write_csv(file, contacts) -> int:
+    writer = csv.writer(file)
+    writer.writerow(CSV_COLUMNS)
+    written:int = 0
+    for contact_id, data in contacts:
+        writer.writerow([
+            contact_id,
+            _full_name(data),
+            data["phone"] or "",
+            data["email"] or "",
+            data["address"] or "",
+            " ".join(data["identifiers"] or ()),
+        ])
+        written += 1
+    return written
+
+
+# JSON Lines
+
+
+def _read_jsonl(file):
+    for line in file:
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        name = row.get("name") or " ".join(
+            part for part in (row.get("first_name"), row.get("last_name")) if part
+        )
+        yield _record(name, row.get("phone"), row.get("email"), row.get("address"), row.get("identifiers"))
+
+
+def _write_jsonl(file, contacts) -> int:
+    written:int = 0
+    for contact_id, data in contacts:
+        file.write(json.dumps({
+            "contact_id": contact_id,
+            "name": _full_name(data),
+            "phone": data["phone"],
+            "email": data["email"],
+            "address": data["address"],
+            "identifiers": data["identifiers"],
+        }) + "\n")
+        written += 1
+    return written
+
+
+# vCard
+
+
+def _escape(value:str) -> str:
+    """
+    Escapes a vCard text value.
+    """
+    return (value.replace("\\", "\\\\").replace("\n", "\\n")
+            .replace(",", "\\,").replace(";", "\\;"))
+
+
+def _split_escaped(value:str, separator:str) -> list[str]:
+    """
+    Splits a vCard value on unescaped separators and unescapes the parts.
+    """
+    parts:list[str] = []
+    current:list[str] = []
+    escaped = False
+    for char in value:
+        if escaped:
+            current.append("\n" if char in "nN" else char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == separator:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current))
+    return parts
+
+
+def _unfold(file):
+    """
+    Yields the logical lines of a vCard file, joining folded lines.
+    """
+    previous = None
+    for line in file:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and previous is not None:
+            previous += line[1:]
+            continue
+        if previous is not None:
+            yield previous
+        previous = line
+    if previous is not None:
+        yield previous
+
+
+def _read_vcard(file):
+    card:dict|None = None
+    for line in _unfold(file):
+        if not line.strip():
+            continue
+        key, _, value = line.partition(":")
+        # drop parameters and groups, eg "item1.TEL;TYPE=CELL"
+        key = key.split(";")[0].split(".")[-1].upper()
+
+        if key == "BEGIN":
+            card = {}
+        elif key == "END" and card is not None:
+            name = card.get("FN")
+            if not name and "N" in card:
+                last_name, first_name = (card["N"] + [""])[:2]
+                name = " ".join(part for part in (first_name, last_name) if part)
+            yield _record(
+                name,
+                card.get("TEL"),
+                card.get("EMAIL"),
+                ", ".join(part for part in card.get("ADR", []) if part),
+                [keyword for keyword in card.get("CATEGORIES", []) if keyword],
+            )
+            card = None
+        elif card is not None and key not in card:
+            # only the first of each property is kept
+            if key in ("N", "ADR"):
+                card[key] = _split_escaped(value, ";")
+            elif key == "CATEGORIES":
+                card[key] = _split_escaped(value, ",")
+            else:
+                card[key] = _split_escaped(value, "\0")[0]
+
+
+def _write_vcard(file, contacts) -> int:
+    written:int = 0
+    for contact_id, data in contacts:
+        lines = [
+            "BEGIN:VCARD",
+            "VERSION:3.0",
+            f"UID:{contact_id}",
+            f"N:{_escape(data['last_name'] or '')};{_escape(data['first_name'] or '')};;;",
+            f"FN:{_escape(_full_name(data))}",
+        ]
+        if data["phone"]:
+            lines.append(f"TEL:{_escape(str(data['phone']))}")
+        if data["email"]:
+            lines.append(f"EMAIL:{_escape(data['email'])}")
+        if data["address"]:
+            lines.append(f"ADR:;;{_escape(data['address'])};;;;")
+        if data["identifiers"]:
+            lines.append(f"CATEGORIES:{','.join(_escape(keyword) for keyword in data['identifiers'])}")
+        lines.append("END:VCARD")
+        file.write("\r\n".join(lines) + "\r\n")
+        written += 1
+    return written
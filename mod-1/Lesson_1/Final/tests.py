@@ -0,0 +1,1135 @@
+#! /usr/bin/env python3
+import pytest
+
+"""
+Testing file. Ran with pytest, from this folder.
+"""
+
+
+import io
+import os
+import sys
+import json
+import smtplib
+import threading
+import multiprocessing
+from concurrent.futures import Future
+from phonebook.phonebook import PhoneBook, CLI, IDsChangedError
+from phonebook.indexes import parse_keyword_query
+from phonebook.storage import JournalStore
+from phonebook import sync, commands, mail, dedup
+from phonebook.phones import normalize_phone, split_extension
+
+
+# every storage engine, picked by the data file extension
+engines = [".json", ".journal", ".pbk", ".db"]
+write_policies = ["immediate", "batched", "on_exit"]
+
+contacts = [
+    ("John Smith", "555-123-4567", "john@example.com", "1 High Street", ["work", "london"]),
+    ("Jane Smith", None, "jane@example.com", None, ["family", "london"]),
+    ("John Doe", "(555) 765-4321", None, None, ["work", "paris", "old"]),
+    ("Alice", "5550001111", "alice@example.com", None, None),
+]
+
+
+def open_book(location:str, write_policy:str = "immediate", change_log:bool = False) -> PhoneBook:
+    """
+    Opens a phonebook, failing the test if the data file isn't supported.
+    """
+    book = PhoneBook(write_policy, change_log=change_log)
+    assert book.set_data_file(location) == 0, f"Could not open {location}"
+    return book
+
+
+def fill_book(book:PhoneBook) -> list[str]:
+    """
+    Adds the test contacts and returns their ids.
+    """
+    return [book.add_contact(*contact) for contact in contacts]
+
+
+def snapshot(book:PhoneBook) -> dict:
+    """
+    Returns every contact in a phonebook, by id.
+    """
+    return dict(book.iter_contacts())
+
+
+def add_contacts(location:str, writer_number:int, amount:int) -> None:
+    """
+    Adds contacts from another process, for the lost update test.
+    """
+    book = open_book(location)
+    for number in range(amount):
+        book.add_contact(f"Writer{writer_number} Contact{number}", None, f"w{writer_number}.c{number}@example.com", None, None)
+    book.close()
+
+
+
+class TestClass_PhoneBook:
+    """
+    Testing class for the `PhoneBook` class, run against every storage engine.
+    """
+
+
+    @pytest.mark.parametrize("engine", engines)
+    def test_add_and_get(self, tmp_path, engine):
+        """
+        Tests that added contacts can be read back, with their phone numbers normalized.
+        """
+        book = open_book(str(tmp_path / f"contacts{engine}"))
+        ids = fill_book(book)
+        assert all(isinstance(contact_id, str) for contact_id in ids), "add_contact did not return the new ids."
+        assert len(set(ids)) == len(contacts), "Contact ids were reused."
+        assert sorted(book.get_all_contact_ids()) == sorted(ids)
+
+        data = book.get_contact_data(ids[0])
+        assert (data["first_name"], data["last_name"]) == ("John", "Smith")
+        assert data["phone"] == "5551234567", "Phone number was not normalized."
+        assert data["identifiers"] == ["work", "london"]
+        assert book.get_contact_data("contact_999") == -1
+        book.close()
+
+
+    @pytest.mark.parametrize("engine", engines)
+    def test_remove(self, tmp_path, engine):
+        """
+        Tests that removing a contact keeps the ids of the others.
+        """
+        book = open_book(str(tmp_path / f"contacts{engine}"))
+        ids = fill_book(book)
+        assert book.remove_contact(ids[1]) == 0
+        assert book.remove_contact(ids[1]) == -1, "Removed the same contact twice."
+        assert book.get_contact_data(ids[1]) == -1
+        assert sorted(book.get_all_contact_ids()) == sorted(ids[:1] + ids[2:])
+        assert book.lookup_contact("Jane") is None
+        book.close()
+
+
+    @pytest.mark.parametrize("engine", engines)
+    def test_edit(self, tmp_path, engine):
+        """
+        Tests that editing a contact replaces its details and its index entries.
+        """
+        book = open_book(str(tmp_path / f"contacts{engine}"))
+        ids = fill_book(book)
+        assert book.edit_contact(ids[0], "Johnny Smith", "5559998888", None, None, ["home"]) == 0
+        assert book.edit_contact("contact_999", "Nobody", "1", None, None, None) == -1
+
+        data = book.get_contact_data(ids[0])
+        assert (data["first_name"], data["phone"], data["email"]) == ("Johnny", "5559998888", None)
+        assert book.lookup_contact("Johnny") == [ids[0]]
+        assert book.reverse_lookup("555-123-4567") is None, "Old phone number is still indexed."
+        assert book.find_contact_lists(["home"]) == [ids[0]]
+        assert ids[0] not in (book.find_contact_lists(["work"]) or [])
+        book.close()
+
+
+    @pytest.mark.parametrize("engine", engines)
+    def test_lookup_and_search(self, tmp_path, engine):
+        """
+        Tests name lookups, prefix, fuzzy and reverse searches.
+        """
+        book = open_book(str(tmp_path / f"contacts{engine}"))
+        ids = fill_book(book)
+        assert sorted(book.lookup_contact("John")) == sorted([ids[0], ids[2]])
+        # matches the first name or the last name
+        assert sorted(book.lookup_contact("John Smith")) == sorted(ids[:3])
+        assert book.lookup_contact("Alice") == [ids[3]]
+        assert book.lookup_contact("Nobody") is None
+        assert sorted(book.prefix_search("Smi")) == sorted([ids[0], ids[1]])
+        assert ids[0] in book.fuzzy_search("Jon Smyth")
+        assert book.reverse_lookup("+1 555 765 4321") == [ids[2]]
+        book.close()
+
+
+    @pytest.mark.parametrize("engine", engines)
+    def test_fuzzy_search_sounds(self, tmp_path, engine):
+        """
+        Tests that names sounding alike only match if they're spelled alike too.
+        """
+        book = open_book(str(tmp_path / f"contacts{engine}"))
+        book.add_contact("Jane Doe", "5551234567", None, None, None)
+        john = book.add_contact("John Smith", "5557654321", None, None, None)
+        lynne = book.add_contact("Lynne Hall", "5550001111", None, None, None)
+
+        # jon sounds like jane, but they share no letters in a row
+        assert book.fuzzy_search("Jon Smyth") == [john]
+        assert book.fuzzy_search("Jon") == [john]
+        # two edits from lyn, one more than allowed, but sounding alike
+        assert book.fuzzy_search("Lyn") == [lynne]
+        book.close()
+
+
+    def test_engine_parity(self, tmp_path):
+        """
+        Tests that every engine gives the same answers for the same changes.
+        """
+        results = []
+        for engine in engines:
+            book = open_book(str(tmp_path / f"contacts{engine}"))
+            ids = fill_book(book)
+            book.remove_contact(ids[3])
+            book.edit_contact(ids[1], "Jane Doe", None, "jane@example.org", None, ["family"])
+            results.append((
+                snapshot(book),
+                book.lookup_contact("Doe"),
+                book.prefix_search("J", None),
+                book.search_keywords(*parse_keyword_query("london work -old")),
+            ))
+            book.close()
+
+        for engine, result in zip(engines[1:], results[1:]):
+            assert result == results[0], f"{engine} differs from {engines[0]}"
+
+
+    @pytest.mark.parametrize("engine", engines)
+    def test_duplicate_keywords(self, tmp_path, engine):
+        """
+        Tests that every engine drops repeated keywords the same way,
+        keeping the first of each.
+        """
+        location = str(tmp_path / f"contacts{engine}")
+        book = open_book(location)
+        contact_id = book.add_contact("John Smith", "5551234567", None, None, ["work", "london", "work"])
+        assert book.get_contact_data(contact_id)["identifiers"] == ["work", "london"]
+        book.edit_contact(contact_id, "John Smith", "5551234567", None, None, ["home", "home"])
+        book.close()
+
+        book = open_book(location)
+        assert book.get_contact_data(contact_id)["identifiers"] == ["home"]
+        assert book.find_contact_lists(["home"]) == [contact_id]
+        book.close()
+
+
+    def test_sqlite_keeps_no_lock_file(self, tmp_path):
+        """
+        Tests that the SQLite engine leaves the locking to SQLite.
+        """
+        location = str(tmp_path / "contacts.db")
+        book = open_book(location)
+        fill_book(book)
+        book.close()
+        assert not os.path.exists(location + ".lock")
+
+
+    @pytest.mark.parametrize("engine", engines)
+    @pytest.mark.parametrize("write_policy", write_policies)
+    def test_persistence(self, tmp_path, engine, write_policy):
+        """
+        Tests that contacts are still there after the phonebook is reopened,
+        whatever the write policy.
+        """
+        location = str(tmp_path / f"contacts{engine}")
+        book = open_book(location, write_policy)
+        ids = fill_book(book)
+        book.remove_contact(ids[0])
+        book.edit_contact(ids[1], "Jane Doe", None, "jane@example.org", None, None)
+        expected = snapshot(book)
+        book.close()
+
+        book = open_book(location)
+        assert snapshot(book) == expected, f"Changes lost with the {write_policy} policy."
+        assert book.lookup_contact("Jane") == [ids[1]]
+        # ids of removed contacts are never handed out again
+        assert book.add_contact("New Contact", "1", None, None, None) not in ids
+        book.close()
+
+
+    @pytest.mark.parametrize("engine", [".json", ".journal", ".pbk"])
+    def test_renumbered_ids(self, tmp_path, engine):
+        """
+        Tests that contacts held back by the write policy, whose ids were
+        handed out by another writer first, are kept under new ids and
+        that the new ids are reported.
+        """
+        location = str(tmp_path / f"contacts{engine}")
+        book = open_book(location, "on_exit")
+        held_back = book.add_contact("Held Back", "5551112222", None, None, None)
+
+        other = open_book(location)
+        taken = other.add_contact("Other Writer", "5553334444", None, None, None)
+        assert taken == held_back
+        other.close()
+
+        with pytest.raises(IDsChangedError) as error:
+            book.flush()
+        new_id = error.value.renumbered[held_back]
+        assert new_id != held_back
+        assert book.get_contact_data(new_id)["first_name"] == "Held"
+        assert book.get_contact_data(held_back)["first_name"] == "Other"
+        book.close()
+
+        book = open_book(location)
+        assert sorted(book.get_all_contact_ids()) == sorted([held_back, new_id]), "Renumbered contact was not written."
+        book.close()
+
+
+    @pytest.mark.parametrize("engine", engines)
+    def test_lost_updates(self, tmp_path, engine):
+        """
+        Tests that several processes adding to one phonebook at once
+        don't lose or duplicate each other's contacts.
+        """
+        location = str(tmp_path / f"contacts{engine}")
+        open_book(location).close()
+        writers, amount = 4, 25
+
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=add_contacts, args=(location, number, amount)) for number in range(writers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+            assert process.exitcode == 0, "A writer failed."
+
+        book = open_book(location)
+        emails = [data["email"] for data in snapshot(book).values()]
+        assert len(emails) == writers * amount, "Contacts were lost or duplicated."
+        assert len(set(emails)) == writers * amount, "Contacts were duplicated."
+        book.close()
+
+
+
+class TestClass_Paging:
+    """
+    Testing class for paging through contacts.
+    """
+
+
+    @pytest.mark.parametrize("engine", engines)
+    def test_iter_contacts(self, tmp_path, engine):
+        """
+        Tests offsets and limits, which skip removed contacts.
+        """
+        book = open_book(str(tmp_path / f"contacts{engine}"))
+        ids = [book.add_contact(f"Person{number} Test", str(5550000000 + number), None, None, None) for number in range(10)]
+        book.remove_contact(ids[2])
+        alive = ids[:2] + ids[3:]
+
+        assert [contact_id for contact_id, _ in book.iter_contacts()] == alive
+        assert [contact_id for contact_id, _ in book.iter_contacts(3, 4)] == alive[3:7]
+        assert list(book.iter_contacts(20)) == []
+        # handed out as copies, so changing them doesn't change the book
+        for _, data in book.iter_contacts(0, 1):
+            data["first_name"] = "Changed"
+        assert book.get_contact_data(ids[0])["first_name"] == "Person0"
+        book.close()
+
+
+    @pytest.mark.parametrize("engine", engines)
+    def test_page_contacts(self, tmp_path, engine):
+        """
+        Tests that cursors walk every contact once, even when contacts
+        are removed and added between pages.
+        """
+        book = open_book(str(tmp_path / f"contacts{engine}"))
+        ids = [book.add_contact(f"Person{number} Test", str(5550000000 + number), None, None, None) for number in range(10)]
+
+        page, cursor = book.page_contacts(None, 4)
+        assert [contact_id for contact_id, _ in page] == ids[:4] and cursor == ids[3]
+        # an offset would skip a contact after this
+        book.remove_contact(ids[1])
+        page, cursor = book.page_contacts(cursor, 4)
+        assert [contact_id for contact_id, _ in page] == ids[4:8]
+
+        late = book.add_contact("Late Contact", "5559999999", None, None, None)
+        page, cursor = book.page_contacts(cursor, 4)
+        assert [contact_id for contact_id, _ in page] == ids[8:] + [late]
+        assert cursor is None, "Cursor given for a page that doesn't exist."
+        assert book.page_contacts(None, 20) == (list(book.iter_contacts()), None)
+        book.close()
+
+
+
+class TestClass_Commands:
+    """
+    Testing class for the headless command and script modes.
+    """
+
+
+    def test_execute(self, tmp_path):
+        """
+        Tests requests for every kind of change and lookup.
+        """
+        book = open_book(str(tmp_path / "contacts.json"))
+        contact_id = commands.execute(book, {"command": "add", "name": "John Smith", "phone": "555-123-4567", "identifiers": ["work"]})
+        assert contact_id == "contact_1"
+        assert commands.execute(book, {"command": "get", "contact_id": contact_id})["phone"] == "5551234567"
+
+        # details left out stay, given ones can be cleared
+        assert commands.execute(book, {"command": "edit", "contact_id": contact_id, "email": "john@example.com", "identifiers": None}) is True
+        data = commands.execute(book, {"command": "get", "contact_id": contact_id})
+        assert (data["phone"], data["email"], data["identifiers"]) == ("5551234567", "john@example.com", None)
+
+        assert [contact["contact_id"] for contact in commands.execute(book, {"command": "search", "name": "Jo", "prefix": True})] == [contact_id]
+        assert commands.execute(book, {"command": "reverse", "phones": ["(555) 123 4567"]}) == [{"phone": "(555) 123 4567", "contact_ids": [contact_id]}]
+        assert commands.execute(book, {"command": "remove", "contact_ids": [contact_id, "contact_9"]}) == {contact_id: True, "contact_9": False}
+        assert commands.execute(book, {"command": "get", "contact_id": contact_id}) is None
+        assert commands.execute(book, {"command": "edit", "contact_id": contact_id, "name": "Nobody"}) is False
+        book.close()
+
+
+    @pytest.mark.parametrize("request_line", [
+        '["add"]',
+        '{"command": "launch"}',
+        '{"command": "remove", "contact_ids": "contact_1"}',
+        '{"command": "get", "contact_id": 5}',
+        '{"command": "edit"}',
+        '{"command": "add", "name": "No Contact Method"}',
+        '{"command": "import"}',
+        'not json',
+    ])
+    @pytest.mark.parametrize("engine", engines)
+    def test_script_bad_requests(self, tmp_path, engine, request_line):
+        """
+        Tests that a malformed request only fails its own line.
+        """
+        book = open_book(str(tmp_path / f"contacts{engine}"), "batched")
+        lines = [request_line, "", '{"command": "add", "name": "John Smith", "phone": "5551234567"}']
+        output = io.StringIO()
+        assert commands.run_script(book, lines, output) == 1
+
+        responses = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert len(responses) == 2, "Every request must get one response."
+        assert responses[0]["ok"] is False and responses[0]["error"]
+        assert responses[1] == {"ok": True, "result": "contact_1"}
+        book.close()
+
+
+    def test_main(self, tmp_path, capsys):
+        """
+        Tests the command line, which prints one JSON result per line.
+        """
+        location = str(tmp_path / "contacts.json")
+        assert commands.main(["--data-file", location, "add", "John Smith", "--phone", "5551234567", "--identifiers", "work", "london"]) == 0
+        assert commands.main(["--data-file", location, "add", "Jane Smith", "--email", "jane@example.com"]) == 0
+        assert commands.main(["--data-file", location, "edit", "contact_1", "--email", "john@example.com"]) == 0
+        capsys.readouterr()
+
+        assert commands.main(["--data-file", location, "search", "Smith", "--prefix"]) == 0
+        found = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert [contact["contact_id"] for contact in found] == ["contact_1", "contact_2"]
+        assert found[0]["email"] == "john@example.com" and found[0]["identifiers"] == ["work", "london"]
+
+        # a failed command exits with 1 and says why
+        assert commands.main(["--data-file", location, "add", "No Contact Method"]) == 1
+        assert "NoIDError" in capsys.readouterr().err
+        assert commands.main(["--data-file", str(tmp_path / "contacts.txt"), "list"]) == 2
+
+
+
+class FakeSMTP:
+    """
+    Stands in for `smtplib.SMTP`. Raises the queued errors one per
+    message before accepting messages, and remembers what was sent.
+    """
+    errors:list = []
+    sent:list = []
+    opened:int = 0
+    quits:int = 0
+    lock = threading.Lock()
+
+
+    def __init__(self, host, port, timeout=None):
+        with FakeSMTP.lock:
+            FakeSMTP.opened += 1
+
+
+    def send_message(self, message):
+        with FakeSMTP.lock:
+            if FakeSMTP.errors:
+                raise FakeSMTP.errors.pop(0)
+            FakeSMTP.sent.append(message["To"])
+        return {}
+
+
+    def quit(self):
+        with FakeSMTP.lock:
+            FakeSMTP.quits += 1
+
+
+    def close(self):
+        pass
+
+
+
+class TestClass_Mail:
+    """
+    Testing class for sending emails, against a fake SMTP server.
+    """
+
+
+    @pytest.fixture(autouse=True)
+    def fake_smtp(self, monkeypatch):
+        FakeSMTP.errors, FakeSMTP.sent, FakeSMTP.opened, FakeSMTP.quits = [], [], 0, 0
+        self.sleeps:list = []
+        monkeypatch.setattr(mail.smtplib, "SMTP", FakeSMTP)
+        monkeypatch.setattr(mail.time, "sleep", self.sleeps.append)
+
+
+    def message(self, address:str):
+        return mail.build_message("me@example.com", address, "Hello", "Hi there!")
+
+
+    @pytest.mark.parametrize("error, transient", [
+        (smtplib.SMTPServerDisconnected(), True),
+        (smtplib.SMTPConnectError(421, "busy"), True),
+        (ConnectionResetError(), True),
+        (TimeoutError(), True),
+        (smtplib.SMTPResponseException(451, "try later"), True),
+        (smtplib.SMTPResponseException(550, "no such user"), False),
+        (smtplib.SMTPAuthenticationError(535, "bad login"), False),
+        (ValueError(), False),
+    ])
+    def test_is_transient(self, error, transient):
+        """
+        Tests which failures are worth retrying.
+        """
+        assert mail.is_transient(error) == transient
+
+
+    def test_reuses_connection(self):
+        """
+        Tests that one worker sends every message over one connection.
+        """
+        with mail.MailSender("localhost", 1025, use_ssl=False, concurrency=1) as sender:
+            futures = [sender.submit(self.message(f"user{number}@example.com")) for number in range(5)]
+        assert [future.result() for future in futures] == [{}] * 5
+        assert FakeSMTP.sent == [f"user{number}@example.com" for number in range(5)]
+        assert (FakeSMTP.opened, FakeSMTP.quits) == (1, 1)
+        assert (sender.sent, sender.failed, sender.retried, sender.connections) == (5, 0, 0, 1)
+
+
+    def test_retries_with_backoff(self):
+        """
+        Tests that temporary failures are retried on a new connection,
+        waiting twice as long every time.
+        """
+        FakeSMTP.errors = [smtplib.SMTPServerDisconnected(), smtplib.SMTPResponseException(421, "busy")]
+        with mail.MailSender("localhost", 1025, use_ssl=False, concurrency=1, retries=3, backoff=0.5) as sender:
+            assert sender.send(self.message("john@example.com")) == {}
+        assert FakeSMTP.sent == ["john@example.com"]
+        assert self.sleeps == [0.5, 1.0]
+        assert (sender.sent, sender.failed, sender.retried, sender.connections) == (1, 0, 2, 3)
+
+
+    def test_gives_up(self):
+        """
+        Tests that permanent failures aren't retried, and temporary ones
+        only until the retries run out, without stopping later messages.
+        """
+        FakeSMTP.errors = [smtplib.SMTPResponseException(550, "no such user")] + [smtplib.SMTPServerDisconnected()] * 3
+        with mail.MailSender("localhost", 1025, use_ssl=False, concurrency=1, retries=2, backoff=1.0) as sender:
+            futures = [sender.submit(self.message(address)) for address in ("nobody@example.com", "jane@example.com", "john@example.com")]
+
+        with pytest.raises(smtplib.SMTPResponseException):
+            futures[0].result()
+        with pytest.raises(smtplib.SMTPServerDisconnected):
+            futures[1].result()
+        assert futures[2].result() == {}
+        assert FakeSMTP.sent == ["john@example.com"]
+        assert self.sleeps == [1.0, 2.0]
+        assert (sender.sent, sender.failed, sender.retried) == (1, 2, 2)
+
+
+
+class FakeSender:
+    """
+    Stands in for `MailSender`, failing the emails to some addresses.
+    """
+
+    def __init__(self, refuse:tuple = ()) -> None:
+        self.refuse = refuse
+        self.messages:list = []
+
+
+    def submit(self, message) -> Future:
+        self.messages.append(message)
+        future:Future = Future()
+        if message["To"] in self.refuse:
+            future.set_exception(smtplib.SMTPRecipientsRefused({message["To"]: (550, b"no such user")}))
+        else:
+            future.set_result({})
+        return future
+
+
+
+class TestClass_MailMerge:
+    """
+    Testing class for filling in and sending mail merge emails.
+    """
+
+
+    def test_render_template(self):
+        """
+        Tests placeholders for stored fields, the full name and keywords.
+        """
+        data = {"first_name": "John", "last_name": None, "phone": "5551234567", "email": None, "address": None, "identifiers": ["work", "london"]}
+        rendered = mail.render_template("Hi $name (${contact_id}): $phone, [$email] $identifiers $unknown $$5", "contact_1", data)
+        assert rendered == "Hi John (contact_1): 5551234567, [] work, london $unknown $5"
+
+
+    @pytest.mark.parametrize("engine", engines)
+    def test_mail_merge(self, tmp_path, engine):
+        """
+        Tests that every contact found by a keyword or name is emailed once,
+        however many searches find it.
+        """
+        book = open_book(str(tmp_path / f"contacts{engine}"))
+        ids = fill_book(book)
+        sender = FakeSender(refuse=("alice@example.com",))
+
+        # paris finds John Doe, who has no email. John finds him again and
+        # John Smith, who Jane Smith finds again along with Jane Smith
+        report = book.mail_merge(sender, "me@example.com", "News for $first_name", "Hi $name,", ["paris"], ["John", "Jane Smith", "Alice", "John"], batch_size=1)
+
+        assert [message["To"] for message in sender.messages] == ["john@example.com", "jane@example.com", "alice@example.com"]
+        assert [message["Subject"] for message in sender.messages] == ["News for John", "News for Jane", "News for Alice"]
+        assert sender.messages[0].get_content() == "Hi John Smith,\n"
+        assert report["sent"] == 2 and report["skipped"] == 1
+        assert list(report["failed"]) == [ids[3]]
+        book.close()
+
+
+    def test_mail_merge_keywords(self, tmp_path):
+        """
+        Tests that a contact with several of the keywords is emailed once.
+        """
+        book = open_book(str(tmp_path / "contacts.json"))
+        fill_book(book)
+        sender = FakeSender()
+        report = book.mail_merge(sender, "me@example.com", "Hello", "Hi $name,", ["london", "work"])
+        assert sorted(message["To"] for message in sender.messages) == ["jane@example.com", "john@example.com"]
+        assert report == {"sent": 2, "skipped": 1, "failed": {}}
+        book.close()
+
+
+
+def curses_key(name:str) -> int:
+    """
+    Returns a curses key code, skipping the test without curses.
+    """
+    return getattr(pytest.importorskip("curses"), name)
+
+
+def contact_data(name:str, phone:str|None = None, email:str|None = None, identifiers:list|None = None) -> dict:
+    """
+    Returns contact data as stored, with the first name as the hash.
+    """
+    first_name, _, last_name = name.partition(" ")
+    return {
+        "first_name": first_name, "last_name": last_name or None, "hash_id": first_name.lower(),
+        "phone": phone, "email": email, "address": None, "identifiers": identifiers,
+    }
+
+
+
+class TestClass_Dedup:
+    """
+    Testing class for finding and merging duplicate contacts.
+    """
+
+
+    def test_union_find(self):
+        """
+        Tests that joined sets share the lowest number as their root.
+        """
+        sets = dedup.UnionFind(3)
+        assert sets.add() == 3
+        sets.union(3, 2)
+        sets.union(2, 1)
+        assert [sets.find(number) for number in range(4)] == [0, 1, 1, 1]
+        sets.union(3, 0)
+        assert [sets.find(number) for number in range(4)] == [0, 0, 0, 0]
+
+
+    def test_find_duplicates(self):
+        """
+        Tests matching on phones, emails and names, and what keeps
+        contacts apart.
+        """
+        data = {
+            "contact_1": contact_data("John Smith", "555-123-4567"),
+            "contact_2": contact_data("Jon Smith", "(555) 123 4567"),
+            "contact_3": contact_data("John Smith", email="john@example.com"),
+            # same name but a different phone
+            "contact_4": contact_data("John Smith", "555-999-8888"),
+            # same phone but a different person
+            "contact_5": contact_data("Mary Jones", "5551234567"),
+            "contact_6": contact_data("Acme Switchboard", "+1 555 123 4567"),
+            "contact_7": contact_data("Alice", email="Alice@Example.com "),
+            "contact_8": contact_data("Alice Brown", email="alice@example.com"),
+            # too short to tell people apart
+            "contact_9": contact_data("Bob", "123"),
+            "contact_10": contact_data("Rob", "123"),
+        }
+        groups = dedup.find_duplicates(data.items(), data.get)
+        assert groups == [["contact_1", "contact_2", "contact_3"], ["contact_7", "contact_8"]]
+
+        # the shared phone is too common to go by
+        groups = dedup.find_duplicates(data.items(), data.get, max_bucket=3)
+        assert groups == [["contact_1", "contact_3"], ["contact_7", "contact_8"]]
+
+
+    def test_merge_contacts(self):
+        """
+        Tests that the oldest details win and identifiers are combined.
+        """
+        merged = dedup.merge_contacts([
+            contact_data("John", "5551234567", identifiers=["work"]),
+            contact_data("John Smith", "5559998888", "john@example.com", ["london", "work"]),
+        ])
+        assert merged == contact_data("John Smith", "5551234567", "john@example.com", ["work", "london"])
+
+
+    @pytest.mark.parametrize("engine", engines)
+    def test_merge_duplicates(self, tmp_path, engine):
+        """
+        Tests that duplicates are merged into the oldest contact, which keeps its id.
+        """
+        book = open_book(str(tmp_path / f"contacts{engine}"))
+        ids = fill_book(book)
+        duplicate = book.add_contact("Jon Smith", "555 123 4567", None, "2 Low Road", ["home"])
+
+        assert book.find_duplicates() == [[ids[0], duplicate]]
+        assert book.merge_duplicates() == {ids[0]: [duplicate]}
+        assert book.get_contact_data(duplicate) == -1
+        merged = book.get_contact_data(ids[0])
+        assert (merged["address"], merged["identifiers"]) == ("1 High Street", ["work", "london", "home"])
+        assert book.find_contact_lists(["home"]) == [ids[0]]
+        assert book.find_duplicates() == []
+        book.close()
+
+
+
+class TestClass_Phones:
+    """
+    Testing class for the canonical form of phone numbers.
+    """
+
+
+    @pytest.mark.parametrize("phone, canonical", [
+        ("555-123-4567", "5551234567"),
+        ("(555) 123 4567", "5551234567"),
+        ("+1 555 123 4567", "5551234567"),
+        ("001 555 123 4567", "5551234567"),
+        (5551234567, "5551234567"),
+        ("0044 20 7946 0958", "442079460958"),
+        # extensions are split off
+        ("555-123-4567 x89", "5551234567"),
+        ("555-123-4567 ext. 89", "5551234567"),
+        ("555 123 4567 Extension 89", "5551234567"),
+        ("(555) 123-4567#89", "5551234567"),
+        # too short or long for "00" to start an international number
+        ("00123", "00123"),
+        ("00 1234 5678 9012 3456", "001234567890123456"),
+        # country codes never start with 0
+        ("000 1234 5678", "00012345678"),
+        ("", None),
+        (None, None),
+    ])
+    def test_normalize_phone(self, phone, canonical):
+        """
+        Tests that the same number typed differently has one canonical form.
+        """
+        assert normalize_phone(phone) == canonical
+
+
+    def test_split_extension(self):
+        """
+        Tests splitting the extension off a number.
+        """
+        assert split_extension("555-123-4567 ext 89") == ("555-123-4567", "89")
+        assert split_extension("555-123-4567") == ("555-123-4567", None)
+
+
+    @pytest.mark.parametrize("engine", engines)
+    def test_extension_lookup(self, tmp_path, engine):
+        """
+        Tests that a number with an extension is found by its main line.
+        """
+        book = open_book(str(tmp_path / f"contacts{engine}"))
+        contact_id = book.add_contact("John Smith", "555-123-4567 x89", None, None, None)
+        assert book.get_contact_data(contact_id)["phone"] == "5551234567"
+        assert book.reverse_lookup("555 123 4567") == [contact_id]
+        assert book.reverse_lookup("555-123-4567 #12") == [contact_id]
+        book.close()
+
+
+
+class FakeWindow:
+    """
+    Stands in for a curses window, keeping what's drawn as rows of text.
+    """
+
+    def __init__(self, rows:int, columns:int, keys:str|list = ()) -> None:
+        self.rows, self.columns = rows, columns
+        self.screen:list[str] = [""] * rows
+        self.cursor:tuple = (0, 0)
+        self.keys:list = [ord(key) if isinstance(key, str) else key for key in keys]
+        self.draws:int = 0
+
+
+    def getmaxyx(self) -> tuple:
+        return self.rows, self.columns
+
+
+    def keypad(self, flag) -> None:
+        pass
+
+
+    def refresh(self) -> None:
+        pass
+
+
+    def move(self, y:int, x:int) -> None:
+        assert 0 <= y < self.rows and 0 <= x < self.columns, "Moved outside the window."
+        self.cursor = (y, x)
+
+
+    def clrtoeol(self) -> None:
+        y, x = self.cursor
+        self.screen[y] = self.screen[y][:x]
+
+
+    def addstr(self, y:int, x:int, text:str) -> None:
+        assert x + len(text) <= self.columns, "Drew past the right edge."
+        self.draws += 1
+        self.screen[y] = self.screen[y][:x].ljust(x) + text
+        self.cursor = (y, min(x + len(text), self.columns - 1))
+
+
+    def getch(self) -> int:
+        return self.keys.pop(0)
+
+
+
+class TestClass_Textpad:
+    """
+    Testing class for the text box's line buffer, on a fake window.
+    """
+
+
+    def type_text(self, box, text:str) -> None:
+        for char in text:
+            box.do_command(ord(char))
+
+
+    def test_wraps_and_scrolls(self):
+        """
+        Tests that text past the right edge wraps and text past the
+        bottom scrolls, while every line is kept.
+        """
+        textpad = pytest.importorskip("phonebook.textpad")
+        window = FakeWindow(2, 5)
+        box = textpad.Textbox(window, insert_mode=True)
+        self.type_text(box, "hello world")
+        assert box.lines == ["hello", " worl", "d"]
+        assert window.screen == [" worl", "d"]
+        assert box.gather() == "hello\n worl\nd\n"
+
+        # back at the top the first lines are drawn again
+        box.do_command(curses_key("KEY_UP"))
+        box.do_command(curses_key("KEY_UP"))
+        assert window.screen == ["hello", " worl"]
+        assert window.cursor == (0, 1)
+
+
+    def test_editing_keys(self):
+        """
+        Tests inserting in the middle of a line, joining lines with
+        backspace and deleting with Ctrl-K.
+        """
+        textpad = pytest.importorskip("phonebook.textpad")
+        box = textpad.Textbox(FakeWindow(4, 10), insert_mode=True)
+        self.type_text(box, "Hi John\nBye")
+        box.do_command(1)                                   # ^a
+        box.do_command(curses_key("KEY_BACKSPACE"))
+        assert box.lines == ["Hi JohnBye"]
+        assert (box.row, box.col) == (0, 7)
+
+        # inserted text pushes the rest along, wrapping the overflow
+        self.type_text(box, ", ")
+        assert box.lines == ["Hi John, B", "ye"]
+
+        box.do_command(1)                                   # ^a
+        box.do_command(11)                                  # ^k
+        assert box.gather() == "\nye\n"
+        box.do_command(11)
+        assert box.lines == ["ye"]
+
+
+    def test_only_changed_lines_redrawn(self):
+        """
+        Tests that typing on one line only redraws that line.
+        """
+        textpad = pytest.importorskip("phonebook.textpad")
+        window = FakeWindow(5, 20)
+        box = textpad.Textbox(window, insert_mode=True)
+        self.type_text(box, "one\ntwo\nthree")
+        window.draws = 0
+        self.type_text(box, "!!")
+        assert window.draws == 2
+        assert window.screen[:3] == ["one", "two", "three!!"]
+
+
+    def test_edit(self):
+        """
+        Tests editing until Ctrl-G, and a one line box ending on Enter.
+        """
+        textpad = pytest.importorskip("phonebook.textpad")
+        window = FakeWindow(3, 10, ["H", "i", " ", " ", 7, "x"])
+        assert textpad.Textbox(window).edit() == "Hi\n"
+        assert window.keys == [ord("x")], "Keys after Ctrl-G must not be read."
+
+        window = FakeWindow(1, 10, ["J", "o", 2, "h", "n", 10])
+        assert textpad.Textbox(window, insert_mode=True).edit() == "Jhno"
+
+
+
+class TestClass_CLI:
+    """
+    Testing class for the interactive dialogs, fed from a list of inputs.
+    """
+
+
+    def make_cli(self, tmp_path, monkeypatch, inputs:list[str]) -> CLI:
+        """
+        Returns a CLI on a filled phonebook that reads `inputs` instead of stdin.
+        """
+        answers = iter(inputs)
+        monkeypatch.setattr("builtins.input", lambda prompt = "": next(answers))
+        monkeypatch.setattr(CLI, "system_clear", lambda self: None)
+        cli = CLI(animations=False)
+        cli.set_data_file(str(tmp_path / "contacts.json"))
+        fill_book(cli)
+        return cli
+
+
+    def test_add_contact_dialog(self, tmp_path, monkeypatch, capsys):
+        """
+        Tests that the add dialog shows the id the new contact was given.
+        """
+        cli = self.make_cli(tmp_path, monkeypatch, ["Bob Jones", "555 222 3333", "", "", "work", "y", ""])
+        assert cli.add_contact_dialog() == 0
+        assert "Contact Added as contact_5." in capsys.readouterr().out
+        assert cli.get_contact_data("contact_5")["phone"] == "5552223333"
+        cli.close()
+
+
+    def test_list_all_contacts(self, tmp_path, monkeypatch, capsys):
+        """
+        Tests that contacts are listed a page at a time, until the user stops.
+        """
+        cli = self.make_cli(tmp_path, monkeypatch, ["", "q"])
+        cli.list_all_contacts(page_size=1)
+        output = capsys.readouterr().out
+        assert "contact_1" in output and "contact_2" in output
+        assert "contact_3" not in output, "Listed a page after the user stopped."
+        cli.close()
+
+
+    def test_search_without_curses(self, tmp_path, monkeypatch, capsys):
+        """
+        Tests that the name search falls back to plain input when curses
+        can't be imported, like on windows without windows-curses.
+        """
+        monkeypatch.setitem(sys.modules, "curses", None)
+        cli = self.make_cli(tmp_path, monkeypatch, ["Smi", ""])
+        assert cli.search_contact_name() == 0
+        output = capsys.readouterr().out
+        assert "Found 2 possible matches." in output
+        assert "contact_1" in output and "contact_2" in output
+        cli.close()
+
+
+    def test_search_empty_name_cancels(self, tmp_path, monkeypatch, capsys):
+        """
+        Tests that searching for an empty name cancels rather than listing every contact.
+        """
+        monkeypatch.setitem(sys.modules, "curses", None)
+        cli = self.make_cli(tmp_path, monkeypatch, ["  ", ""])
+        assert cli.search_contact_name() == 0
+        output = capsys.readouterr().out
+        assert "Cancelled." in output
+        assert "contact_1" not in output
+        cli.close()
+
+
+
+class TestClass_JournalStore:
+    """
+    Testing class for the `JournalStore` engine.
+    """
+
+
+    def test_reload_after_compaction(self, tmp_path):
+        """
+        Tests that a store reloading after another process compacted the
+        journal ends up the same as a store opened afresh.
+        """
+        location = str(tmp_path / "contacts.journal")
+        writer = JournalStore(location, compact_every=2)
+        writer.open()
+        for contact in contacts:
+            writer.add(PhoneBook()._build_contact(*contact))
+
+        reader = JournalStore(location)
+        reader.open()
+        # the remove is journaled after the reader loaded, then compacted away
+        writer.remove("contact_1")
+        writer.add(PhoneBook()._build_contact("Late Contact", "5550009999", None, None, None))
+        writer.compact()
+        reader.refresh()
+
+        fresh = JournalStore(location)
+        fresh.open()
+        for store in (reader, writer):
+            assert store.ids() == fresh.ids(), "Contacts differ after reloading."
+            assert list(store.iter_items()) == list(fresh.iter_items())
+            assert (store.order, store.tombstones) == (fresh.order, fresh.tombstones), "Stale order entries after reloading."
+            assert store.seq == fresh.seq
+        for store in (writer, reader, fresh):
+            store.close()
+
+
+
+class TestClass_Keywords:
+    """
+    Testing class for keyword queries.
+    """
+
+
+    def test_parse_keyword_query(self):
+        """
+        Tests that `+` and `-` keywords are split out.
+        """
+        assert parse_keyword_query("work +london -old") == (["london"], ["work"], ["old"])
+        assert parse_keyword_query("+ -") == ([], ["+", "-"], [])
+        assert parse_keyword_query("") == ([], [], [])
+
+
+    @pytest.mark.parametrize("engine", engines)
+    def test_keyword_queries(self, tmp_path, engine):
+        """
+        Tests AND, OR and NOT keyword queries, and their ranking.
+        """
+        book = open_book(str(tmp_path / f"contacts{engine}"))
+        john, jane, doe, alice = fill_book(book)
+
+        # OR, contacts matching more keywords first
+        assert book.search_keywords(any_of=["work", "london"])[0] == john
+        assert sorted(book.search_keywords(any_of=["work", "family"])) == sorted([john, jane, doe])
+        # AND
+        assert book.search_keywords(all_of=["work", "london"]) == [john]
+        assert book.search_keywords(all_of=["work", "family"]) is None
+        # NOT
+        assert sorted(book.search_keywords(any_of=["work", "london"], none_of=["old"])) == sorted([john, jane])
+        assert book.search_keywords(all_of=["work"], none_of=["paris"]) == [john]
+        assert book.search_keywords(*parse_keyword_query("+london -family")) == [john]
+        assert book.find_contact_lists(["missing"]) is None
+        book.close()
+
+
+
+class TestClass_Transfer:
+    """
+    Testing class for importing and exporting contacts.
+    """
+
+
+    @pytest.mark.parametrize("file_format", ["csv", "jsonl", "vcard"])
+    def test_round_trip(self, tmp_path, file_format):
+        """
+        Tests that exporting then importing a phonebook gives the same contacts.
+        """
+        book = open_book(str(tmp_path / "contacts.json"))
+        fill_book(book)
+        # characters that need escaping in every format
+        book.add_contact("Semi Colon", "5552223333", "semi@example.com", "Flat 2; 3, Main St\\North", ["a,b", "c;d"])
+        location = str(tmp_path / f"export.{file_format}")
+        assert book.export(location) == len(contacts) + 1
+        expected = list(snapshot(book).values())
+        book.close()
+
+        copy = open_book(str(tmp_path / "copy.json"))
+        assert copy.bulk_import(location) == len(contacts) + 1
+        assert list(snapshot(copy).values()) == expected
+        copy.close()
+
+
+
+class TestClass_Sync:
+    """
+    Testing class for syncing copies of a phonebook through the change log.
+    """
+
+
+    def test_change_log_opt_in(self, tmp_path):
+        """
+        Tests that no change log is kept unless asked for.
+        """
+        location = str(tmp_path / "contacts.json")
+        book = open_book(location)
+        fill_book(book)
+        with pytest.raises(ValueError):
+            book.changes_since(0)
+        book.close()
+        assert not os.path.exists(location + ".changes")
+
+
+    @pytest.mark.parametrize("engine", engines)
+    def test_apply_is_idempotent(self, tmp_path, engine):
+        """
+        Tests that applying the same changes twice leaves the copy as it was
+        after the first time, and the same as the primary.
+        """
+        primary = open_book(str(tmp_path / f"primary{engine}"), change_log=True)
+        ids = fill_book(primary)
+        primary.remove_contact(ids[0])
+        primary.edit_contact(ids[1], "Jane Doe", None, "jane@example.org", None, None)
+
+        location = str(tmp_path / "delta.jsonl")
+        seq = sync.export_changes(primary, location)
+        assert seq == primary.change_seq()
+
+        replica = open_book(str(tmp_path / f"replica{engine}"))
+        assert sync.import_changes(replica, location) == seq
+        first = snapshot(replica)
+        assert sync.import_changes(replica, location) == seq
+        assert snapshot(replica) == first == snapshot(primary)
+
+        # only the new changes are exported next time
+        primary.add_contact("Late Contact", "5550009999", None, None, None)
+        sync.export_changes(primary, location, since=seq)
+        sync.import_changes(replica, location)
+        assert snapshot(replica) == snapshot(primary)
+        primary.close()
+        replica.close()
+
+
+    def test_pull_is_idempotent(self, tmp_path):
+        """
+        Tests pulling changes over a socket twice.
+        """
+        primary = open_book(str(tmp_path / "primary.json"), change_log=True)
+        fill_book(primary)
+        server = sync.make_server(primary, "127.0.0.1:0")
+        address = "127.0.0.1:{}".format(server.server_address[1])
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        try:
+            replica = open_book(str(tmp_path / "replica.json"))
+            seq = sync.pull(replica, address, batch_size=2)
+            assert seq == primary.change_seq()
+            assert sync.pull(replica, address) == seq
+            assert sync.pull(replica, address, since=seq) == seq
+            assert snapshot(replica) == snapshot(primary)
+            replica.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+            primary.close()
@@ -0,0 +1,97 @@
+#! /usr/bin/env python3
+"""
+Benchmark for how long `File_Handler` takes to change mode and encoding.
+
+Times `change_file_mode` cycling through the modes the inventory flow
+uses, and `set_encoding` switching back and forth, against closing and
+opening the file again the way both used to. Prints the median time per
+switch of each over `--runs` runs of `--switches` switches.
+
+Usage: `python benchmarks/mode_switch.py --switches 10000 --runs 5`
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+# run from anywhere, main.py lives next to this folder
+ROOT:str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import File_Handler
+
+
+# what `main` writes and `end` reads the inventory files with
+MODES:tuple[str, ...] = ("w+", "r", "a", "r", "rb")
+ENCODINGS:tuple[str, ...] = ("utf-8", "latin-1")
+
+
+class Reopening:
+    """
+    Changes mode and encoding by closing the file and opening it again,
+    the way `File_Handler` used to.
+    """
+
+    def __init__(self, location:str) -> None:
+        self.location = location
+        self.file_object = open(location, "r", encoding="utf-8")
+
+
+    def change_file_mode(self, mode:str) -> None:
+        self.file_object.flush()
+        self.file_object.close()
+        self.file_object = open(self.location, mode, encoding=None if "b" in mode else "utf-8")
+
+
+    def set_encoding(self, encoding:str) -> None:
+        self.file_object.flush()
+        self.file_object.close()
+        self.file_object = open(self.location, "r", encoding=encoding)
+
+
+def time_switches(switch, values:tuple[str, ...], switches:int) -> float:
+    """
+    Returns the seconds per switch of `switches` calls cycling through `values`.
+    """
+    started = time.perf_counter()
+    for i in range(switches):
+        switch(values[i % len(values)])
+    return (time.perf_counter() - started) / switches
+
+
+def main(argv:list[str]|None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--switches", type=int, default=10000, help="switches timed per run")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        location = os.path.join(directory, "inventory.json")
+        file_handler = File_Handler(location, "w+")
+        file_handler.write_file("{}")
+        file_handler.change_file_mode("r")
+        reopening = Reopening(location)
+
+        timings:dict[str, list[float]] = {name: [] for name in ("mode", "mode reopening", "encoding", "encoding reopening")}
+        for _ in range(args.runs):
+            timings["mode"].append(time_switches(file_handler.change_file_mode, MODES, args.switches))
+            timings["mode reopening"].append(time_switches(reopening.change_file_mode, MODES, args.switches))
+            file_handler.change_file_mode("r")
+            reopening.change_file_mode("r")
+            timings["encoding"].append(time_switches(file_handler.set_encoding, ENCODINGS, args.switches))
+            timings["encoding reopening"].append(time_switches(reopening.set_encoding, ENCODINGS, args.switches))
+        del file_handler
+        reopening.file_object.close()
+
+    for name, runs in timings.items():
+        print(f"{name + ':':<20} {statistics.median(runs) * 1e6:8.2f}us per switch")
+    for name in ("mode", "encoding"):
+        speedup = statistics.median(timings[f"{name} reopening"]) / statistics.median(timings[name])
+        print(f"{name} switches are {speedup:.1f}x faster than reopening")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
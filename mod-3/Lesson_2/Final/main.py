@@ -1,11 +1,21 @@
 #! /usr/bin/env python3
+import io
 import os
 import sys
 import json
+import mmap
 import base64
 import string
 import warnings
 from textwrap import dedent
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    # windows, where changing to or from an append mode reopens the file instead
+    fcntl = None
 
 class InvalidFileOperation(Exception):
 
@@ -18,13 +28,29 @@ class File_Manager:
     """
     A Wrapper class for the `File_Handler` class that
     manages multiple files at once.
+
+    If `max_open_files` is given, at most that many files are kept open at
+    once. Opening another closes the least recently used one, which is
+    reopened at the same position and mode the next time it is used.
+    A file being iterated over counts as used only when the iterator is
+    created, so keep fewer than `max_open_files` other files in use meanwhile.
+    Memory mapped files hold a second file descriptor for their map.
     """
     
-    def __init__(self, file_id_type:type) -> None:
+    def __init__(self, file_id_type:type, max_open_files:int = None) -> None:
         self.expects_id_type = file_id_type
 
         self.file_registry:dict[type, File_Handler] = {}
 
+        if max_open_files is not None and max_open_files < 1:
+            raise ValueError("At least 1 file must be allowed to be open.")
+        self.max_open_files = max_open_files
+        # ids of the files that are open, least recently used first
+        self.open_files:OrderedDict[type, None] = OrderedDict()
+        self.pool_hits = 0
+        self.pool_misses = 0
+        self.pool_evictions = 0
+
 
     def add_file(self, id:type, file_path:str, mode:str = "r"):
         """
@@ -34,9 +60,12 @@ class File_Manager:
         if type(id) != self.expects_id_type:
             raise TypeError("Invalid identifier used for file object management.")
 
+        self.__drop_from_pool(id)
+        self.__make_room(1)
         file_object = File_Handler(file_path, mode)
 
         self.file_registry[id] = file_object
+        self.__add_to_pool(id)
 
 
     def retrieve_file(self, id:type):
@@ -47,10 +76,7 @@ class File_Manager:
         if type(id) != self.expects_id_type or type(id) != list[self.expects_id_type]:
             raise TypeError("Invalid identifier used for file object look up.")
 
-        if self.file_registry.get(id) is None:
-            return None
-        
-        return self.file_registry[id]
+        return self.__get_file(id)
 
 
     def remove_file(self, id):
@@ -64,12 +90,17 @@ class File_Manager:
         if self.file_registry.get(id) is None:
             return None
         
+        self.__drop_from_pool(id)
         self.file_registry.pop(id)
 
 
-    def open_file_list(self, filepath_list:list[str], mode_list:list[str], id_list:list[type]):
+    def open_file_list(self, filepath_list:list[str], mode_list:list[str], id_list:list[type], max_workers:int = None):
         """
-        Iterates through two lists to open multiple file objects at once.
+        Opens multiple file objects at once, across a pool of threads.
+
+        A file that fails to open does not stop the others from opening.
+
+        #### Parameters
 
         `filepath_list` - The list of filepaths to open.
 
@@ -77,9 +108,19 @@ class File_Manager:
 
         `id_list` - the ids to give the newly created file objects.
 
+        `max_workers` - The most files opened at the same time. Defaults to
+        the `ThreadPoolExecutor` default.
+
+        #### Returns
+
+        `dict[type, int|Exception]` - A report mapping every id to `0` if its file
+        was opened, or the exception raised while opening it.
+
         #### Raises
 
         `ValueError` - The lengths of the parameters are different and the write could not be executed.
+
+        `TypeError` - An id is not of the type this manager expects.
         """
 
         if not self.verify_list_lengths([filepath_list, mode_list, id_list]):
@@ -88,10 +129,9 @@ class File_Manager:
                 f"Expected length {len(filepath_list)}\n"
                 f"Got lengths: {len(filepath_list)}|{len(mode_list)}|{len(id_list)}"
                 )
+        self.__verify_ids(id_list)
 
-
-        for i in range(len(filepath_list)):
-            self.add_file(id_list[i], filepath_list[i], mode_list[i])
+        return self.__run_file_list(File_Handler, zip(filepath_list, mode_list), id_list, max_workers)
 
 
     def write_to_file(self, fileID:type, content:str|bytes|list, flush:bool = True, lines:bool=False):
@@ -112,29 +152,44 @@ class File_Manager:
 
         `-1` - The given ID for the file is invalid.
         """
-        if self.file_registry.get(fileID) is None:
+        file_object = self.__get_file(fileID)
+        if file_object is None:
             return -1
-        
-        file_object = self.file_registry[fileID]
 
         file_object.write_file(content, flush, lines)
 
 
-    def write_to_file_list(self, content:list[str|bytes|list], filepaths:list[str], ids:list[type]):
+    def write_to_file_list(self, content:list[str|bytes|list], filepaths:list[str], ids:list[type], mode:str = "w", max_workers:int = None):
         """
-        writes to a list of files in series.
+        writes to a list of files at once, across a pool of threads.
+
+        Every file is opened, written to and flushed in its own thread, and
+        a file that fails does not stop the others from being written.
 
         #### Parameters
 
-        `content` - A list of the content to write to the files.
+        `content` - A list of the content to write to the files. Content given
+        as a list is written as lines.
 
         `filepaths` - The list of files to write to.
 
         `ids` - The list of ids to give the newly written files.
 
+        `mode` - The mode to open every file with.
+
+        `max_workers` - The most files written at the same time. Defaults to
+        the `ThreadPoolExecutor` default.
+
+        #### Returns
+
+        `dict[type, int|Exception]` - A report mapping every id to `0` if its file
+        was written, or the exception raised while opening or writing it.
+
         #### Raises
 
         `ValueError` - The 3 parameters have mismatching lengths. 
+
+        `TypeError` - An id is not of the type this manager expects.
         """
 
         if not self.verify_list_lengths([content, filepaths, ids]):
@@ -143,7 +198,14 @@ class File_Manager:
                 f"Expected length {len(content)}.\n"
                 f"Got lengths {len(content)}|{len(filepaths)}|{len(ids)}"
             )
-        pass
+        self.__verify_ids(ids)
+
+        def open_and_write(file_path:str, file_content:str|bytes|list):
+            file_object = File_Handler(file_path, mode)
+            file_object.write_file(file_content, True, isinstance(file_content, list))
+            return file_object
+
+        return self.__run_file_list(open_and_write, zip(filepaths, content), ids, max_workers)
 
 
     def change_file_mode(self, id:type, new_mode:str):
@@ -164,9 +226,10 @@ class File_Manager:
         
         `0` - Default return value.
         """
-        if self.file_registry.get(id) is None:
+        file_object = self.__get_file(id)
+        if file_object is None:
             raise KeyError("Invalid file ID.")
-        self.file_registry[id].change_file_mode(new_mode)
+        file_object.change_file_mode(new_mode)
         return 0
 
 
@@ -182,9 +245,10 @@ class File_Manager:
 
         `-1` - The given file id is invalid.
         """
-        if self.file_registry.get(id) is None:
+        file_object = self.__get_file(id)
+        if file_object is None:
             return -1
-        self.file_registry[id].truncate()
+        file_object.truncate()
 
 
     def verify_list_lengths(self, lists_to_verify:list[list]):
@@ -230,9 +294,185 @@ class File_Manager:
 
         `KeyError` - The given file id does not exist.
         """
-        if self.file_registry.get(id) is None:
+        file_object = self.__get_file(id)
+        if file_object is None:
             raise KeyError("Invalid file ID.")
-        return self.file_registry[id].read_file(len_, lines, index)
+        return file_object.read_file(len_, lines, index)
+
+
+    def iter_chunks(self, id, size:int = 65536, index:int = None):
+        """
+        Streams a given file in chunks, see `File_Handler.iter_chunks`.
+
+        #### Raises
+
+        `KeyError` - The given file id does not exist.
+        """
+        file_object = self.__get_file(id)
+        if file_object is None:
+            raise KeyError("Invalid file ID.")
+        return file_object.iter_chunks(size, index)
+
+
+    def iter_lines(self, id, size:int = 65536, index:int = None):
+        """
+        Streams a given file line by line, see `File_Handler.iter_lines`.
+
+        #### Raises
+
+        `KeyError` - The given file id does not exist.
+        """
+        file_object = self.__get_file(id)
+        if file_object is None:
+            raise KeyError("Invalid file ID.")
+        return file_object.iter_lines(size, index)
+
+
+    def iter_records(self, id, delimiter:str|bytes, size:int = 65536, index:int = None):
+        """
+        Streams a given file split on a delimiter, see `File_Handler.iter_records`.
+
+        #### Raises
+
+        `KeyError` - The given file id does not exist.
+        """
+        file_object = self.__get_file(id)
+        if file_object is None:
+            raise KeyError("Invalid file ID.")
+        return file_object.iter_records(delimiter, size, index)
+
+
+    def pool_stats(self):
+        """
+        Returns how well the open files pool is doing, see `max_open_files`.
+
+        #### Returns
+
+        `dict[str, int]` - `hits`, the uses of a file that was still open,
+        `misses`, the uses of a file that had to be reopened, `evictions`,
+        the files closed to make room, and `open_files`, the files open now.
+        """
+        return {
+            "hits": self.pool_hits,
+            "misses": self.pool_misses,
+            "evictions": self.pool_evictions,
+            "open_files": len(self.open_files),
+        }
+
+
+    # private methods
+
+
+    def __get_file(self, id):
+        """
+        Private method that returns a file from the registry, reopening
+        it if it was closed to make room for other files.
+
+        ### Returns
+
+        `File_Handler` - The file.
+
+        `None` - The given file id does not exist.
+        """
+        file_object = self.file_registry.get(id)
+        if file_object is None or self.max_open_files is None:
+            return file_object
+
+        if id in self.open_files:
+            self.open_files.move_to_end(id)
+            self.pool_hits += 1
+            return file_object
+
+        self.pool_misses += 1
+        self.__make_room(1)
+        file_object.resume()
+        self.__add_to_pool(id)
+        return file_object
+
+
+    def __add_to_pool(self, id):
+        """
+        Private method that marks a file as open and most recently used.
+        """
+        if self.max_open_files is not None:
+            self.open_files[id] = None
+
+
+    def __drop_from_pool(self, id):
+        """
+        Private method that stops tracking a file that is being replaced or removed.
+        """
+        self.open_files.pop(id, None)
+
+
+    def __make_room(self, amount:int):
+        """
+        Private method that closes the least recently used files until
+        `amount` more can be opened.
+        """
+        if self.max_open_files is None:
+            return
+        while self.open_files and len(self.open_files) + amount > self.max_open_files:
+            id, _ = self.open_files.popitem(last=False)
+            self.file_registry[id].suspend()
+            self.pool_evictions += 1
+
+
+    def __verify_ids(self, ids:list[type]):
+        """
+        Private method that checks every id in a list before any file is touched.
+
+        ### Raises
+
+        `TypeError` - An id is not of the type this manager expects.
+        """
+        for id in ids:
+            if type(id) != self.expects_id_type:
+                raise TypeError("Invalid identifier used for file object management.")
+
+
+    def __run_file_list(self, task, arguments, ids:list[type], max_workers:int = None):
+        """
+        Private method that runs a task creating a `File_Handler` for every set of
+        arguments across a thread pool, and registers the handlers that were created.
+
+        ### Returns
+
+        `dict[type, int|Exception]` - `0` for every id that was registered,
+        or the exception its task raised.
+        """
+        pooled = self.max_open_files is not None
+        if pooled:
+            # every thread has one file open at a time, make room for them
+            max_workers = min(max_workers or self.max_open_files, self.max_open_files)
+            # files being replaced are closed rather than forgotten, so one whose
+            # task fails stays registered and is reopened when it's next used
+            for id in ids:
+                if id in self.open_files:
+                    self.file_registry[id].suspend()
+                    self.__drop_from_pool(id)
+            self.__make_room(max_workers)
+
+        def run(*args):
+            file_object = task(*args)
+            # closed until it is used, so the threads stay within the limit
+            if pooled:
+                file_object.suspend()
+            return file_object
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            futures = [executor.submit(run, *args) for args in arguments]
+
+        # registered here rather than in the threads, so the registry is only touched by one thread
+        report:dict[type, int|Exception] = {}
+        for id, future in zip(ids, futures):
+            error = future.exception()
+            if error is not None:
+                report[id] = error
+                continue
+            self.file_registry[id] = future.result()
+            report[id] = 0
+        return report
 
 
     def __del__(self):
@@ -248,6 +488,12 @@ class File_Handler:
 
     If instantiated with mode \"x\", the handler will create the 
     file and then switch to read only mode.
+
+    If instantiated with mode \"m\", the file is memory mapped for
+    reading. Reads then come straight from memory without any system calls,
+    and `view` and `find` work on the file without copying it. The map
+    covers the file as it was when it was opened, change to mode \"m\"
+    again to see later writes.
     """
 
 
@@ -255,7 +501,7 @@ class File_Handler:
 
         self.mode = mode
         self.file_location = file
-        self.supports_bytes = True if "b" in mode else False
+        self.supports_bytes = True if "b" in mode or mode == "m" else False
         
         if self.mode == "x":
             self.__create_file(self.file_location)
@@ -264,7 +510,9 @@ class File_Handler:
 
         self.__check_file_exists()
         self.encoding = encoding
-        self.file_object = open(self.file_location, self.mode)
+        # where the file was when it was suspended, see `suspend`
+        self.suspended_at:int = None
+        self.__open_file()
 
     # file methods
 
@@ -277,6 +525,8 @@ class File_Handler:
 
         `int` - An integer representing the current position of the file.
         """
+        if self.mode == "m":
+            return self.map_index
         return self.file_object.tell()
 
 
@@ -290,6 +540,60 @@ class File_Handler:
         return self.file_object
 
 
+    def view(self, start:int = 0, end:int = None):
+        """
+        Returns part of a memory mapped file without copying it.
+
+        The view reads straight from the file's memory, so it is only
+        valid while the file stays in mode \"m\".
+
+        ### Parameters
+
+        `start` - Where the view starts in the file.
+
+        `end` - Where the view ends in the file. The default is the end of the file.
+
+        ### Returns
+
+        `memoryview` - The bytes of the file between `start` and `end`.
+
+        ### Raises
+
+        `InvalidFileOperation` - The file is not in mode \"m\".
+        """
+        if self.mode != "m":
+            raise InvalidFileOperation(f"InvalidFileOperation: File Mode \"{self.mode}\" is not memory mapped.")
+        return self.memory[start:end]
+
+
+    def find(self, sub:str|bytes, start:int = 0, end:int = None):
+        """
+        Finds where some content first appears in a memory mapped file,
+        without reading it into Python.
+
+        ### Parameters
+
+        `sub` - The content to look for. Strings are encoded first.
+
+        `start` - Where to start looking in the file.
+
+        `end` - Where to stop looking in the file. The default is the end of the file.
+
+        ### Returns
+
+        `int` - Where the content starts in the file, or `-1` if it was not found.
+
+        ### Raises
+
+        `InvalidFileOperation` - The file is not in mode \"m\".
+        """
+        if self.mode != "m":
+            raise InvalidFileOperation(f"InvalidFileOperation: File Mode \"{self.mode}\" is not memory mapped.")
+        if isinstance(sub, str):
+            sub = bytes(sub, self.encoding)
+        return self.memory_map.find(sub, start, len(self.memory_map) if end is None else end)
+
+
     def read_file(self, len_:int = 0, return_lines:bool = False, index:int = None):
         """
         Reads and returns the content from the current file object.
@@ -326,7 +630,11 @@ class File_Handler:
         # return only a slice of the file
 
         if index is not None:
-            self.file_object.seek(index)
+            self.goto(index)
+
+        # memory mapped files are read from memory
+        if self.mode == "m":
+            return self.__read_map(len_, return_lines)
 
 
         if len_ != 0:
@@ -344,6 +652,97 @@ class File_Handler:
             return self.file_object.read()   
 
 
+    def iter_chunks(self, size:int = 65536, index:int = None):
+        """
+        Streams the file in chunks, without holding all of it in memory.
+
+        Reads go into one preallocated buffer that is reused for every chunk,
+        so in binary modes a chunk is a `memoryview` into that buffer, which
+        is only valid until the next chunk is read. Copy it with `bytes()` to keep it.
+
+        The file position is left after the last chunk read.
+
+        ### Parameters
+
+        `size` - The most bytes read at once, or characters in text modes.
+
+        `index` - Where to start reading from the file, a position from
+        `find_index`. The default is the current position.
+
+        ### Returns
+
+        `Generator[memoryview]` - The chunks of the file, in binary modes.
+
+        `Generator[str]` - The chunks of the file, decoded, in text modes.
+
+        ### Raises
+
+        `InvalidFileOperation` - The current file mode does not support read.
+
+        `ValueError` - `size` is not positive.
+        """
+        if self.file_object.readable() is not True:
+            raise InvalidFileOperation(f"InvalidFileOperation: File Mode \"{self.mode}\" does not support read.")
+        if size <= 0:
+            raise ValueError("Chunk size must be positive.")
+        if self.mode == "m":
+            return self.__iter_map(size, index)
+        return self.__iter_chunks(size, index)
+
+
+    def iter_lines(self, size:int = 65536, index:int = None):
+        """
+        Streams the file line by line, like `read_file` with `return_lines`
+        but without holding all of it in memory. Lines keep their line ending.
+
+        ### Parameters
+
+        `size` - The most bytes read from the file at once.
+
+        `index` - Where to start reading from the file. The default
+        is the current position.
+
+        ### Returns
+
+        `Generator[str|bytes]` - The lines of the file.
+
+        ### Raises
+
+        `InvalidFileOperation` - The current file mode does not support read.
+        """
+        return self.__iter_split("\n", True, size, index)
+
+
+    def iter_records(self, delimiter:str|bytes, size:int = 65536, index:int = None):
+        """
+        Streams the file split on a delimiter, without holding all of it in memory.
+        Records do not include the delimiter.
+
+        ### Parameters
+
+        `delimiter` - What the records are separated by. Converted to
+        bytes or a string to match the file mode.
+
+        `size` - The most bytes read from the file at once.
+
+        `index` - Where to start reading from the file. The default
+        is the current position.
+
+        ### Returns
+
+        `Generator[str|bytes]` - The records in the file.
+
+        ### Raises
+
+        `InvalidFileOperation` - The current file mode does not support read.
+
+        `ValueError` - The delimiter is empty.
+        """
+        if len(delimiter) == 0:
+            raise ValueError("Record delimiter can not be empty.")
+        return self.__iter_split(delimiter, False, size, index)
+
+
     def write_file(self, content:str|bytes|list, flush:bool = True, lines=False):
         """
         Writes content to the file.
@@ -416,13 +815,17 @@ class File_Handler:
 
         `int` a return code of 0.
         """
+        if self.mode == "m":
+            self.map_index = index
+            return 0
         self.file_object.seek(index)
         return 0
 
 
     def set_encoding(self, encoding:str):
         """
-        Changes the file object encoding.
+        Changes the file object encoding, keeping the current position.
+        The file is not reopened, only its text layer is replaced.
 
         ### Parameters
 
@@ -432,9 +835,17 @@ class File_Handler:
 
         `int` - A return code of 0.
         """
-        self.file_object.flush()
-        self.file_object.close()
-        self.file_object = open(self.file_location, self.mode, encoding=encoding)
+        self.encoding = encoding
+        # binary files only use the encoding to convert what is written
+        if self.supports_bytes:
+            return 0
+
+        index = self.file_object.tell()
+        self.__unwrap_fd()
+        self.__wrap_fd()
+        # drops anything the file object had read before it was last swapped out
+        self.file_object.seek(0, os.SEEK_END)
+        self.file_object.seek(index)
         return 0
 
 
@@ -479,17 +890,57 @@ class File_Handler:
         self.__check_file_exists()
 
         # shift out file objects
-        self.file_object.flush()
-        self.file_object.close()
-        self.file_object = open(self.file_location, self.mode)
+        self.__close_file()
+        self.__open_file()
 
         return 0
 
 
+    def suspend(self):
+        """
+        Closes the file, remembering its position so `resume` can reopen it
+        where it was. Used to keep the amount of open files down.
+
+        ### Returns
+
+        `int` - A return code of 0.
+        """
+        if self.suspended_at is None:
+            self.suspended_at = self.find_index()
+            self.__close_file()
+        return 0
+
+
+    def resume(self):
+        """
+        Reopens a file closed by `suspend`, in the same mode and at the same
+        position. Files opened with \"w\" are not truncated again.
+
+        ### Returns
+
+        `int` - A return code of 0.
+
+        ### Raises
+
+        `FileNotFoundError` - The file was removed while it was closed.
+        """
+        if self.suspended_at is None:
+            return 0
+        self.__open_file(True)
+        self.goto(self.suspended_at)
+        self.suspended_at = None
+        return 0
+
+
     def change_file_mode(self, new_mode:str):
         """
         Changes the mode of the file object this wrapper points to.
 
+        The file ends up as if it was opened again in the new mode, but
+        where possible the open file descriptor is reused and only the
+        Python file object around it is swapped, reusing the one from the
+        last time the file was in the new mode. That is much cheaper.
+
         ### Parameters
 
         `new_mode` - A string indicating the new mode of the file. 
@@ -499,22 +950,297 @@ class File_Handler:
 
         `int` - A integer returncode of 0.
         """
-        
+        # a file closed by `suspend` has no descriptor to reuse
+        self.resume()
+
         # assign new mode
         self.mode = new_mode
 
-        self.supports_bytes = True if "b" in new_mode else False
+        self.supports_bytes = True if "b" in new_mode or new_mode == "m" else False
+
+        # "x" has to fail on the existing file, like opening it would
+        if "x" in new_mode:
+            self.__close_file()
+            self.__open_file()
+            return 0
 
         # shift out file objects
-        self.file_object.flush()
-        self.file_object.close()
-        self.file_object = open(self.file_location, self.mode)
+        self.__unwrap_fd()
+        self.__reuse_fd()
+        self.__wrap_fd()
+
+        # where opening the file would start, which also drops anything
+        # the file object had read before it was last swapped out
+        self.file_object.seek(0, os.SEEK_END)
+        if "a" not in new_mode and new_mode != "m":
+            self.file_object.seek(0)
         return 0
 
 
     # private methods
 
 
+    def __open_file(self, reopen:bool = False):
+        """
+        Private method that opens the file for the current mode.
+
+        ### Parameters
+
+        `reopen` - Whether the file was already opened in this mode, in which
+        case it is not created or truncated again.
+        """
+        self.fd = self.__open_fd(not reopen)
+        # file objects around the fd by mode and encoding, see `__wrap_fd`
+        self.wrappers:dict[tuple[str, str], io.IOBase] = {}
+        self.__wrap_fd()
+
+
+    def __open_fd(self, create:bool):
+        """
+        Private method that opens a file descriptor with the same effect as
+        opening the file in the current mode. Modes that write open it for
+        reading too when the file allows it, so later mode changes can reuse
+        it. Modes that only read never open it for writing, so a read only
+        handler can't write even where the file would allow it.
+
+        ### Parameters
+
+        `create` - Whether to create or truncate the file if the mode does.
+
+        ### Returns
+
+        `int` - The file descriptor.
+        """
+        # windows only flag, stops the OS translating line endings under python
+        flags = getattr(os, "O_BINARY", 0)
+        if "a" in self.mode:
+            flags |= os.O_APPEND
+        if create and "x" in self.mode:
+            flags |= os.O_CREAT | os.O_EXCL
+        elif create and "w" in self.mode:
+            flags |= os.O_CREAT | os.O_TRUNC
+        elif create and "a" in self.mode:
+            flags |= os.O_CREAT
+
+        self.fd_readable, self.fd_writable = self.__mode_access()
+        if not self.fd_writable:
+            fd = os.open(self.file_location, flags | os.O_RDONLY)
+        elif self.fd_readable:
+            fd = os.open(self.file_location, flags | os.O_RDWR)
+        else:
+            try:
+                fd = os.open(self.file_location, flags | os.O_RDWR)
+                self.fd_readable = True
+            # eg a write only file, or anything else that only allows what the
+            # mode needs. if that fails too, the error is the one to raise
+            except OSError:
+                fd = os.open(self.file_location, flags | os.O_WRONLY)
+        self.fd_append = "a" in self.mode
+        return fd
+
+
+    def __mode_access(self):
+        """
+        Private method that returns whether the current mode reads, and whether it writes.
+        """
+        mode = self.mode
+        return "r" in mode or "+" in mode or mode == "m", "w" in mode or "a" in mode or "x" in mode or "+" in mode
+
+
+    def __reuse_fd(self):
+        """
+        Private method that makes the open file descriptor behave as if it was
+        just opened in the current mode, or reopens it if it can not.
+        """
+        reads, writes = self.__mode_access()
+        append = "a" in self.mode
+        if reads and not self.fd_readable or writes and not self.fd_writable or append != self.fd_append and fcntl is None:
+            self.__close_file()
+            self.__open_file()
+            return
+
+        if append != self.fd_append:
+            flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+            fcntl.fcntl(self.fd, fcntl.F_SETFL, flags | os.O_APPEND if append else flags & ~os.O_APPEND)
+            self.fd_append = append
+        if "w" in self.mode:
+            os.ftruncate(self.fd, 0)
+
+
+    def __wrap_fd(self):
+        """
+        Private method that sets the file object for the current mode around
+        the open file descriptor, and maps it into memory for mode "m".
+
+        File objects are kept once created and reused when the mode and encoding
+        come back round, since creating them is most of the cost of a mode change.
+        They all share the file descriptor and its position, so a reused one
+        has to be seeked before use to drop what it had buffered.
+        """
+        mode = "rb" if self.mode == "m" else self.mode
+        encoding = None if self.supports_bytes else self.encoding
+        # closed if it was exposed and closed from outside
+        if (mode, encoding) not in self.wrappers or self.wrappers[mode, encoding].closed:
+            self.wrappers[mode, encoding] = open(self.fd, mode, encoding=encoding, closefd=False)
+        self.file_object = self.wrappers[mode, encoding]
+
+        if self.mode != "m":
+            return
+
+        # empty files can not be mapped, but there is nothing to read from them anyway
+        if os.fstat(self.fd).st_size == 0:
+            self.memory_map = b""
+        else:
+            self.memory_map = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+        self.memory = memoryview(self.memory_map)
+        self.map_index = 0
+
+
+    def __unwrap_fd(self):
+        """
+        Private method that flushes the file object and closes its memory map
+        if it has one, so another file object can take over the file descriptor.
+        """
+        if not self.file_object.closed:
+            self.file_object.flush()
+        if hasattr(self, "memory_map"):
+            self.memory.release()
+            try:
+                if isinstance(self.memory_map, mmap.mmap):
+                    self.memory_map.close()
+            except BufferError:
+                # views handed out by `view` are still in use, the map
+                # is closed once the last of them is garbage collected
+                pass
+            del self.memory_map, self.memory, self.map_index
+
+
+    def __close_file(self):
+        """
+        Private method that flushes and closes the file object and its file descriptor.
+        """
+        # already closed by `suspend`, or never opened
+        if getattr(self, "fd", None) is None:
+            self.file_object.close()
+            return
+        self.__unwrap_fd()
+        for file_object in self.wrappers.values():
+            file_object.close()
+        self.wrappers.clear()
+        os.close(self.fd)
+        self.fd = None
+
+
+    def __read_map(self, len_:int, return_lines:bool):
+        """
+        Private method behind `read_file` for memory mapped files. Works like
+        reading a file opened with \"rb\", without any system calls.
+        """
+        start = self.map_index
+
+        if not return_lines:
+            end = len(self.memory_map) if len_ == 0 else start + len_
+            # like a file, reading past the end leaves the position where it was
+            self.map_index = max(start, min(end, len(self.memory_map)))
+            return self.memory_map[start:end]
+
+        # like `readlines`, stop once the lines add up to at least `len_`
+        lines:list[bytes] = []
+        while start < len(self.memory_map) and (len_ == 0 or start - self.map_index < len_):
+            end = self.memory_map.find(b"\n", start) + 1 or len(self.memory_map)
+            lines.append(self.memory_map[start:end])
+            start = end
+        self.map_index = start
+        return lines
+
+
+    def __iter_map(self, size:int, index:int = None):
+        """
+        Private generator behind `iter_chunks` for memory mapped files,
+        which yields views of the map rather than reading into a buffer.
+        """
+        start = self.map_index if index is None else index
+        while start < len(self.memory_map):
+            self.map_index = min(start + size, len(self.memory_map))
+            yield self.memory[start:self.map_index]
+            start = self.map_index
+
+
+    def __split_map(self, delimiter:bytes, keep_delimiter:bool, index:int = None):
+        """
+        Private generator behind `iter_lines` and `iter_records` for memory
+        mapped files, which finds the delimiters in the map directly.
+        """
+        start = self.map_index if index is None else index
+        while start < len(self.memory_map):
+            end = self.memory_map.find(delimiter, start)
+            next_start = len(self.memory_map) if end == -1 else end + len(delimiter)
+            if end == -1 or keep_delimiter:
+                end = next_start
+            self.map_index = next_start
+            yield self.memory_map[start:end]
+            start = next_start
+
+
+    def __iter_chunks(self, size:int, index:int = None):
+        """
+        Private generator behind `iter_chunks`, so its checks run when it is called.
+        """
+        # text positions are opaque cookies from `tell`, not byte offsets, so
+        # text files are read through their own text layer. only binary
+        # files can be read into a reused buffer
+        if not self.supports_bytes:
+            if index is not None:
+                self.file_object.seek(index)
+            while chunk := self.file_object.read(size):
+                yield chunk
+            return
+
+        self.file_object.flush()
+        if index is not None:
+            self.file_object.seek(index)
+
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        while read := self.file_object.readinto(buffer):
+            yield view[:read]
+
+
+    def __iter_split(self, delimiter:str|bytes, keep_delimiter:bool, size:int, index:int = None):
+        """
+        Private method behind `iter_lines` and `iter_records`, which
+        splits the chunks of the file on a delimiter.
+        """
+        if isinstance(delimiter, str) and self.supports_bytes:
+            delimiter = bytes(delimiter, self.encoding)
+        elif isinstance(delimiter, bytes) and not self.supports_bytes:
+            delimiter = str(delimiter, self.encoding)
+
+        if self.mode == "m":
+            return self.__split_map(delimiter, keep_delimiter, index)
+        return self.__split_chunks(self.iter_chunks(size, index), delimiter, keep_delimiter)
+
+
+    @staticmethod
+    def __split_chunks(chunks, delimiter:str|bytes, keep_delimiter:bool):
+        """
+        Private generator that splits a stream of chunks on a delimiter.
+        """
+        # whatever is left of the previous chunks, which may end in part of a record
+        pending = delimiter[:0]
+        for chunk in chunks:
+            pending += chunk
+            start = 0
+            # a delimiter split across chunks is only found once its last chunk is added
+            while (end := pending.find(delimiter, start)) != -1:
+                yield pending[start:end + len(delimiter) if keep_delimiter else end]
+                start = end + len(delimiter)
+            pending = pending[start:]
+
+        if pending:
+            yield pending
+
+
     def __check_file_exists(self):
         """
         Private function that checks if a given file path exists.
@@ -566,8 +1292,7 @@ class File_Handler:
         # that will raise an UnraisableExceptionWarning and spit a traceback to the
         # console, which we don't want to do.
         if hasattr(self, "file_object"):
-            self.file_object.flush()
-            self.file_object.close()
+            self.__close_file()
 
 
 class Inventory_Manager:
@@ -970,7 +1695,10 @@ def main():
     output_modes = ["w+"]*3
     output_ids = [i for i in range(0, 3)]
 
-    system_file_manager.open_file_list(output_files, output_modes, output_ids)
+    report = system_file_manager.open_file_list(output_files, output_modes, output_ids)
+    for error in report.values():
+        if isinstance(error, Exception):
+            raise error
 
     # main program
     base(inventory_manager, system_file_manager)
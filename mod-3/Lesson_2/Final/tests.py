@@ -7,7 +7,7 @@ Testing file. Ran with pytest.
 
 
 import os
-from main import File_Handler, File_Manager, Inventory_Manager
+from main import File_Handler, File_Manager, Inventory_Manager, InvalidFileOperation
 
 
 test_file_name = "./TEST_FILE.txt"
@@ -177,6 +177,117 @@ class TestClass_File_Handler:
         pass
 
 
+    def test_memory_map(self):
+        """
+        Tests that the memory mapped mode reads like \"rb\", and that
+        `view` and `find` work on the mapped file.
+        """
+        data = ["Hello\n", "World!\n", "Goodbye"]
+        File_Handler(test_file_name, "w").write_file(data, True, True)
+
+        file_handler = File_Handler(test_file_name, "m")
+        bytes_handler = File_Handler(test_file_name, "rb")
+        assert file_handler.read_file() == bytes_handler.read_file(), "Memory mapped read discrepancy."
+        assert file_handler.read_file(5, index=6) == b"World", "Memory mapped random access discrepancy."
+        assert file_handler.find_index() == 11, "Memory mapped position discrepancy."
+        assert file_handler.read_file(0, True, 0) == bytes_handler.read_file(0, True, 0), "Memory mapped readlines discrepancy."
+        assert list(file_handler.iter_lines(index=0)) == [bytes(line, "utf-8") for line in data], "Memory mapped line iteration discrepancy."
+
+        index = file_handler.find("Goodbye")
+        assert index == 13, "Memory mapped find discrepancy."
+        assert file_handler.find(b"Hello", 1) == -1, "Memory mapped find found content before its start."
+        view = file_handler.view(index, index + 4)
+        assert isinstance(view, memoryview) and view == b"Good", "Memory mapped view discrepancy."
+
+        with pytest.raises(InvalidFileOperation):
+            file_handler.write_file("Hello")
+
+        # views stay usable after the file stops being mapped
+        file_handler.change_file_mode("r")
+        assert view == b"Good", "View discrepancy after changing modes."
+        with pytest.raises(InvalidFileOperation):
+            file_handler.view()
+        del view
+
+        os.remove(test_file_name)
+
+
+    def test_mode_change_reuses_file(self):
+        """
+        Tests that changing modes and encodings keeps the same open file,
+        while still behaving like the file was opened again.
+        """
+        file_handler = File_Handler(test_file_name, "w+")
+        file_handler.write_file("héllo")
+        file_descriptor = file_handler.expose_file_object().fileno()
+
+        file_handler.change_file_mode("r")
+        assert file_handler.read_file() == "héllo", "Read discrepancy after changing modes."
+        file_handler.change_file_mode("a")
+        file_handler.write_file(" world")
+        file_handler.change_file_mode("rb")
+        assert file_handler.read_file() == bytes("héllo world", "utf-8"), "Append discrepancy after changing modes."
+
+        # switching back to a mode used before must not see stale buffered data
+        file_handler.change_file_mode("w")
+        file_handler.write_file("bye")
+        file_handler.change_file_mode("r")
+        assert file_handler.read_file() == "bye", "Stale read after changing modes."
+
+        file_handler.change_file_mode("r")
+        file_handler.set_encoding("latin-1")
+        assert file_handler.read_file(2) == "by", "Read discrepancy after changing encoding."
+        file_handler.set_encoding("utf-8")
+        assert file_handler.read_file() == "e", "Position lost after changing encoding."
+
+        assert file_handler.expose_file_object().fileno() == file_descriptor, "File reopened when changing modes."
+        del file_handler
+        os.remove(test_file_name)
+
+
+    def test_read_mode_is_read_only(self):
+        """
+        Tests that read modes never open the file for writing, even when
+        the file allows it, and that changing to a write mode still works.
+        """
+        File_Handler(test_file_name, "w").write_file("hello")
+        file_handler = File_Handler(test_file_name, "r")
+        # not even through the file descriptor
+        with pytest.raises(OSError):
+            os.write(file_handler.expose_file_object().fileno(), b"x")
+
+        file_handler.change_file_mode("a")
+        file_handler.write_file(" world")
+        file_handler.change_file_mode("r")
+        assert file_handler.read_file() == "hello world", "Write discrepancy after changing from a read mode."
+        del file_handler
+        os.remove(test_file_name)
+
+
+    def test_iter_chunks_resume(self):
+        """
+        Tests that streaming picks up where reading stopped, in encodings
+        where text positions aren't byte offsets.
+        """
+        content = "Héllo\nWörld\n" * 20
+        for encoding in ["utf-8", "utf-16"]:
+            with open(test_file_name, "w", encoding=encoding, newline="") as file:
+                file.write(content)
+
+            file_handler = File_Handler(test_file_name, "r", encoding)
+            assert file_handler.read_file(7) == content[:7]
+            assert "".join(file_handler.iter_chunks(5)) == content[7:], f"Resumed read discrepancy with {encoding}."
+            assert file_handler.read_file() == "", "The position must be left after the last chunk."
+
+            file_handler.goto(0)
+            file_handler.read_file(13)
+            index = file_handler.find_index()
+            assert "".join(file_handler.iter_chunks(4, 0)) == content
+            assert "".join(file_handler.iter_chunks(4, index)) == content[13:], f"Indexed read discrepancy with {encoding}."
+            del file_handler
+        os.remove(test_file_name)
+
+
     def test_cleanup(self):
         """
         Cleans up resultant test files.
@@ -184,4 +295,176 @@ class TestClass_File_Handler:
         if os.path.exists(test_file_name):
             os.remove(test_file_name)
         elif os.path.exists(test_file_two):
-            os.remove(test_file_two)
\ No newline at end of file
+            os.remove(test_file_two)
+
+class TestClass_File_Manager:
+    """
+    Testing class for the `File_Manager` class.
+    """
+
+
+    def test_write_to_file_list(self):
+        """
+        Tests that writing a list of files writes every file
+        and registers them under their ids.
+        """
+        file_names = [f"./TEST_FILE_LIST_{i}.txt" for i in range(20)]
+        content = [f"File {i}" for i in range(20)]
+        # content given as a list is written as lines
+        content[5] = ["Hello\n", "World!"]
+
+        file_manager = File_Manager(int)
+        report = file_manager.write_to_file_list(content, file_names, list(range(20)), "w+")
+
+        assert report == {i: 0 for i in range(20)}, "Write report discrepancy."
+        for i, file_name in enumerate(file_names):
+            file_manager.change_file_mode(i, "r")
+            expected = "".join(content[i]) if isinstance(content[i], list) else content[i]
+            assert file_manager.read_file(i) == expected, f"Write discrepancy in {file_name}."
+            os.remove(file_name)
+
+
+    def test_file_list_errors(self):
+        """
+        Tests that a file failing to open is reported without stopping
+        the other files, and that bad parameters raise before anything is opened.
+        """
+        File_Handler(test_file_name, "w").write_file("Hello")
+
+        file_manager = File_Manager(int)
+        report = file_manager.open_file_list([test_file_name, "./NOT_A_FILE.txt"], ["r", "r"], [0, 1])
+
+        assert report[0] == 0, "Existing file not opened."
+        assert isinstance(report[1], FileNotFoundError), "Missing file not reported."
+        assert file_manager.read_file(0) == "Hello", "Read discrepancy after opening a file list."
+        with pytest.raises(KeyError):
+            file_manager.read_file(1)
+
+        with pytest.raises(ValueError):
+            file_manager.write_to_file_list(["Hello"], [test_file_two, test_file_two], [2, 3])
+        with pytest.raises(TypeError):
+            file_manager.write_to_file_list(["Hello"], [test_file_two], ["2"])
+        assert not os.path.exists(test_file_two), "File written despite invalid parameters."
+
+        os.remove(test_file_name)
+
+
+    def test_iter_file(self):
+        """
+        Tests that streaming a file in chunks, lines and records
+        matches reading it all at once, in text and binary modes.
+        """
+        data = ["Hello\n", "World!\n", "é" * 50 + "\n", "Goodbye"]
+        File_Handler(test_file_name, "w").write_file(data, True, True)
+
+        file_manager = File_Manager(int)
+        file_manager.open_file_list([test_file_name] * 2, ["r", "rb"], [0, 1])
+        content = file_manager.read_file(0)
+        content_bytes = file_manager.read_file(1)
+
+        # small chunks so lines and characters are split between them
+        assert "".join(file_manager.iter_chunks(0, 7, 0)) == content, "Chunked read discrepancy."
+        assert b"".join(bytes(chunk) for chunk in file_manager.iter_chunks(1, 7, 0)) == content_bytes, "Chunked bytes read discrepancy."
+        assert list(file_manager.iter_lines(0, 7, 0)) == data, "Line iteration discrepancy."
+        assert list(file_manager.iter_lines(1, 7, 0)) == content_bytes.splitlines(True), "Bytes line iteration discrepancy."
+        assert list(file_manager.iter_records(1, "o", 3, 0)) == content_bytes.split(b"o"), "Record iteration discrepancy."
+
+        with pytest.raises(ValueError):
+            file_manager.iter_records(0, "")
+
+        os.remove(test_file_name)
+
+
+    def test_open_file_limit(self):
+        """
+        Tests that a manager with `max_open_files` keeps no more files open,
+        and reopens closed files at the same position without truncating them.
+        """
+        file_names = [f"./TEST_FILE_LIST_{i}.txt" for i in range(10)]
+
+        file_manager = File_Manager(int, 3)
+        file_manager.write_to_file_list(["Hello\n"] * 10, file_names, list(range(10)), "w+")
+        assert file_manager.pool_stats()["open_files"] == 0, "Files left open after writing a file list."
+
+        for i in range(10):
+            file_manager.write_to_file(i, "World!")
+            assert file_manager.pool_stats()["open_files"] <= 3, "Too many files open."
+
+        # position and write mode survive being closed, and the file is not truncated
+        for i in range(10):
+            assert file_manager.read_file(i, index=0) == "Hello\nWorld!", "Read discrepancy after reopening."
+        assert file_manager.read_file(0, 5, index=0) == "Hello"
+        for i in range(1, 4):
+            file_manager.read_file(i, 1)
+        assert file_manager.read_file(0, 1) == "\n", "Position lost after reopening."
+        assert file_manager.read_file(0) == "World!", "Read discrepancy on an open file."
+
+        stats = file_manager.pool_stats()
+        assert stats["hits"] == 1 and stats["misses"] == 25 and stats["evictions"] == 22, "Pool counter discrepancy."
+
+        del file_manager
+        for file_name in file_names:
+            os.remove(file_name)
+
+
+    def test_change_mode_of_closed_file(self):
+        """
+        Tests changing the mode of a file the pool closed to make room.
+        """
+        file_names = [f"./TEST_FILE_LIST_{i}.txt" for i in range(3)]
+
+        file_manager = File_Manager(int, 1)
+        file_manager.write_to_file_list(["Hello"] * 3, file_names, list(range(3)), "w+")
+        file_manager.read_file(0, index=0)
+        file_manager.read_file(1, index=0)
+        evicted = file_manager.file_registry[0]
+        assert evicted.suspended_at is not None, "File was not closed to make room."
+
+        evicted.change_file_mode("r+")
+        assert evicted.suspended_at is None
+        assert evicted.read_file() == "Hello", "Read discrepancy after changing the mode."
+        evicted.change_file_mode("w")
+        evicted.write_file("Bye")
+        evicted.change_file_mode("r")
+        assert file_manager.read_file(0) == "Bye", "Write discrepancy after changing the mode."
+
+        # through the manager the file is reopened and the pool stays in bounds
+        file_manager.read_file(2, index=0)
+        file_manager.change_file_mode(0, "a+")
+        file_manager.write_to_file(0, "!")
+        assert file_manager.read_file(0, index=0) == "Bye!"
+        assert file_manager.pool_stats()["open_files"] <= 1, "Too many files open."
+
+        del file_manager, evicted
+        for file_name in file_names:
+            os.remove(file_name)
+
+
+    def test_failed_replace_keeps_file(self):
+        """
+        Tests that a file whose replacement fails to open stays registered
+        and within the open file limit.
+        """
+        file_names = [f"./TEST_FILE_LIST_{i}.txt" for i in range(4)]
+
+        file_manager = File_Manager(int, 2)
+        file_manager.write_to_file_list(["Hello"] * 4, file_names, list(range(4)), "w+")
+        file_manager.read_file(0, index=0)
+        file_manager.read_file(1, index=0)
+        assert file_manager.pool_stats()["open_files"] == 2
+        replaced = [file_manager.file_registry[i] for i in range(2)]
+
+        # "x" fails on files that exist, so none of them are replaced
+        report = file_manager.open_file_list(file_names[:2], ["x", "x"], [0, 1], max_workers=1)
+        assert all(isinstance(error, FileExistsError) for error in report.values()), "Replacement did not fail."
+        assert file_manager.pool_stats()["open_files"] == 0
+        assert all(file_manager.file_registry[i] is replaced[i] for i in range(2)), "Failed replacement was registered."
+        assert all(file_handler.suspended_at is not None for file_handler in replaced), "Replaced files left open outside the pool."
+
+        for i in range(4):
+            assert file_manager.read_file(i, index=0) == "Hello", "File lost after a failed replacement."
+            assert file_manager.pool_stats()["open_files"] <= 2, "Too many files open."
+
+        del file_manager
+        for file_name in file_names:
+            os.remove(file_name)